@@ -1,6 +1,8 @@
 from abc import ABC, abstractmethod
 
 class BaseAlert(ABC):
+    # seconds a send may block on the network (None: library default); set by alerts.handler.Alerts
+    timeout: float | None = None
 
     @abstractmethod
     def send_msg(self, msg: str, recipient: str, subject: str) -> bool:
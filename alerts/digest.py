@@ -0,0 +1,147 @@
+'''
+Purpose: build alert digests once for every channel
+
+A digest groups many breaches into as few messages as each channel allows:
+- every breach is rendered once per format (plain text, HTML, Discord markdown) from templates compiled at import
+- lines are packed into chunks that fit the channel's size limit (Discord 2000 chars, ntfy 4096 bytes)
+- each chunk becomes one Message; channels send one message per chunk instead of one per breach
+'''
+
+import html
+
+from dataclasses import dataclass, field
+from string import Template
+from typing import Any, Dict, Iterable, List, Sequence, Tuple
+
+DIGEST_TITLE = "Stop-loss Alert!"
+
+# channel -> (limit, unit); None means no limit
+CHANNEL_LIMITS = {
+    'discord': (2000, 'chars'),
+    'push': (4096, 'bytes'),
+    'email': (None, 'chars'),
+}
+
+# red side bar on Discord embeds
+DISCORD_COLOR = 0xE74C3C
+
+# compiled once; substitute() only fills the placeholders
+TEXT_LINE = Template("$ticker ($$$price) has reached stop-loss threshold of $$$stop \n")
+HTML_ROW = Template("<tr><td>$ticker</td><td>$$$price</td><td>$$$stop</td></tr>\n")
+DISCORD_LINE = Template("**$ticker** $$$price (stop $$$stop)\n")
+HTML_PAGE = Template(
+    "<html><body><h3>$title</h3>\n"
+    "<table><tr><th>Ticker</th><th>Price</th><th>Stop-loss</th></tr>\n"
+    "$rows</table></body></html>\n"
+)
+
+
+@dataclass(frozen = True)
+class Breach:
+    ticker: str
+    price: Any
+    stop: Any
+
+
+@dataclass
+class Message:
+    # one message for one channel; html / embed are used by channels that support them
+    text: str
+    html: str | None = None
+    embed: Dict[str, Any] | None = None
+
+
+@dataclass
+class Chunk:
+    message: Message
+    # positions (in the breaches given to DigestBuilder.build) covered by this chunk
+    items: List[int] = field(default_factory = list)
+
+
+def _size(text: str, unit: str) -> int:
+    return len(text.encode('utf-8')) if unit == 'bytes' else len(text)
+
+
+def _truncate(text: str, limit: int, unit: str) -> str:
+    # a single line longer than the limit (never happens with ticker lines, but keeps chunks valid)
+    while _size(text, unit) > limit:
+        text = text[:-2] + "\n"
+    return text
+
+
+class DigestBuilder():
+    '''
+    build(breaches, channels) renders every breach once per format and returns
+    channel -> chunks, each chunk small enough to be sent as one message.
+    Rendered lines are memoized, so the same breach sent to many recipients is formatted once.
+    '''
+
+    def __init__(self, title: str = DIGEST_TITLE) -> None:
+        self.title = title
+        self._lines: Dict[Breach, Tuple[str, str, str]] = {}
+
+    def lines(self, breach: Breach) -> Tuple[str, str, str]:
+        # (plain text, HTML row, Discord markdown)
+        rendered = self._lines.get(breach)
+        if rendered is None:
+            values = {'ticker': breach.ticker, 'price': breach.price, 'stop': breach.stop}
+            escaped = {key: html.escape(str(value)) for key, value in values.items()}
+            rendered = self._lines[breach] = (
+                TEXT_LINE.substitute(values),
+                HTML_ROW.substitute(escaped),
+                DISCORD_LINE.substitute(values),
+            )
+        return rendered
+
+    def _header(self, part: int, parts: int) -> str:
+        return f"{self.title}\n" if parts == 1 else f"{self.title} ({part}/{parts})\n"
+
+    def _pack(self, lines: Sequence[str], budget: int | None, unit: str) -> List[List[int]]:
+        # greedy packing of line positions into groups of at most budget
+        if budget is None:
+            return [list(range(len(lines)))] if lines else []
+        groups: List[List[int]] = []
+        used = budget + 1
+        for pos, line in enumerate(lines):
+            size = _size(line, unit)
+            if used + size > budget:
+                groups.append([])
+                used = 0
+            groups[-1].append(pos)
+            used += size
+        return groups
+
+    def build(self, breaches: Sequence[Breach], channels: Iterable[str]) -> Dict[str, List[Chunk]]:
+        rendered = [self.lines(breach) for breach in breaches]
+        texts = [text for text, _, _ in rendered]
+        digests: Dict[str, List[Chunk]] = {}
+
+        for channel in channels:
+            limit, unit = CHANNEL_LIMITS.get(channel, (None, 'chars'))
+            source = [discord for _, _, discord in rendered] if channel == 'discord' else texts
+            budget = None
+            if limit is not None:
+                # room is left for the longest "(n/m)" header
+                budget = limit - _size(self._header(999, 999), unit)
+                source = [_truncate(line, budget, unit) for line in source]
+            groups = self._pack(source, budget, unit)
+            chunks = []
+            for part, items in enumerate(groups, start = 1):
+                header = self._header(part, len(groups))
+                body = "".join(source[pos] for pos in items)
+                if channel == 'discord':
+                    message = Message(
+                        text = header + body,
+                        embed = {'title': header.strip(), 'description': body, 'color': DISCORD_COLOR},
+                    )
+                elif channel == 'email':
+                    rows = "".join(rendered[pos][1] for pos in items)
+                    message = Message(
+                        text = header + body,
+                        html = HTML_PAGE.substitute(title = html.escape(header.strip()), rows = rows),
+                    )
+                else:
+                    message = Message(text = header + body)
+                chunks.append(Chunk(message, list(items)))
+            digests[channel] = chunks
+        return digests
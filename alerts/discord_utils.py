@@ -1,5 +1,5 @@
-import requests
 import logging
+from alerts import http_client
 from alerts.base import BaseAlert
 
 
@@ -13,22 +13,30 @@ class DiscordAlert(BaseAlert):
         self._destination = webhook_url
         self._configured = True
 
-    def send_msg(self, msg: str, recipient: str | None = None, subject: str | None = None):
+    def _payload(self, msg: str, embed: dict | None):
+        # an embed (alerts.digest) replaces the plain content
+        return {'embeds': [embed]} if embed is not None else {
+            'content': msg
+        }
+
+    def send_msg(self, msg: str, recipient: str | None = None, subject: str | None = None, embed: dict | None = None):
         if not self._configured:
             logger.error('Invalid: not yet configured!')
             return False
-        header = {
-            'content-type': 'application/json',
-        }
 
-        payload = {
-            'content': msg
-        }
-
-        response = requests.post(self._destination, headers = header, json = payload)
+        # rate limits (429) are retried after Retry-After by alerts.http_client
+        response = http_client.post(self._destination, json = self._payload(msg, embed), timeout = self.timeout)
 
         if response.status_code == 204:
             return True
         else:
             return False
 
+    async def send_msg_async(self, msg: str, recipient: str | None = None, subject: str | None = None, embed: dict | None = None):
+        # send_msg on the event loop (alerts.http_client.async_post)
+        if not self._configured:
+            logger.error('Invalid: not yet configured!')
+            return False
+
+        response = await http_client.async_post(self._destination, json = self._payload(msg, embed), timeout = self.timeout)
+        return response.status == 204
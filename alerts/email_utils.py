@@ -8,8 +8,12 @@ Only supports gmail or outlook
 import smtplib
 import logging
 import ssl
+import threading
+import time
 
+from dataclasses import dataclass
 from email.message import EmailMessage
+from typing import Dict, Iterable, List, Tuple
 from alerts.base import BaseAlert
 
 logger = logging.getLogger(__name__)
@@ -25,11 +29,117 @@ DEFAULT_SMTP_SETTINGS = {
     }
 }
 
+# authenticated connections kept per (host, port, username)
+SMTP_POOL_SIZE = 2
+# idle connections older than this are closed instead of reused (servers drop them after a few minutes)
+SMTP_IDLE_TIMEOUT = 60.0
+
+
+@dataclass
+class _PooledConnection:
+    server: smtplib.SMTP
+    last_used: float
+
+
+class SMTPPool():
+    '''
+    Small pool of logged-in SMTP sessions for one account.
+    acquire() hands out an idle session after a NOOP health check, or opens a new one
+    (connect + STARTTLS + login); release() returns it for the next send.
+    '''
+
+    def __init__(self, host, port, username, password, size: int = SMTP_POOL_SIZE, idle_timeout: float = SMTP_IDLE_TIMEOUT) -> None:
+        self._host = host
+        self._port = port
+        self._username = username
+        self._password = password
+        self.size = size
+        self.idle_timeout = idle_timeout
+        self._idle: List[_PooledConnection] = []
+        self._lock = threading.Lock()
+        # one SSL context for every handshake
+        self._context = ssl.create_default_context()
+
+    def _connect(self, timeout: float | None) -> smtplib.SMTP:
+        options = {} if timeout is None else {'timeout': timeout}
+        server = smtplib.SMTP(self._host, self._port, **options)
+        try:
+            server.starttls(context = self._context)
+            server.login(self._username, self._password)
+        except Exception:
+            _quit(server)
+            raise
+        return server
+
+    def acquire(self, timeout: float | None = None) -> smtplib.SMTP:
+        while True:
+            with self._lock:
+                pooled = self._idle.pop() if self._idle else None
+            if pooled is None:
+                return self._connect(timeout)
+
+            if time.monotonic() - pooled.last_used > self.idle_timeout:
+                _quit(pooled.server)
+                continue
+            try:
+                if pooled.server.noop()[0] == 250:
+                    return pooled.server
+            except Exception:
+                pass
+            # dropped by the server: try the next idle one
+            _quit(pooled.server)
+
+    def release(self, server: smtplib.SMTP, healthy: bool = True) -> None:
+        if healthy:
+            with self._lock:
+                if len(self._idle) < self.size:
+                    self._idle.append(_PooledConnection(server, time.monotonic()))
+                    return
+        _quit(server)
+
+    def close(self) -> None:
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for pooled in idle:
+            _quit(pooled.server)
+
+
+def _quit(server: smtplib.SMTP) -> None:
+    try:
+        server.quit()
+    except Exception:
+        pass
+
+
+_pools: Dict[Tuple, SMTPPool] = {}
+_pools_lock = threading.Lock()
+
+def get_smtp_pool(host, port, username, password) -> SMTPPool:
+    # pools are shared by every EmailAlert for the same account
+    key = (host, port, username)
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None or pool._password != password:
+            if pool is not None:
+                pool.close()
+            pool = _pools[key] = SMTPPool(host, port, username, password)
+        return pool
+
+def close_smtp_pools() -> None:
+    # call on shutdown
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.close()
+
+
 class EmailAlert(BaseAlert):
     '''
     Class to handle email alerts through smtp servers
     Forgoes the need to get OAuth2 authentification from google workspace
     User provides own email + smtp server
+    Sessions are pooled (get_smtp_pool) so repeated alerts skip the connect/STARTTLS/login handshake
     '''
 
     def __init__(self) -> None:
@@ -64,11 +174,7 @@ class EmailAlert(BaseAlert):
             port=provider_settings["port"],
         )
 
-    def send_msg(self, msg: str, recipient: str, subject: str):
-        if not self._configured:
-            logger.error('Invalid: not yet configured!')
-            return False
-    
+    def _build(self, msg: str, recipient: str, subject: str, html: str | None = None) -> EmailMessage:
         mail = EmailMessage()
 
         # set headers
@@ -76,25 +182,54 @@ class EmailAlert(BaseAlert):
         mail['From'] = self._username 
         mail['Subject'] = subject
         
-        # set content
+        # set content: plain text, with an HTML alternative when given (alerts.digest)
         mail.set_content(msg)
+        if html is not None:
+            mail.add_alternative(html, subtype = 'html')
+        return mail
 
-        # TODO: consider adding some visuals to notification email
-
+    def send_msg(self, msg: str, recipient: str, subject: str, html: str | None = None):
+        return self.send_batch([(msg, recipient, subject, html)])[0]
 
-        context = ssl.create_default_context()
+    def send_batch(self, messages: Iterable[Tuple]) -> List[bool]:
+        '''
+        sends (msg, recipient, subject[, html]) tuples over one pooled SMTP session
+        returns whether each message was sent
+        '''
+        messages = list(messages)
+        if not self._configured:
+            logger.error('Invalid: not yet configured!')
+            return [False] * len(messages)
 
+        pool = get_smtp_pool(self._host, self._port, self._username, self._password)
+        results = []
+        server = None
         try:
-            with smtplib.SMTP(self._host, self._port) as server:
-                server.starttls(context = context)
-                server.login(self._username, self._password)
-                server.send_message(mail)
-            return True
-    
+            for message in messages:
+                mail = self._build(*message)
+                try:
+                    if server is None:
+                        server = pool.acquire(self.timeout)
+                    server.send_message(mail)
+                except smtplib.SMTPServerDisconnected:
+                    # pooled session went stale between the health check and the send: reconnect once
+                    _quit(server)
+                    server = None
+                    server = pool.acquire(self.timeout)
+                    server.send_message(mail)
+                except (smtplib.SMTPRecipientsRefused, smtplib.SMTPDataError) as e:
+                    # rejected message: the session is still usable for the rest of the batch
+                    logger.error(f'Error Occurred: {e}')
+                    results.append(False)
+                    continue
+                results.append(True)
+
         except Exception as e: 
             logger.error(f'Error Occurred: {e}')
-            return False
-
-        
-
+            if server is not None:
+                pool.release(server, healthy = False)
+            return results + [False] * (len(messages) - len(results))
 
+        if server is not None:
+            pool.release(server)
+        return results
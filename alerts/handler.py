@@ -3,14 +3,37 @@ Objective:
 Create a class to handle all forms of alerts with a simple interface
 
 Methods:
-send_msgs()
+send_msg() / send_msg_async(): fan out to every configured channel concurrently
 '''
 
-from dataclasses import dataclass
-from typing import Optional
+import asyncio
+import copy
+import logging
+import time
+
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeout
+from dataclasses import dataclass, field, replace
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
 
 from alerts import get_alert_channel
 from alerts import EmailAlert, DiscordAlert, NTFYAlert
+from alerts.digest import Message
+from alerts.email_utils import DEFAULT_SMTP_SETTINGS
+from alerts.push_utils import NTFY_BASE_URL
+
+logger = logging.getLogger(__name__)
+
+# seconds each channel may take before it is reported as timed out;
+# push notifications matter most in a crash so they get the shortest budget
+DEFAULT_TIMEOUTS = {
+    'discord': 10.0,
+    'push': 10.0,
+    'email': 30.0,
+}
+
+# channel sends are blocking (requests / smtplib): run them on a shared pool so one slow channel
+# never holds back the others; a timed out send keeps its worker until the socket timeout fires
+_dispatch_pool = ThreadPoolExecutor(max_workers = 8, thread_name_prefix = 'alert')
 
 
 @dataclass
@@ -24,10 +47,42 @@ class AlertConfig:
 
     # Ntfy
     ntfy_topic: Optional[str] = None
+    ntfy_base_url: str = NTFY_BASE_URL
 
     # Discord
     discord_webhook_url: Optional[str] = None
 
+    # per-channel timeouts in seconds (see DEFAULT_TIMEOUTS)
+    timeouts: Dict[str, float] = field(default_factory = lambda: dict(DEFAULT_TIMEOUTS))
+
+    @classmethod
+    def from_settings(cls, settings) -> "AlertConfig":
+        # channels configured through .env (utils.env_vars.Settings)
+        smtp = DEFAULT_SMTP_SETTINGS.get((settings.email_provider or '').lower(), {})
+        return cls(
+            email_provider = settings.email_provider,
+            email_username = settings.bot_email,
+            email_password = settings.email_password,
+            email_host = smtp.get('host'),
+            email_port = smtp.get('port', 587),
+            ntfy_topic = settings.ntfy_channel,
+            ntfy_base_url = settings.ntfy_base_url,
+            discord_webhook_url = settings.discord_webhook_url,
+        )
+
+    def for_user(self, email: str | None, ntfy_topic: str | None, discord_webhook_url: str | None) -> "AlertConfig":
+        # a user's destinations on top of this config: same bot email account, ntfy server and timeouts
+        return replace(
+            self,
+            email_provider = self.email_provider if email else None,
+            ntfy_topic = ntfy_topic,
+            discord_webhook_url = discord_webhook_url,
+            timeouts = dict(self.timeouts),
+        )
+
+    def timeout_for(self, channel: str) -> float:
+        return self.timeouts.get(channel, DEFAULT_TIMEOUTS.get(channel, 15.0))
+
     @property
     def email_valid(self):
         return all([
@@ -45,6 +100,25 @@ class AlertConfig:
     @property
     def discord_valid(self):
         return self.discord_webhook_url is not None
+
+    @property
+    def any_valid(self):
+        return self.email_valid or self.ntfy_valid or self.discord_valid
+
+    @property
+    def channels(self) -> List[str]:
+        # names of the configured channels
+        valid = {'discord': self.discord_valid, 'email': self.email_valid, 'push': self.ntfy_valid}
+        return [channel for channel, ok in valid.items() if ok]
+
+
+@dataclass
+class ChannelResult:
+    channel: str
+    ok: bool
+    # None when sent; otherwise 'timeout', 'failed' or the exception text
+    error: Optional[str] = None
+    elapsed: float = 0.0
     
     
 class Alerts:
@@ -54,31 +128,132 @@ class Alerts:
         self.push: NTFYAlert = get_alert_channel('push')
         self.config: AlertConfig | None = None
 
-    def send_msg(self, msg, recipient, subject):
-        '''
-        message sending handler: assumes that configs have been set
-        configures and sends message for each valid channel
-        '''
+    def _channel_sends(self, messages: Dict[str, str | Message], recipient, subject) -> List[Tuple[str, Callable[[], bool], Callable[[], Awaitable[bool]] | None]]:
+        # configure each valid channel that has a message
+        # returns (channel, send, async send or None when the channel only has a blocking send)
         assert(self.config is not None)
         cfg = self.config
+        sends = []
+        messages = {channel: Message(msg) if isinstance(msg, str) else msg for channel, msg in messages.items()}
 
-        if cfg.discord_valid:
+        if cfg.discord_valid and 'discord' in messages:
+            msg = messages['discord']
             self.discord.configure(cfg.discord_webhook_url)
-            self.discord.send_msg(msg, recipient, subject)
-        
-        if cfg.email_valid:
+            self.discord.timeout = cfg.timeout_for('discord')
+            sends.append((
+                'discord',
+                lambda msg = msg: self.discord.send_msg(msg.text, recipient, subject, embed = msg.embed),
+                lambda msg = msg: self.discord.send_msg_async(msg.text, recipient, subject, embed = msg.embed),
+            ))
+
+        if cfg.email_valid and 'email' in messages:
+            msg = messages['email']
             self.email.configure(
                 cfg.email_username, 
                 cfg.email_password, 
                 cfg.email_host, 
                 cfg.email_port
             )
+            self.email.timeout = cfg.timeout_for('email')
+            # smtplib is blocking: runs on the dispatch pool in both modes
+            sends.append(('email', lambda msg = msg: self.email.send_msg(msg.text, recipient, subject, html = msg.html), None))
+
+        if cfg.ntfy_valid and 'push' in messages:
+            msg = messages['push']
+            self.push.configure(cfg.ntfy_topic, cfg.ntfy_base_url)
+            self.push.timeout = cfg.timeout_for('push')
+            sends.append((
+                'push',
+                lambda msg = msg: self.push.send_msg(msg.text, recipient, subject),
+                lambda msg = msg: self.push.send_msg_async(msg.text, recipient, subject),
+            ))
+
+        return sends
+
+    def _result(self, channel: str, ok: bool, error: str | None, start: float) -> ChannelResult:
+        if not ok:
+            logger.warning(f"Alert via {channel} failed: {error}")
+        return ChannelResult(channel, ok, error, time.monotonic() - start)
+
+    def _run(self, channel: str, send: Callable[[], bool]) -> ChannelResult:
+        start = time.monotonic()
+        try:
+            ok = bool(send())
+            error = None if ok else 'failed'
+        except Exception as e:
+            ok, error = False, repr(e)
+        return self._result(channel, ok, error, start)
+
+    async def _run_async(self, channel: str, send: Callable[[], Awaitable[bool]]) -> ChannelResult:
+        start = time.monotonic()
+        try:
+            ok = bool(await send())
+            error = None if ok else 'failed'
+        except Exception as e:
+            ok, error = False, repr(e)
+        return self._result(channel, ok, error, start)
+
+    def send_msg(self, msg, recipient, subject) -> Dict[str, ChannelResult]:
+        '''
+        message sending handler: assumes that configs have been set
+        sends to every valid channel concurrently; each channel is given its own timeout
+        returns channel -> ChannelResult
+        '''
+        assert(self.config is not None)
+        return self.send_each(dict.fromkeys(self.config.channels, msg), recipient, subject)
+
+    def send_each(self, messages: Dict[str, str | Message], recipient, subject) -> Dict[str, ChannelResult]:
+        # like send_msg with a message per channel (channel -> str or alerts.digest.Message); unconfigured channels are skipped
+        start = time.monotonic()
+        futures: Dict[str, Future] = {
+            channel: _dispatch_pool.submit(self._run, channel, send)
+            for channel, send, _ in self._channel_sends(messages, recipient, subject)
+        }
+
+        results: Dict[str, ChannelResult] = {}
+        for channel, future in futures.items():
+            # deadlines are measured from dispatch, so waiting on one channel never extends another's
+            remaining = self.config.timeout_for(channel) - (time.monotonic() - start)
+            try:
+                results[channel] = future.result(timeout = max(remaining, 0))
+            except FutureTimeout:
+                logger.warning(f"Alert via {channel} timed out")
+                results[channel] = ChannelResult(channel, False, 'timeout', time.monotonic() - start)
+        return results
+
+    async def send_msg_async(self, msg, recipient, subject) -> Dict[str, ChannelResult]:
+        # event-loop variant of send_msg: the loop is never blocked by a channel
+        assert(self.config is not None)
+        return await self.send_each_async(dict.fromkeys(self.config.channels, msg), recipient, subject)
+
+    async def send_each_async(self, messages: Dict[str, str | Message], recipient, subject) -> Dict[str, ChannelResult]:
+        loop = asyncio.get_running_loop()
+        sends = self._channel_sends(messages, recipient, subject)
+
+        async def run(channel: str, send: Callable[[], bool], async_send) -> ChannelResult:
+            start = time.monotonic()
+            # webhook channels send on the loop (pooled aiohttp session); blocking ones on the dispatch pool
+            pending = self._run_async(channel, async_send) if async_send is not None else \
+                loop.run_in_executor(_dispatch_pool, self._run, channel, send)
+            try:
+                return await asyncio.wait_for(pending, self.config.timeout_for(channel))
+            except asyncio.TimeoutError:
+                logger.warning(f"Alert via {channel} timed out")
+                return ChannelResult(channel, False, 'timeout', time.monotonic() - start)
+
+        results = await asyncio.gather(*(run(*send) for send in sends))
+        return {result.channel: result for result in results}
 
-            self.email.send_msg(msg, recipient, subject)
-        
-        if cfg.ntfy_valid:
-            self.push.configure(cfg.ntfy_topic)
-            self.push.send_msg(msg, recipient, subject)
+    def with_config(self, config: AlertConfig) -> "Alerts":
+        # sends to other destinations, e.g. AlertConfig.for_user
+        # channels are configured per send and their queued sends read the destination later, so each config gets
+        # its own channel objects; only the pooled connections (alerts.http_client, SMTP pools) are shared
+        alerts = copy.copy(self)
+        alerts.email = copy.copy(self.email)
+        alerts.discord = copy.copy(self.discord)
+        alerts.push = copy.copy(self.push)
+        alerts.config = config
+        return alerts
 
     def set_config(self, config: AlertConfig):
         '''
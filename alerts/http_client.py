@@ -0,0 +1,145 @@
+'''
+Purpose: shared HTTP clients for the webhook channels (Discord, ntfy)
+
+- one requests.Session with a keep-alive connection pool for sync sends
+- one aiohttp.ClientSession per event loop for async sends
+- every request has a timeout; 429 responses are retried after Retry-After (Discord rate limits)
+'''
+
+import aiohttp
+import asyncio
+import logging
+import threading
+import time
+import requests
+
+from dataclasses import dataclass
+from requests.adapters import HTTPAdapter
+from typing import Any, Dict, Mapping
+
+logger = logging.getLogger(__name__)
+
+# seconds per request when the caller gives no timeout
+DEFAULT_TIMEOUT = 10.0
+# 429 retries per send; a Retry-After longer than the caller's timeout is not waited for
+MAX_RATE_LIMIT_RETRIES = 2
+POOL_SIZE = 8
+
+_session: requests.Session | None = None
+_session_lock = threading.Lock()
+# loop -> session: aiohttp sessions are bound to the loop they were created on
+_async_sessions: Dict[asyncio.AbstractEventLoop, aiohttp.ClientSession] = {}
+
+
+@dataclass
+class HTTPResult:
+    status: int
+    headers: Mapping[str, str]
+    body: Any = None
+
+    @property
+    def ok(self) -> bool:
+        return self.status < 400
+
+
+def http_session() -> requests.Session:
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+            adapter = HTTPAdapter(pool_connections = 4, pool_maxsize = POOL_SIZE)
+            _session.mount('https://', adapter)
+            _session.mount('http://', adapter)
+        return _session
+
+
+def async_http_session() -> aiohttp.ClientSession:
+    # must be called from within a running event loop
+    loop = asyncio.get_running_loop()
+    session = _async_sessions.get(loop)
+    if session is None or session.closed:
+        session = _async_sessions[loop] = aiohttp.ClientSession(
+            connector = aiohttp.TCPConnector(limit = POOL_SIZE),
+        )
+    return session
+
+
+def retry_after(headers: Mapping[str, str], body: Any = None) -> float:
+    # seconds to wait after a 429: Retry-After header, Discord's JSON retry_after, else 1 second
+    for value in (headers.get('Retry-After'), body.get('retry_after') if isinstance(body, dict) else None):
+        try:
+            if value is not None:
+                return max(float(value), 0.0)
+        except (TypeError, ValueError):
+            continue
+    return 1.0
+
+
+def _rate_limited(url: str, wait: float, attempt: int, deadline: float) -> bool:
+    # True when the request should be repeated after `wait` seconds
+    if attempt >= MAX_RATE_LIMIT_RETRIES or time.monotonic() + wait > deadline:
+        logger.warning(f"Rate limited by {url}; giving up (retry after {wait}s)")
+        return False
+    logger.info(f"Rate limited by {url}; retrying in {wait}s")
+    return True
+
+
+def post(url: str, timeout: float | None = None, **kwargs) -> requests.Response:
+    # requests.post through the shared session, retrying 429s within the timeout
+    timeout = DEFAULT_TIMEOUT if timeout is None else timeout
+    deadline = time.monotonic() + timeout
+    attempt = 0
+    while True:
+        response = http_session().post(url, timeout = timeout, **kwargs)
+        if response.status_code != 429:
+            return response
+        try:
+            body = response.json()
+        except ValueError:
+            body = None
+        wait = retry_after(response.headers, body)
+        if not _rate_limited(url, wait, attempt, deadline):
+            return response
+        time.sleep(wait)
+        attempt += 1
+
+
+async def async_post(url: str, timeout: float | None = None, **kwargs) -> HTTPResult:
+    # see post(); runs on the event loop
+    timeout = DEFAULT_TIMEOUT if timeout is None else timeout
+    deadline = time.monotonic() + timeout
+    attempt = 0
+    while True:
+        async with async_http_session().post(url, timeout = aiohttp.ClientTimeout(total = timeout), **kwargs) as response:
+            body = None
+            if response.status == 429:
+                try:
+                    body = await response.json(content_type = None)
+                except ValueError:
+                    body = None
+            result = HTTPResult(response.status, response.headers.copy(), body)
+        if result.status != 429:
+            return result
+        wait = retry_after(result.headers, result.body)
+        if not _rate_limited(url, wait, attempt, deadline):
+            return result
+        await asyncio.sleep(wait)
+        attempt += 1
+
+
+def close_http_session() -> None:
+    global _session
+    with _session_lock:
+        session, _session = _session, None
+    if session is not None:
+        session.close()
+
+
+async def close_async_http_sessions() -> None:
+    # closes the session of the running loop; sessions of finished loops are dropped
+    loop = asyncio.get_running_loop()
+    sessions = list(_async_sessions.items())
+    _async_sessions.clear()
+    for session_loop, session in sessions:
+        if session_loop is loop and not session.closed:
+            await session.close()
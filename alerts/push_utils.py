@@ -1,32 +1,48 @@
-import requests
 import logging
+from alerts import http_client
 from alerts.base import BaseAlert
 
 logger = logging.getLogger(__name__)
 
+# public server; point NTFY_BASE_URL at a self-hosted or local server instead
+NTFY_BASE_URL = 'https://ntfy.sh'
+
 class NTFYAlert(BaseAlert):
     def __init__(self):
         self._configured = False
 
-    def configure(self, channel):
+    def configure(self, channel, base_url: str = NTFY_BASE_URL):
         self._channel = channel
+        self._base_url = (base_url or NTFY_BASE_URL).rstrip('/')
         self._configured = True
 
-    def send_msg(self, msg: str,  recipient: str, subject: str): 
-        if not self._configured:
-            logger.error('Invalid: not yet configured!')
-            return False
-
+    def _request(self, subject: str):
         header = {
             'Title': subject,
             'Priority': 'high',
             'Tags': 'rotating_light'
         }
-        url = f'https://ntfy.sh/{self._channel}'
-        response = requests.post(url, data = msg, headers = header)
+        return f'{self._base_url}/{self._channel}', header
+
+    def send_msg(self, msg: str,  recipient: str, subject: str): 
+        if not self._configured:
+            logger.error('Invalid: not yet configured!')
+            return False
+
+        url, header = self._request(subject)
+        response = http_client.post(url, data = msg.encode('utf-8'), headers = header, timeout = self.timeout)
 
         if response.ok:
             return True
         else:
             return False
-        
+
+    async def send_msg_async(self, msg: str, recipient: str, subject: str):
+        # send_msg on the event loop (alerts.http_client.async_post)
+        if not self._configured:
+            logger.error('Invalid: not yet configured!')
+            return False
+
+        url, header = self._request(subject)
+        response = await http_client.async_post(url, data = msg.encode('utf-8'), headers = header, timeout = self.timeout)
+        return response.ok
@@ -0,0 +1,359 @@
+import asyncio
+import datetime
+import logging
+import threading
+
+from alerts.digest import Breach, DigestBuilder, Message
+from alerts.handler import Alerts, ChannelResult
+from collections import defaultdict
+from dataclasses import dataclass, field
+from database.async_db import async_session_manager
+from database.db import session_manager
+from database.models import AlertOutbox, User
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
+from typing import Any, Callable, Dict, Iterable, List, Sequence, Tuple
+from utils.env_vars import get_settings
+
+# Purpose: durable alert delivery
+# - alert_stocks() inserts one AlertOutbox row per (breach, channel) in the same transaction that sets
+#   last_notified, so a failed send or a crash never loses an alert
+# - drain() sends due rows in bulk: per (recipient, subject, channel) the breaches are rendered into a
+#   digest (alerts.digest) and sent as one message per chunk that fits the channel's size limit
+# - failed channels are retried with exponential backoff; rows are given up after max_attempts
+# - each send's outcome is committed as soon as it completes, so a crash mid-drain never resends delivered rows
+# - rows of a user (AlertOutbox.user_id) are sent to that user's destinations, read when drained
+
+logger = logging.getLogger(__name__)
+
+PENDING = 'pending'
+SENT = 'sent'
+FAILED = 'failed'
+DEFAULT_BATCH_SIZE = 500
+
+# (row id, attempts so far)
+RowRef = Tuple[int, int]
+
+
+def idempotency_key(ticker: str, day: datetime.date, user_id: int | None = None) -> str:
+    # one alert per ticker per day (per channel, per user)
+    key = f"{ticker.upper()}:{day.isoformat()}"
+    return key if user_id is None else f"{key}:{user_id}"
+
+
+@dataclass
+class AlertTarget:
+    # breaches for one destination; user_id None is the .env owner
+    user_id: int | None
+    recipient: str | None
+    channels: List[str]
+    breaches: List[Breach] = field(default_factory = list)
+
+
+@dataclass
+class _Delivery:
+    # due rows sharing a user, recipient and subject: channel -> [(message, rows covered)], one entry per chunk
+    user_id: int | None
+    recipient: str | None
+    subject: str
+    chunks: Dict[str, List[Tuple[Message, List[RowRef]]]] = field(default_factory = dict)
+    # channel -> (result, chunk) for channels whose chunk failed in this drain: their later chunks are not sent
+    failed: Dict[str, Tuple[ChannelResult | None, int]] = field(default_factory = dict)
+
+    @property
+    def rounds(self) -> int:
+        return max((len(chunks) for chunks in self.chunks.values()), default = 0)
+
+    def messages(self, part: int) -> Dict[str, Message]:
+        return {
+            channel: chunks[part][0]
+            for channel, chunks in self.chunks.items()
+            if part < len(chunks) and channel not in self.failed
+        }
+
+
+class AlertOutboxWorkerBase():
+    # shared logic for the sync (AlertOutboxWorker) and async (AsyncAlertOutboxWorker) workers
+
+    def __init__(
+        self,
+        sessionmaker,
+        backoff_base: float | None = None,
+        backoff_max: float | None = None,
+        max_attempts: int | None = None,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        clock: Callable[[], datetime.datetime] = datetime.datetime.now,
+    ) -> None:
+        settings = get_settings()
+        self.SessionLocal = sessionmaker
+        self.backoff_base = settings.outbox_backoff_base if backoff_base is None else backoff_base
+        self.backoff_max = settings.outbox_backoff_max if backoff_max is None else backoff_max
+        self.max_attempts = settings.outbox_max_attempts if max_attempts is None else max_attempts
+        self.batch_size = batch_size
+        self._clock = clock
+        # channel -> time before which the channel is not retried
+        self._retry_at: Dict[str, datetime.datetime] = {}
+
+    def backoff(self, attempts: int) -> datetime.timedelta:
+        # base, 2 * base, 4 * base, ... capped at backoff_max
+        delay = self.backoff_base * 2 ** max(attempts - 1, 0)
+        return datetime.timedelta(seconds = min(delay, self.backoff_max))
+
+    def _existing_query(self, targets: Sequence[AlertTarget]):
+        # one lookup for every target's keys
+        day = self._clock().date()
+        keys = [idempotency_key(breach.ticker, day, target.user_id) for target in targets for breach in target.breaches]
+        return select(AlertOutbox.idempotency_key, AlertOutbox.channel).where(AlertOutbox.idempotency_key.in_(keys))
+
+    def _new_rows(self, targets: Sequence[AlertTarget], subject: str, existing: Iterable[Tuple[str, str]]) -> List[AlertOutbox]:
+        # rows already queued today are skipped
+        now = self._clock()
+        seen = set(existing)
+        rows = []
+        for target in targets:
+            for breach in target.breaches:
+                key = idempotency_key(breach.ticker, now.date(), target.user_id)
+                for channel in target.channels:
+                    if (key, channel) in seen:
+                        continue
+                    seen.add((key, channel))
+                    rows.append(AlertOutbox(
+                        idempotency_key = key,
+                        channel = channel,
+                        ticker = breach.ticker,
+                        user_id = target.user_id,
+                        current_value = breach.price,
+                        stop_loss_value = breach.stop,
+                        recipient = target.recipient,
+                        subject = subject,
+                        status = PENDING,
+                        attempts = 0,
+                        next_attempt_at = now,
+                        created_at = now,
+                    ))
+        return rows
+
+    def _targets(self, targets: Sequence[AlertTarget]) -> List[AlertTarget]:
+        return [target for target in targets if target.breaches and target.channels]
+
+    def _due_query(self, now: datetime.datetime):
+        query = select(
+            AlertOutbox.id, AlertOutbox.channel, AlertOutbox.user_id, AlertOutbox.recipient, AlertOutbox.subject,
+            AlertOutbox.ticker, AlertOutbox.current_value, AlertOutbox.stop_loss_value, AlertOutbox.attempts,
+        ).where(AlertOutbox.status == PENDING, AlertOutbox.next_attempt_at <= now)
+        waiting = [channel for channel, until in self._retry_at.items() if until > now]
+        if waiting:
+            # channels in backoff keep their new rows queued too
+            query = query.where(AlertOutbox.channel.not_in(waiting))
+        return query.order_by(AlertOutbox.id).limit(self.batch_size)
+
+    def _user_ids(self, due: Sequence[Any]) -> List[int]:
+        return list({row.user_id for row in due if row.user_id is not None})
+
+    def _users_query(self, user_ids: Sequence[int]):
+        # destinations of the users with due rows
+        return select(User.id, User.email, User.ntfy_topic, User.discord_webhook_url).where(User.id.in_(user_ids))
+
+    def _alerters(self, base: Alerts, users: Sequence[Any]) -> Dict[int | None, Alerts]:
+        # user_id -> Alerts sending to that user's destinations; None is the .env owner
+        alerters: Dict[int | None, Alerts] = {None: base}
+        for user_id, email, ntfy_topic, discord_webhook_url in users:
+            alerters[user_id] = base.with_config(base.config.for_user(email, ntfy_topic, discord_webhook_url))
+        return alerters
+
+    def _alerter(self, alerters: Dict[int | None, Alerts], user_id: int | None) -> Alerts:
+        # rows of a deleted user find no channel and are given up
+        base = alerters[None]
+        if user_id not in alerters:
+            alerters[user_id] = base.with_config(base.config.for_user(None, None, None))
+        return alerters[user_id]
+
+    def _deliveries(self, due: Sequence[Any]) -> List[_Delivery]:
+        grouped: Dict[Tuple, Dict[str, List[Tuple[RowRef, Breach]]]] = defaultdict(lambda: defaultdict(list))
+        for row_id, channel, user_id, recipient, subject, ticker, price, stop, attempts in due:
+            grouped[(user_id, recipient, subject)][channel].append(((row_id, attempts), Breach(ticker, price, stop)))
+
+        # one builder per drain: a breach sent to many recipients is rendered once
+        builder = DigestBuilder()
+        deliveries = []
+        for (user_id, recipient, subject), channels in grouped.items():
+            delivery = _Delivery(user_id, recipient, subject)
+            for channel, entries in channels.items():
+                chunks = builder.build([breach for _, breach in entries], [channel])[channel]
+                delivery.chunks[channel] = [
+                    (chunk.message, [entries[pos][0] for pos in chunk.items]) for chunk in chunks
+                ]
+            deliveries.append(delivery)
+        return deliveries
+
+    def _round_outcomes(self, delivery: _Delivery, part: int, results: Dict[str, ChannelResult], now: datetime.datetime) -> List[Dict[str, Any]]:
+        # per-row updates for the chunks sent in round `part`
+        updates = []
+        for channel, chunks in delivery.chunks.items():
+            if part >= len(chunks) or channel in delivery.failed:
+                continue
+            result = results.get(channel)
+            if result is None or not result.ok:
+                delivery.failed[channel] = (result, part)
+            updates.extend(self._outcome(channel, chunks[part][1], result, now))
+        return updates
+
+    def _skipped_outcomes(self, delivery: _Delivery, now: datetime.datetime) -> List[Dict[str, Any]]:
+        # chunks not sent because an earlier chunk of the channel failed count as failed attempts
+        updates = []
+        for channel, (result, part) in delivery.failed.items():
+            for _, rows in delivery.chunks[channel][part + 1:]:
+                updates.extend(self._outcome(channel, rows, result, now, log = False))
+        return updates
+
+    def _sent(self, updates: Sequence[Dict[str, Any]]) -> int:
+        return sum(1 for row in updates if row.get('status') == SENT)
+
+    def _outcome(self, channel: str, rows: List[RowRef], result: ChannelResult | None, now: datetime.datetime, log: bool = True) -> List[Dict[str, Any]]:
+        if result is not None and result.ok:
+            self._retry_at.pop(channel, None)
+            return [
+                {'id': row_id, 'status': SENT, 'attempts': attempts + 1, 'sent_at': now, 'last_error': None}
+                for row_id, attempts in rows
+            ]
+
+        error = 'channel not configured' if result is None else (result.error or 'failed')
+        updates = []
+        for row_id, attempts in rows:
+            attempts += 1
+            if result is None or attempts >= self.max_attempts:
+                logger.error(f"Giving up on alert {row_id} via {channel} after {attempts} attempt(s): {error}")
+                updates.append({'id': row_id, 'status': FAILED, 'attempts': attempts, 'last_error': error[:200]})
+            else:
+                updates.append({
+                    'id': row_id, 'attempts': attempts, 'last_error': error[:200],
+                    'next_attempt_at': now + self.backoff(attempts),
+                })
+        if result is not None and rows:
+            retry_at = now + self.backoff(max(attempts for _, attempts in rows) + 1)
+            self._retry_at[channel] = max(retry_at, self._retry_at.get(channel, retry_at))
+            if log:
+                logger.warning(f"Alerts via {channel} failed ({error}); retrying after {retry_at}")
+        return updates
+
+
+class AlertOutboxWorker(AlertOutboxWorkerBase):
+    def __init__(self, sessionmaker: sessionmaker, **kwargs) -> None:
+        super().__init__(sessionmaker, **kwargs)
+        self._drain_lock = threading.Lock()
+
+    def enqueue(
+        self,
+        session: Session,
+        breaches: Sequence[Breach],
+        channels: Sequence[str],
+        recipient: str | None,
+        subject: str,
+        user_id: int | None = None,
+    ) -> int:
+        # runs inside the caller's transaction; returns the number of rows queued
+        return self.enqueue_targets(session, [AlertTarget(user_id, recipient, list(channels), list(breaches))], subject)
+
+    def enqueue_targets(self, session: Session, targets: Sequence[AlertTarget], subject: str) -> int:
+        # every subscriber of a breach in one lookup and one insert batch
+        targets = self._targets(targets)
+        if not targets:
+            return 0
+        existing = session.execute(self._existing_query(targets)).all()
+        rows = self._new_rows(targets, subject, existing)
+        session.add_all(rows)
+        return len(rows)
+
+    def drain(self, alerts: Callable[[], Alerts]) -> int:
+        '''
+        sends every due row; alerts builds the configured Alerts (only called when rows are due)
+        returns the number of rows sent
+        '''
+        with self._drain_lock:
+            now = self._clock()
+            with session_manager(self.SessionLocal) as session:
+                due = session.execute(self._due_query(now)).all()
+                user_ids = self._user_ids(due)
+                users = session.execute(self._users_query(user_ids)).all() if user_ids else []
+            if not due:
+                return 0
+
+            # network I/O happens outside any transaction
+            alerters = self._alerters(alerts(), users)
+            sent = 0
+            for delivery in self._deliveries(due):
+                alerter = self._alerter(alerters, delivery.user_id)
+                for part in range(delivery.rounds):
+                    messages = delivery.messages(part)
+                    if not messages:
+                        break
+                    results = alerter.send_each(messages, delivery.recipient, delivery.subject)
+                    sent += self._save(self._round_outcomes(delivery, part, results, self._clock()))
+                sent += self._save(self._skipped_outcomes(delivery, self._clock()))
+            return sent
+
+    def _save(self, updates: List[Dict[str, Any]]) -> int:
+        # commits the outcome of one send right away; returns the number of rows sent
+        if updates:
+            with session_manager(self.SessionLocal) as session:
+                session.execute(update(AlertOutbox), updates)
+        return self._sent(updates)
+
+
+class AsyncAlertOutboxWorker(AlertOutboxWorkerBase):
+    def __init__(self, sessionmaker: async_sessionmaker, **kwargs) -> None:
+        super().__init__(sessionmaker, **kwargs)
+        self._drain_lock = asyncio.Lock()
+
+    async def enqueue(
+        self,
+        session: AsyncSession,
+        breaches: Sequence[Breach],
+        channels: Sequence[str],
+        recipient: str | None,
+        subject: str,
+        user_id: int | None = None,
+    ) -> int:
+        # see AlertOutboxWorker.enqueue
+        return await self.enqueue_targets(session, [AlertTarget(user_id, recipient, list(channels), list(breaches))], subject)
+
+    async def enqueue_targets(self, session: AsyncSession, targets: Sequence[AlertTarget], subject: str) -> int:
+        targets = self._targets(targets)
+        if not targets:
+            return 0
+        existing = (await session.execute(self._existing_query(targets))).all()
+        rows = self._new_rows(targets, subject, existing)
+        session.add_all(rows)
+        return len(rows)
+
+    async def drain(self, alerts: Callable[[], Alerts]) -> int:
+        # see AlertOutboxWorker.drain; channel sends run on the dispatcher's threads
+        async with self._drain_lock:
+            now = self._clock()
+            async with async_session_manager(self.SessionLocal) as session:
+                due = (await session.execute(self._due_query(now))).all()
+                user_ids = self._user_ids(due)
+                users = (await session.execute(self._users_query(user_ids))).all() if user_ids else []
+            if not due:
+                return 0
+
+            alerters = self._alerters(alerts(), users)
+            sent = 0
+            for delivery in self._deliveries(due):
+                alerter = self._alerter(alerters, delivery.user_id)
+                for part in range(delivery.rounds):
+                    messages = delivery.messages(part)
+                    if not messages:
+                        break
+                    results = await alerter.send_each_async(messages, delivery.recipient, delivery.subject)
+                    sent += await self._save(self._round_outcomes(delivery, part, results, self._clock()))
+                sent += await self._save(self._skipped_outcomes(delivery, self._clock()))
+            return sent
+
+    async def _save(self, updates: List[Dict[str, Any]]) -> int:
+        # see AlertOutboxWorker._save
+        if updates:
+            async with async_session_manager(self.SessionLocal) as session:
+                await session.execute(update(AlertOutbox), updates)
+        return self._sent(updates)
@@ -0,0 +1,74 @@
+import asyncio
+import inspect
+
+from contextlib import asynccontextmanager
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, async_sessionmaker, create_async_engine
+from database.db import EngineProfile, upgrade_schema
+from database.models import Base
+from typing import Any, Callable
+from utils.env_vars import get_settings
+
+# Purpose: async counterpart of database/db.py
+# - AsyncEngine on the aiosqlite driver, built from the same EngineProfile (pragmas, pool size, echo)
+# - lets StockManager/TokenManager work run on the event loop instead of asyncio.to_thread workers
+
+
+def async_url(url: str) -> str:
+    # sqlite:///bot.db -> sqlite+aiosqlite:///bot.db; urls that already name a driver are kept
+    parsed = make_url(url)
+    if parsed.get_backend_name() == 'sqlite' and parsed.get_driver_name() == 'pysqlite':
+        parsed = parsed.set(drivername = 'sqlite+aiosqlite')
+    return parsed.render_as_string(hide_password = False)
+
+
+def create_async_db_engine(profile: EngineProfile) -> AsyncEngine:
+    url = make_url(async_url(profile.url))
+    options = {}
+    if not (url.get_backend_name() == 'sqlite' and url.database in (None, '', ':memory:')):
+        options['pool_size'] = profile.pool_size
+        options['max_overflow'] = profile.pool_size
+
+    db_engine = create_async_engine(url, echo = profile.echo, **options)
+
+    pragmas = profile.pragmas() if url.get_backend_name() == 'sqlite' else []
+    if pragmas:
+        # connection events are emitted by the underlying sync engine
+        @event.listens_for(db_engine.sync_engine, 'connect')
+        def _apply_pragmas(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            try:
+                for pragma in pragmas:
+                    cursor.execute(pragma)
+            finally:
+                cursor.close()
+
+    return db_engine
+
+
+async_engine = create_async_db_engine(EngineProfile.from_settings(get_settings()))
+async_session_maker = async_sessionmaker(bind = async_engine, expire_on_commit = False)
+
+@asynccontextmanager
+async def async_session_manager(SessionLocal: async_sessionmaker):
+    session = SessionLocal()
+    try:
+        yield session
+        await session.commit()
+    except Exception:
+        await session.rollback()
+        raise
+    finally:
+        await session.close()
+
+async def call_db(method: Callable[..., Any], *args: Any) -> Any:
+    # async manager methods are awaited on the loop; sync ones run in a worker thread
+    if inspect.iscoroutinefunction(method):
+        return await method(*args)
+    return await asyncio.to_thread(method, *args)
+
+async def init_async_db():
+    async with async_engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(upgrade_schema)
@@ -0,0 +1,217 @@
+import asyncio
+import logging
+
+from database.alert_outbox import AsyncAlertOutboxWorker
+from database.async_db import async_session_manager
+from database.models import Stock, User, Watchlist
+from database.price_history import PriceHistory
+from database.stock_tracker import ALERT_SUBJECT, DEFAULT_WATCHLIST, StockManagerBase
+from database.strategies import build_strategy
+from database.write_buffer import AsyncWriteBuffer
+from sqlalchemy import delete, select
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from typing import Dict, List, Sequence
+
+# async variant of StockManager on an AsyncSession (database/async_db.py)
+# - same working set / write buffer / once-a-day alert logic (StockManagerBase)
+# - every database call runs on the event loop; only the blocking alert sends use worker threads (alerts.handler)
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncStockManager(StockManagerBase):
+    def __init__(self, sessionmaker: async_sessionmaker, history: PriceHistory | None = None):
+        # pass async_db.async_session_maker as sessionmaker
+        super().__init__(sessionmaker, history)
+        # guards the working set across awaits
+        self._lock = asyncio.Lock()
+        self._write_buffer = AsyncWriteBuffer(sessionmaker, Stock, key = 'ticker')
+        self.outbox = AsyncAlertOutboxWorker(sessionmaker)
+
+    async def get_tracked_stock_tickers(self) -> Sequence:
+        async with async_session_manager(self.SessionLocal) as session:
+            return (await session.scalars(select(Stock.ticker))).unique().all()
+
+    async def get_symbol_id_for(self, ticker: str) -> int | None:
+        ticker = self._normalize_ticker(ticker)
+        async with async_session_manager(self.SessionLocal) as session:
+            stock: Stock = await session.get(Stock, ticker)
+            return stock.symbol_id if stock else None
+
+    async def get_tracked_symbol_ids(self) -> Dict[str, int | None]:
+        async with async_session_manager(self.SessionLocal) as session:
+            return dict((await session.execute(select(Stock.ticker, Stock.symbol_id))).all())
+
+    async def set_symbol_id_for(self, ticker: str, symbol_id: int) -> None:
+        ticker = self._normalize_ticker(ticker)
+        async with self._lock:
+            await self.flush()
+            async with async_session_manager(self.SessionLocal) as session:
+                stock: Stock = await session.get(Stock, ticker)
+                if not stock:
+                    logger.warning(f"Stock with ticker {ticker} not found!")
+                    return
+                stock.symbol_id = symbol_id
+            self._forget_cached(ticker)
+
+    async def set_strategy(self, ticker: str, strategy: str | None, window: int | None = None, param: float | None = None) -> None:
+        ticker = self._normalize_ticker(ticker)
+        build_strategy(strategy, window, param, self.stop_loss_ratio)
+        async with self._lock:
+            await self.flush()
+            async with async_session_manager(self.SessionLocal) as session:
+                stock: Stock = await session.get(Stock, ticker)
+                if not stock:
+                    raise RuntimeError(f"Stock with ticker {ticker} does not exist!")
+                self._set_strategy_columns(stock, strategy, window, param)
+            self._forget_cached(ticker)
+
+    async def set_stop_rule(self, ticker: str, ratio: float | None = None, absolute: float | None = None) -> None:
+        ticker = self._normalize_ticker(ticker)
+        self._validate_stop_rule(ratio, absolute)
+        async with self._lock:
+            await self.flush()
+            async with async_session_manager(self.SessionLocal) as session:
+                stock: Stock = await session.get(Stock, ticker)
+                if not stock:
+                    raise RuntimeError(f"Stock with ticker {ticker} does not exist!")
+                self._set_stop_rule_columns(stock, ratio, absolute)
+            self._forget_cached(ticker)
+
+    # -----------------------------
+    # working set + write buffer
+    # -----------------------------
+    async def _select_rows(self, tickers=None):
+        async with async_session_manager(self.SessionLocal) as session:
+            return (await session.execute(self._rows_query(tickers))).all()
+
+    async def _ensure_working_set(self, tickers) -> None:
+        # must hold self._lock
+        if self._working_set_expired():
+            await self.flush()
+            self._load_working_set(await self._select_rows())
+        else:
+            missing = self._missing_from_working_set(tickers)
+            if missing:
+                self._extend_working_set(await self._select_rows(missing))
+
+    async def flush(self) -> int:
+        if self.history is not None:
+            # small sequential file append
+            self.history.flush()
+        return await self._write_buffer.flush()
+
+    async def alert_stocks(self) -> None:
+        if not self.stocks_to_alert:
+            return
+
+        await self.flush()
+        alerts = self._alerts()
+        tickers = list(self.stocks_to_alert)
+
+        async with async_session_manager(self.SessionLocal) as session:
+            # see StockManager.alert_stocks
+            breaches = self._alert_breaches((await session.scalars(self._alert_query(tickers))).all())
+            subscribers = (await session.execute(self._subscribers_query([b.ticker for b in breaches]))).all() if breaches else []
+            await self.outbox.enqueue_targets(session, self._alert_targets(breaches, subscribers, alerts.config), ALERT_SUBJECT)
+
+        self._alerted(tickers)
+        await self.outbox.drain(lambda: alerts)
+
+    async def drain_alerts(self) -> int:
+        return await self.outbox.drain(self._alerts)
+
+    async def check_stocks(self, prices: Dict[str, float], symbol_ids: Dict[str, int] | None = None) -> List[str]:
+        # see StockManager.check_stocks
+        prices, symbol_ids = self._normalize_quotes(prices, symbol_ids)
+        if not prices:
+            return []
+
+        async with self._lock:
+            await self._ensure_working_set(prices.keys())
+            breached = self._apply_quotes(prices, symbol_ids)
+            if self._write_buffer.due():
+                await self.flush()
+        return breached
+
+    async def add_stock(
+        self,
+        new_ticker: str,
+        new_price: float,
+        stock_currency: str,
+        ratio: float | None = None,
+        absolute: float | None = None,
+    ) -> None:
+        new_ticker = self._normalize_ticker(new_ticker)
+        if not new_ticker:
+            raise RuntimeError("Ticker cannot be empty.")
+
+        async with async_session_manager(self.SessionLocal) as session:
+            stock: Stock = await session.get(Stock, new_ticker)
+            if stock:
+                raise RuntimeError(f"Stock with ticker {new_ticker} already exists!")
+
+            session.add(self._new_stock(new_ticker, new_price, stock_currency, ratio, absolute))
+
+    async def remove_stock(self, ticker_to_remove: str) -> None:
+        ticker_to_remove = ticker_to_remove.upper()
+        async with self._lock:
+            self._forget_cached(ticker_to_remove)
+            self._notified.pop(ticker_to_remove, None)
+            async with async_session_manager(self.SessionLocal) as session:
+                stock: Stock = await session.get(Stock, ticker_to_remove)
+                if not stock:
+                    raise RuntimeError(f"Stock with ticker {ticker_to_remove} does not exist!")
+                await session.execute(delete(Watchlist).where(Watchlist.ticker == ticker_to_remove))
+                await session.delete(stock)
+
+    # -----------------------------
+    # users + watchlists (see StockManager)
+    # -----------------------------
+    async def add_user(self, name: str, email: str | None = None, ntfy_topic: str | None = None, discord_webhook_url: str | None = None) -> int:
+        name = self._user_name(name)
+        async with async_session_manager(self.SessionLocal) as session:
+            if await session.scalar(self._user_query(name)):
+                raise RuntimeError(f"User {name} already exists!")
+            user = User(name = name, email = email, ntfy_topic = ntfy_topic, discord_webhook_url = discord_webhook_url)
+            session.add(user)
+            await session.flush()
+            return user.id
+
+    async def remove_user(self, name: str) -> None:
+        async with async_session_manager(self.SessionLocal) as session:
+            user: User = await session.scalar(self._user_query(self._user_name(name)))
+            if not user:
+                raise RuntimeError(f"User {name} does not exist!")
+            await session.execute(delete(Watchlist).where(Watchlist.user_id == user.id))
+            await session.delete(user)
+
+    async def watch(self, name: str, ticker: str, watchlist: str = DEFAULT_WATCHLIST) -> None:
+        ticker = self._normalize_ticker(ticker)
+        async with async_session_manager(self.SessionLocal) as session:
+            user: User = await session.scalar(self._user_query(self._user_name(name)))
+            if not user:
+                raise RuntimeError(f"User {name} does not exist!")
+            if not await session.get(Stock, ticker):
+                raise RuntimeError(f"Stock with ticker {ticker} does not exist!")
+            if not await session.get(Watchlist, (user.id, watchlist, ticker)):
+                session.add(Watchlist(user_id = user.id, name = watchlist, ticker = ticker))
+
+    async def unwatch(self, name: str, ticker: str, watchlist: str = DEFAULT_WATCHLIST) -> None:
+        ticker = self._normalize_ticker(ticker)
+        async with async_session_manager(self.SessionLocal) as session:
+            user: User = await session.scalar(self._user_query(self._user_name(name)))
+            entry = await session.get(Watchlist, (user.id, watchlist, ticker)) if user else None
+            if not entry:
+                raise RuntimeError(f"{ticker} is not on {name}'s {watchlist} watchlist!")
+            await session.delete(entry)
+
+    async def get_watchlist(self, name: str, watchlist: str | None = None) -> List[str]:
+        async with async_session_manager(self.SessionLocal) as session:
+            user: User = await session.scalar(self._user_query(self._user_name(name)))
+            if not user:
+                raise RuntimeError(f"User {name} does not exist!")
+            query = select(Watchlist.ticker).where(Watchlist.user_id == user.id)
+            if watchlist is not None:
+                query = query.where(Watchlist.name == watchlist)
+            return list((await session.scalars(query.distinct().order_by(Watchlist.ticker))).all())
@@ -0,0 +1,94 @@
+import aiohttp
+import asyncio
+import datetime
+import logging
+
+from database.async_db import async_session_manager
+from database.models import Token
+from database.token_manager import (
+    CACHE_EXPIRY_MARGIN, REFRESH_ADDRESS, TOKEN_REFRESH_TIMEOUT, CachedToken, TokenManagerBase,
+)
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from utils.env_vars import get_settings
+
+# async variant of TokenManager on an AsyncSession (database/async_db.py)
+# - refresh requests go through aiohttp; single-flight with an asyncio.Lock
+# - no I/O in __init__: a missing token row is seeded from the refresh_token setting on first use
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncTokenManager(TokenManagerBase):
+    def __init__(self, sessionmaker: async_sessionmaker, login: str | None = None, seed_token: str | None = None):
+        super().__init__(sessionmaker, login, seed_token)
+        self._refresh_lock = asyncio.Lock()
+
+    async def _refresh_tokens(self, session: AsyncSession, rf_token: str) -> Token:
+        timeout = aiohttp.ClientTimeout(total = TOKEN_REFRESH_TIMEOUT)
+        async with aiohttp.ClientSession(timeout = timeout) as client:
+            async with client.get(REFRESH_ADDRESS.format(token = rf_token)) as result:
+                if result.status >= 400:
+                    logger.error(f"Error Occurred! Status Code: {result.status}")
+                    if result.status == 400:
+                        logger.error(f"Your refresh token is missing or expired!")
+                result.raise_for_status()
+                json_results = await result.json(content_type = None)
+
+        if self._token_id is None:
+            # first token of a new login
+            self._token_id = self._new_token_id(await session.scalar(self._next_id_query()))
+        return await session.merge(self._token_from_json(json_results))
+
+    async def _load_token(self, session: AsyncSession) -> Token:
+        # see TokenManager._get_token
+        if self._token_id is not None:
+            token = await session.get(Token, self._token_id)
+        else:
+            token = await session.scalar(self._token_query())
+        if not token:
+            # no token in database: grab from environment variable (or the login's seed token)
+            token = await self._refresh_tokens(session, self._require_seed(get_settings()))
+        self._token_id = token.id
+        return token
+
+    async def get_api_server(self) -> str:
+        cached = self._cached
+        if cached is not None:
+            return cached.api_server
+        return (await self._ensure_token(CACHE_EXPIRY_MARGIN)).api_server
+
+    async def _ensure_token(self, margin: datetime.timedelta) -> CachedToken:
+        # see TokenManager._ensure_token
+        async with self._refresh_lock:
+            now = datetime.datetime.now()
+            cached = self._cached
+            if cached is not None and cached.is_fresh(now, margin):
+                return cached
+
+            async with async_session_manager(self.SessionLocal) as session:
+                token = await self._load_token(session)
+
+                if now >= token.expiry_date - margin:
+                    logger.info(f"Attempting refresh: access token expires on: {token.expiry_date}")
+                    token = await self._refresh_tokens(session, token.refresh_token)
+
+                self._cache(token)
+                return self._cached
+
+    async def get_access_token(self) -> str:
+        access_token = self.cached_access_token()
+        if access_token is not None:
+            return access_token
+
+        return (await self._ensure_token(CACHE_EXPIRY_MARGIN)).access_token
+
+    async def refresh_if_needed(self, margin: datetime.timedelta) -> CachedToken:
+        return await self._ensure_token(max(margin, CACHE_EXPIRY_MARGIN))
+
+    async def seconds_until_refresh(self, margin: datetime.timedelta) -> float:
+        cached = self._cached or await self._ensure_token(CACHE_EXPIRY_MARGIN)
+        return (cached.expiry_date - max(margin, CACHE_EXPIRY_MARGIN) - datetime.datetime.now()).total_seconds()
+
+    async def get_refresh_token(self) -> str:
+        async with async_session_manager(self.SessionLocal) as session:
+            return (await self._load_token(session)).refresh_token
@@ -1,11 +1,90 @@
-from sqlalchemy import create_engine
+from dataclasses import dataclass
+from sqlalchemy import create_engine, event, inspect
+from sqlalchemy.engine import Engine, make_url
 from sqlalchemy.orm import sessionmaker, session
 from database.models import Base
 from contextlib import contextmanager
+from utils.env_vars import Settings, get_settings
+
+
+@dataclass(frozen=True)
+class EngineProfile:
+    '''
+    Engine settings for the bot database.
+
+    tuned (default) applies these pragmas on every new SQLite connection:
+    - journal_mode=WAL: readers do not block the writer and commits append to the WAL instead of rewriting pages
+    - synchronous=NORMAL: fsync at checkpoints only; safe from corruption in WAL mode
+    - mmap_size / cache_size: keep the (small) database in memory
+    - busy_timeout: wait for a concurrent writer instead of failing with "database is locked"
+    '''
+    url: str = 'sqlite:///bot.db'
+    tuned: bool = True
+    echo: bool = False
+    # connections kept open for sessions running on asyncio.to_thread workers (0 = no limit)
+    pool_size: int = 5
+    busy_timeout: int = 5000
+    mmap_size: int = 268435456
+    # KiB
+    cache_size: int = 20000
+
+    @classmethod
+    def from_settings(cls, settings: Settings) -> "EngineProfile":
+        return cls(
+            url = settings.database_url,
+            tuned = settings.db_profile == 'tuned',
+            echo = settings.sql_echo,
+            pool_size = settings.db_pool_size,
+            busy_timeout = settings.db_busy_timeout,
+            mmap_size = settings.db_mmap_size,
+            cache_size = settings.db_cache_size,
+        )
+
+    def pragmas(self) -> list[str]:
+        if not self.tuned:
+            return []
+        return [
+            'PRAGMA journal_mode=WAL',
+            'PRAGMA synchronous=NORMAL',
+            f'PRAGMA mmap_size={self.mmap_size}',
+            # negative cache_size is in KiB rather than pages
+            f'PRAGMA cache_size=-{self.cache_size}',
+            f'PRAGMA busy_timeout={self.busy_timeout}',
+            'PRAGMA temp_store=MEMORY',
+        ]
+
+
+def create_db_engine(profile: EngineProfile) -> Engine:
+    url = make_url(profile.url)
+    is_sqlite = url.get_backend_name() == 'sqlite'
+    options = {}
+    if is_sqlite:
+        # pooled connections are handed to whichever worker thread opens a session
+        options['connect_args'] = {'check_same_thread': False}
+    if not (is_sqlite and url.database in (None, '', ':memory:')):
+        # in-memory SQLite keeps SQLAlchemy's single-connection pool
+        options['pool_size'] = profile.pool_size
+        # short bursts (concurrent to_thread calls) may open extra connections
+        options['max_overflow'] = profile.pool_size
+
+    db_engine = create_engine(profile.url, echo = profile.echo, **options)
+
+    pragmas = profile.pragmas() if is_sqlite else []
+    if pragmas:
+        @event.listens_for(db_engine, 'connect')
+        def _apply_pragmas(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            try:
+                for pragma in pragmas:
+                    cursor.execute(pragma)
+            finally:
+                cursor.close()
+
+    return db_engine
 
 
 # creating SQLAlchemy engine and session connecting to bot.db
-engine = create_engine('sqlite:///bot.db', echo = True)
+engine = create_db_engine(EngineProfile.from_settings(get_settings()))
 session_maker = sessionmaker(bind = engine, expire_on_commit=False)
 
 @contextmanager
@@ -21,9 +100,20 @@ def session_manager(SessionLocal: sessionmaker):
     finally:
         session.close()
 
+def upgrade_schema(connection) -> None:
+    # create_all only creates missing tables: add nullable columns introduced since bot.db was created
+    inspector = inspect(connection)
+    for table in Base.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {column['name'] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing or not column.nullable:
+                continue
+            column_type = column.type.compile(dialect = connection.dialect)
+            connection.exec_driver_sql(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}')
+
 def init_db():
     Base.metadata.create_all(engine)
-
-
-    
-    
\ No newline at end of file
+    with engine.begin() as connection:
+        upgrade_schema(connection)
@@ -3,7 +3,7 @@ import datetime
 from typing import Any
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column
 from sqlalchemy.types import LargeBinary, TypeDecorator, Numeric, String, Integer
-from sqlalchemy import DateTime
+from sqlalchemy import DateTime, ForeignKey, Index, UniqueConstraint
 from cryptography.fernet import Fernet
 from utils.env_vars import get_settings
 
@@ -13,11 +13,32 @@ from utils.env_vars import get_settings
 # models for bot database:
 
     # Tokens:
-        # id | refresh_token | access_token | expiry_date
+        # id | login | refresh_token | access_token | expiry_date
+        # login of None (id 1) is the .env refresh_token; other logins are pooled for market data (database/token_pool.py)
     
     # Stock:
         # ticker (primary key) | current_value | peak_value | stop_loss_threshold | last_notified 
         # use ticker as primary key as it will always be unique
+        # stop_strategy | strategy_window | strategy_param: optional trailing-stop strategy (database/strategies.py)
+        # stop_loss_ratio | stop_loss_absolute: optional per-stock stop rule (global STOP_LOSS otherwise)
+
+    # SymbolCache:
+        # ticker (primary key) | symbol_id | listing_exchange | currency | fetched_at
+        # independent of Stock rows; symbol_id of None records a failed lookup (negative cache)
+
+    # AlertOutbox:
+        # id | idempotency_key | channel | ticker | current_value | stop_loss_value | recipient | subject | status | attempts | next_attempt_at | created_at | sent_at | last_error
+        # one row per alert per channel, drained by database/alert_outbox.py
+        # idempotency_key is ticker:day (ticker:day:user_id for users) so a breach is queued at most once per day per channel
+        # user_id of None: the single-tenant owner configured in .env
+
+    # User:
+        # id | name | email | ntfy_topic | discord_webhook_url
+        # alert destinations of one trader; emails are sent from the .env bot account
+
+    # Watchlist:
+        # user_id | name | ticker (primary key together)
+        # subscribes a user to a tracked Stock; Stock rows stay global so each ticker is quoted once
 
 # define our Base
 class Base(DeclarativeBase):
@@ -63,6 +84,8 @@ class Token(Base):
     __tablename__:str = "token_table"
 
     id:Mapped[int] = mapped_column(primary_key = True)
+    # Questrade login the token belongs to; None for the primary token
+    login:Mapped[str | None] = mapped_column(String(64), nullable = True, unique = True)
 
     # encrypted token value by key stored as environment variable
     refresh_token:Mapped[str] = mapped_column(EncryptedToken(), nullable = False)
@@ -82,6 +105,8 @@ class Token(Base):
 # ticker type decorator as exercise
 class Ticker(TypeDecorator):
     impl = String
+    # stateless apart from length: allows statements using Ticker to be compiled once and cached
+    cache_ok = True
     def __init__ (self, length = 20):
         # set default length to 20 for more buffer against strange tickers
         super().__init__(length)
@@ -102,6 +127,75 @@ class Stock(Base):
     stop_loss_value:Mapped[float] = mapped_column(Numeric(), nullable = False)
     last_notified: Mapped[datetime.datetime] = mapped_column(DateTime, nullable = True)
     currency: Mapped[str] = mapped_column(String(3), nullable = True, default = "USD")
-    
+    # None / 'peak': peak * STOP_LOSS; otherwise 'atr', 'rolling_high' or 'ma_cross'
+    stop_strategy: Mapped[str | None] = mapped_column(String(16), nullable = True)
+    strategy_window: Mapped[int | None] = mapped_column(Integer, nullable = True)
+    strategy_param: Mapped[float | None] = mapped_column(Numeric(), nullable = True)
+    # per-stock trailing rule: fixed distance below the peak (takes precedence) or ratio of the peak
+    stop_loss_ratio: Mapped[float | None] = mapped_column(Numeric(), nullable = True)
+    stop_loss_absolute: Mapped[float | None] = mapped_column(Numeric(), nullable = True)
+
+
+class SymbolCache(Base):
+    __tablename__:str = "symbol_cache_table"
+
+    # cached result of a Questrade symbols/search lookup
+    ticker:Mapped[str] = mapped_column(Ticker, primary_key = True)
+    # None when the lookup found no symbol (negative cache)
+    symbol_id: Mapped[int | None] = mapped_column(Integer, nullable = True)
+    listing_exchange: Mapped[str | None] = mapped_column(String(20), nullable = True)
+    currency: Mapped[str | None] = mapped_column(String(3), nullable = True)
+    fetched_at: Mapped[datetime.datetime] = mapped_column(DateTime, nullable = False)
+
+
+class AlertOutbox(Base):
+    __tablename__:str = "alert_outbox_table"
+    __table_args__ = (
+        UniqueConstraint('idempotency_key', 'channel'),
+        # the worker's "due rows" scan
+        Index('ix_alert_outbox_due', 'status', 'next_attempt_at'),
+    )
+
+    id:Mapped[int] = mapped_column(primary_key = True)
+    # ticker:YYYY-MM-DD[:user_id]
+    idempotency_key:Mapped[str] = mapped_column(String(64), nullable = False)
+    # 'email', 'push' or 'discord' (alerts.handler)
+    channel:Mapped[str] = mapped_column(String(16), nullable = False)
+    ticker:Mapped[str] = mapped_column(Ticker, nullable = False)
+    # None: the .env owner; otherwise User.id whose destinations are used
+    user_id:Mapped[int | None] = mapped_column(Integer, nullable = True)
+    recipient:Mapped[str | None] = mapped_column(String(320), nullable = True)
+    # price and stop at the time of the breach; rendered per channel when drained (alerts.digest)
+    current_value:Mapped[float] = mapped_column(Numeric(), nullable = False)
+    stop_loss_value:Mapped[float] = mapped_column(Numeric(), nullable = False)
+    subject:Mapped[str] = mapped_column(String(200), nullable = False)
+    # 'pending' -> 'sent', or 'failed' once the retry budget is spent
+    status:Mapped[str] = mapped_column(String(8), nullable = False, default = 'pending')
+    attempts:Mapped[int] = mapped_column(Integer, nullable = False, default = 0)
+    next_attempt_at:Mapped[datetime.datetime] = mapped_column(DateTime, nullable = False)
+    created_at:Mapped[datetime.datetime] = mapped_column(DateTime, nullable = False)
+    sent_at:Mapped[datetime.datetime | None] = mapped_column(DateTime, nullable = True)
+    last_error:Mapped[str | None] = mapped_column(String(200), nullable = True)
+
 
+class User(Base):
+    __tablename__:str = "user_table"
 
+    id:Mapped[int] = mapped_column(primary_key = True)
+    name:Mapped[str] = mapped_column(String(64), nullable = False, unique = True)
+    # a destination left empty disables that channel for the user
+    email:Mapped[str | None] = mapped_column(String(320), nullable = True)
+    ntfy_topic:Mapped[str | None] = mapped_column(String(64), nullable = True)
+    discord_webhook_url:Mapped[str | None] = mapped_column(String(256), nullable = True)
+
+
+class Watchlist(Base):
+    __tablename__:str = "watchlist_table"
+    __table_args__ = (
+        # breach fan-out: subscribers of a ticker
+        Index('ix_watchlist_ticker', 'ticker'),
+    )
+
+    user_id:Mapped[int] = mapped_column(ForeignKey("user_table.id", ondelete = "CASCADE"), primary_key = True)
+    name:Mapped[str] = mapped_column(String(32), primary_key = True, default = "default")
+    ticker:Mapped[str] = mapped_column(Ticker, primary_key = True)
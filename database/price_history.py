@@ -0,0 +1,196 @@
+import datetime
+import logging
+import threading
+import time
+import numpy as np
+
+from pathlib import Path
+from typing import Callable, Iterable, List
+
+# Purpose: append-only price history kept outside bot.db
+# - one segment file per UTC day holding fixed-width (timestamp, symbol_id, price) records
+# - ticks are buffered in memory and appended to the day's segment in batches
+# - reads memory-map the segments covering a time range; no parsing, no database rows
+
+logger = logging.getLogger(__name__)
+
+# 20 bytes per tick: ~20 MB per million ticks
+TICK_DTYPE = np.dtype([
+    ('ts', '<i8'),          # milliseconds since the unix epoch (UTC)
+    ('symbol_id', '<i4'),
+    ('price', '<f8'),
+])
+
+BAR_DTYPE = np.dtype([
+    ('ts', '<i8'),          # start of the bucket, milliseconds since the unix epoch (UTC)
+    ('open', '<f8'),
+    ('high', '<f8'),
+    ('low', '<f8'),
+    ('close', '<f8'),
+    ('count', '<i8'),
+])
+
+SEGMENT_SUFFIX = '.ticks'
+DEFAULT_MAX_BUFFERED = 10000
+
+
+def _to_ms(when: datetime.datetime | float) -> int:
+    # datetimes without tzinfo are taken as UTC; floats are unix seconds
+    if isinstance(when, datetime.datetime):
+        if when.tzinfo is None:
+            when = when.replace(tzinfo = datetime.timezone.utc)
+        return int(when.timestamp() * 1000)
+    return int(when * 1000)
+
+
+def _day_of(ms: int) -> datetime.date:
+    return datetime.datetime.fromtimestamp(ms / 1000, datetime.timezone.utc).date()
+
+
+class PriceHistory():
+    '''
+    Tick store: append() / append_many() buffer ticks, flush() appends them to the
+    segment of their UTC day, query() / downsample() read segments through np.memmap.
+    '''
+
+    def __init__(
+        self,
+        directory: str | Path,
+        max_buffered: int = DEFAULT_MAX_BUFFERED,
+        clock: Callable[[], float] = time.time,
+    ) -> None:
+        self.directory = Path(directory)
+        self.directory.mkdir(parents = True, exist_ok = True)
+        self.max_buffered = max_buffered
+        self._clock = clock
+        self._pending: List[np.ndarray] = []
+        self._pending_count = 0
+        self._lock = threading.Lock()
+
+    # -----------------------------
+    # writing
+    # -----------------------------
+    def append(self, symbol_id: int, price: float, ts: datetime.datetime | float | None = None) -> None:
+        self.append_many([symbol_id], [price], ts)
+
+    def append_many(
+        self,
+        symbol_ids: Iterable[int],
+        prices: Iterable[float],
+        ts: datetime.datetime | float | None = None,
+    ) -> None:
+        # one timestamp for the whole batch (ie. one quote response)
+        ids = np.fromiter(symbol_ids, dtype = np.int32)
+        values = np.fromiter(prices, dtype = np.float64)
+        if len(ids) != len(values):
+            raise RuntimeError("symbol_ids and prices must have the same length.")
+        if not len(ids):
+            return
+
+        ticks = np.empty(len(ids), dtype = TICK_DTYPE)
+        ticks['ts'] = _to_ms(self._clock() if ts is None else ts)
+        ticks['symbol_id'] = ids
+        ticks['price'] = values
+
+        with self._lock:
+            self._pending.append(ticks)
+            self._pending_count += len(ticks)
+            full = self._pending_count >= self.max_buffered
+        if full:
+            self.flush()
+
+    def _segment_path(self, day: datetime.date) -> Path:
+        return self.directory / f"{day.isoformat()}{SEGMENT_SUFFIX}"
+
+    def flush(self) -> int:
+        # returns the number of ticks written
+        with self._lock:
+            if not self._pending:
+                return 0
+            ticks = np.concatenate(self._pending)
+            self._pending = []
+            self._pending_count = 0
+
+            # a batch may straddle midnight UTC: split per segment
+            days = ticks['ts'] // 86_400_000
+            for day in np.unique(days):
+                day_ticks = ticks[days == day]
+                path = self._segment_path(_day_of(int(day) * 86_400_000))
+                with open(path, 'ab') as f:
+                    day_ticks.tofile(f)
+            return len(ticks)
+
+    # -----------------------------
+    # reading
+    # -----------------------------
+    def segments(self, start: datetime.datetime | float, end: datetime.datetime | float) -> List[Path]:
+        first, last = _day_of(_to_ms(start)), _day_of(_to_ms(end))
+        paths = []
+        day = first
+        while day <= last:
+            path = self._segment_path(day)
+            if path.exists() and path.stat().st_size:
+                paths.append(path)
+            day += datetime.timedelta(days = 1)
+        return paths
+
+    def query(self, symbol_id: int, start: datetime.datetime | float, end: datetime.datetime | float) -> np.ndarray:
+        # ticks for symbol_id with start <= ts < end, ordered by time (TICK_DTYPE array)
+        self.flush()
+        start_ms, end_ms = _to_ms(start), _to_ms(end)
+        parts = []
+        for path in self.segments(start, end):
+            segment = np.memmap(path, dtype = TICK_DTYPE, mode = 'r')
+            mask = (segment['symbol_id'] == symbol_id) & (segment['ts'] >= start_ms) & (segment['ts'] < end_ms)
+            # copy out of the mapping so the file can be closed
+            parts.append(np.array(segment[mask]))
+            del segment
+
+        if not parts:
+            return np.empty(0, dtype = TICK_DTYPE)
+        ticks = np.concatenate(parts)
+        return ticks[np.argsort(ticks['ts'], kind = 'stable')]
+
+    def downsample(
+        self,
+        symbol_id: int,
+        start: datetime.datetime | float,
+        end: datetime.datetime | float,
+        interval: datetime.timedelta,
+    ) -> np.ndarray:
+        # OHLC bars of `interval` width (BAR_DTYPE array); empty buckets are omitted
+        step = int(interval.total_seconds() * 1000)
+        if step <= 0:
+            raise RuntimeError("Downsampling interval must be greater than 0.")
+
+        ticks = self.query(symbol_id, start, end)
+        if not len(ticks):
+            return np.empty(0, dtype = BAR_DTYPE)
+
+        buckets = ticks['ts'] // step
+        # ticks are time ordered: each bucket is a contiguous run
+        starts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+        ends = np.r_[starts[1:], len(ticks)]
+        prices = ticks['price']
+
+        bars = np.empty(len(starts), dtype = BAR_DTYPE)
+        bars['ts'] = buckets[starts] * step
+        bars['open'] = prices[starts]
+        bars['close'] = prices[ends - 1]
+        bars['high'] = np.maximum.reduceat(prices, starts)
+        bars['low'] = np.minimum.reduceat(prices, starts)
+        bars['count'] = ends - starts
+        return bars
+
+    def prune(self, before: datetime.date) -> int:
+        # delete segments older than `before`; returns the number of segments removed
+        removed = 0
+        for path in self.directory.glob(f"*{SEGMENT_SUFFIX}"):
+            try:
+                day = datetime.date.fromisoformat(path.stem)
+            except ValueError:
+                continue
+            if day < before:
+                path.unlink()
+                removed += 1
+        return removed
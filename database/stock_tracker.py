@@ -1,29 +1,359 @@
 import datetime
 import logging
+import threading
+import time
 
-from alerts import get_alert_channel
-from database.models import Stock
+from alerts.digest import Breach
+from alerts.handler import AlertConfig, Alerts
+from database.alert_outbox import AlertOutboxWorker, AlertTarget
+from database.models import Stock, User, Watchlist
+from database.price_history import PriceHistory
 from database.db import session_manager
+from database.stop_loss import StopLossEngine
+from database.strategies import TrailingStop, build_strategy
+from database.write_buffer import WriteBuffer
 from sqlalchemy.orm import sessionmaker
-from sqlalchemy import select
-from typing import Sequence
+from sqlalchemy import delete, select
+from typing import Any, Callable, Dict, Iterable, List, Sequence
 from utils.env_vars import get_settings
 
 logger = logging.getLogger(__name__)
 
-# StockTracker: 
-# check tracked stocks (stocks within DB) with QTradeAPI 
-# then match with DB to check stop loss 
-# finally update values and send alert if threshold met
-class StockManager():
-    def __init__(self, sessionmaker: sessionmaker):
+ALERT_SUBJECT = "Important: Stop-Loss Alert"
+DEFAULT_WATCHLIST = "default"
+
+# the in-memory working set is reloaded from the database this often (seconds)
+# to pick up edits made outside this process
+WORKING_SET_TTL = 900
+
+class StockManagerBase():
+    # shared state and database-free logic for the sync (StockManager) and async (AsyncStockManager) managers
+
+    def __init__(self, sessionmaker, history: PriceHistory | None = None):
         # SessionLocal stores sessionmaker that creates Sessions connecting to bot.db
         # pass db.session_maker as sessionmaker
         self.SessionLocal = sessionmaker
         self.stocks_to_alert = []
-    
+        # optional tick store: every checked quote with a known symbol id is recorded
+        self.history = history
+
+        # last-seen price/peak/stop per tracked stock: quotes are compared in memory
+        # and only rows that actually changed are queued for writing
+        self._working_set: StopLossEngine | None = None
+        self._working_set_loaded = 0.0
+        # incremental trailing-stop state for stocks configured with a stop_strategy
+        self._strategies: Dict[str, TrailingStop] = {}
+        # ticker -> (stop_strategy, strategy_window, strategy_param, ratio) each strategy was built from:
+        # reloads keep a strategy (and its state) until its row's configuration changes
+        self._strategy_configs: Dict[str, tuple] = {}
+        # ticker -> last notification seen by this process (Stock.last_notified stays the source of truth):
+        # a stock that stays below its stop is not queued again until its next alert would go out
+        self._notified: Dict[str, datetime.datetime] = {}
+        # self.outbox: durable alert queue (database/alert_outbox.py), set by the subclass
+        # called with newly breached tickers (tracking.alert_queue.AlertQueue.notify); may run on a worker thread
+        self.on_breach: Callable[[List[str]], None] | None = None
+
     def _normalize_ticker(self, ticker: str) -> str:
         return ticker.strip().upper()
+
+    def _normalize_quotes(self, prices: Dict[str, float], symbol_ids: Dict[str, int] | None) -> tuple[Dict[str, float], Dict[str, int]]:
+        prices = {
+            self._normalize_ticker(ticker): float(price)
+            for ticker, price in prices.items() if price is not None
+        }
+        symbol_ids = {
+            self._normalize_ticker(ticker): int(sym_id)
+            for ticker, sym_id in (symbol_ids or {}).items() if sym_id is not None
+        }
+        return prices, symbol_ids
+
+    def _rows_query(self, tickers=None):
+        # plain columns: avoids building ORM instances for every tracked row
+        query = select(
+            Stock.ticker, Stock.symbol_id, Stock.current_value,
+            Stock.peak_value, Stock.stop_loss_value,
+            Stock.stop_strategy, Stock.strategy_window, Stock.strategy_param,
+            Stock.stop_loss_ratio, Stock.stop_loss_absolute,
+        )
+        if tickers is not None:
+            query = query.where(Stock.ticker.in_(tickers))
+        return query
+
+    def _working_set_expired(self) -> bool:
+        return self._working_set is None or time.monotonic() - self._working_set_loaded >= WORKING_SET_TTL
+
+    def _load_working_set(self, rows) -> None:
+        # per-stock rules and the global fallback are resolved here, once per load, not per tick
+        ratio = self.stop_loss_ratio
+        tracked = {row[0] for row in rows}
+        for ticker in [ticker for ticker in self._strategies if ticker not in tracked]:
+            self._drop_strategy(ticker)
+        managed = self._build_strategies(rows, ratio)
+        self._working_set = StopLossEngine.from_rows(rows, ratio, managed, self._stop_rules(rows))
+        self._working_set_loaded = time.monotonic()
+
+    def _extend_working_set(self, rows) -> None:
+        rows = [row for row in rows if row[0] not in self._working_set]
+        managed = self._build_strategies(rows, self._working_set.ratio)
+        self._working_set.extend(rows, managed, self._stop_rules(rows))
+
+    def _stop_rules(self, rows) -> Dict[str, tuple[float | None, float | None]]:
+        # ticker -> (ratio, absolute) for rows overriding the global ratio
+        return {
+            row[0]: (row[8], row[9]) for row in rows
+            if row[8] is not None or row[9] is not None
+        }
+
+    def _build_strategies(self, rows, ratio: float) -> List[str]:
+        # returns the tickers whose stop is managed by a strategy
+        # only new rows and rows whose strategy configuration changed are built (and warmed up)
+        managed: List[str] = []
+        now = time.time()
+        for ticker, sym_id, _, peak, stop, name, window, param, row_ratio, _ in rows:
+            config = (name, window, param, float(row_ratio or ratio))
+            stop = float(stop) if stop is not None else None
+            strategy = self._strategies.get(ticker)
+            if strategy is not None and self._strategy_configs.get(ticker) == config:
+                if stop is not None:
+                    # the stop may have been raised outside this process
+                    strategy.hold(stop, now)
+                managed.append(ticker)
+                continue
+
+            self._drop_strategy(ticker)
+            try:
+                strategy = build_strategy(name, window, param, config[3], peak = float(peak), stop = stop)
+            except RuntimeError as e:
+                logger.warning(f"Using the default stop-loss for {ticker}: {e}")
+                continue
+            if strategy is None:
+                continue
+            if self.history is not None and sym_id is not None and strategy.lookback:
+                # warm the rolling windows up from recorded ticks instead of starting empty
+                for tick in self.history.query(sym_id, now - strategy.lookback, now):
+                    strategy.update(float(tick['price']), tick['ts'] / 1000)
+            if stop is not None:
+                # warm-up never lowers the stored stop
+                strategy.hold(stop, now)
+            self._strategies[ticker] = strategy
+            self._strategy_configs[ticker] = config
+            managed.append(ticker)
+        return managed
+
+    def _drop_strategy(self, ticker: str) -> None:
+        self._strategies.pop(ticker, None)
+        self._strategy_configs.pop(ticker, None)
+
+    def _missing_from_working_set(self, tickers) -> List[str]:
+        return [ticker for ticker in tickers if ticker not in self._working_set]
+
+    def _apply_quotes(self, prices: Dict[str, float], symbol_ids: Dict[str, int]) -> List[str]:
+        # evaluate the whole batch as array operations against the loaded working set
+        result = self._working_set.apply(prices, symbol_ids)
+        self._write_buffer.add(result.changed)
+        if self._strategies:
+            self._apply_strategies(prices, result.breached)
+        if self.history is not None:
+            self._record_history(prices)
+
+        for ticker in result.unknown:
+            logger.warning(f"Stock with ticker {ticker} not found!")
+
+        return self._queue_alerts(result.breached)
+
+    def _queue_alerts(self, tickers: Iterable[str]) -> List[str]:
+        # need to alert the stocks; returns the ones not already queued or notified
+        breached = list(dict.fromkeys(
+            ticker for ticker in tickers
+            if ticker not in self.stocks_to_alert and not self._notified_recently(self._notified.get(ticker))
+        ))
+        self.stocks_to_alert.extend(breached)
+        if breached and self.on_breach is not None:
+            self.on_breach(breached)
+        return breached
+
+    def _apply_strategies(self, prices: Dict[str, float], breached: List[str]) -> None:
+        # O(1) per tick for each stock with a trailing-stop strategy
+        now = time.time()
+        changed = []
+        for ticker, price in prices.items():
+            strategy = self._strategies.get(ticker)
+            if strategy is None:
+                continue
+            step = strategy.update(price, now)
+            if step.breached:
+                breached.append(ticker)
+            if step.stop is not None:
+                row = self._working_set.set_stop(ticker, step.stop)
+                if row is not None:
+                    changed.append(row)
+        # later rows replace the pending ones queued by apply()
+        self._write_buffer.add(changed)
+
+    def _record_history(self, prices: Dict[str, float]) -> None:
+        ids: List[int] = []
+        values: List[float] = []
+        for ticker, price in prices.items():
+            sym_id = self._working_set.symbol_id_of(ticker)
+            if sym_id is not None:
+                ids.append(sym_id)
+                values.append(price)
+        self.history.append_many(ids, values)
+
+    def _forget_cached(self, ticker: str) -> None:
+        # drop a ticker from the working set after a direct write; reloaded from the database on next use
+        self._write_buffer.discard(ticker)
+        self._drop_strategy(ticker)
+        if self._working_set is not None:
+            self._working_set.remove(ticker)
+
+    def _alert_query(self, tickers: Sequence[str]):
+        return select(Stock).where(Stock.ticker.in_(map(self._normalize_ticker, tickers)))
+
+    def _alerted(self, tickers: Sequence[str]) -> None:
+        # breaches queued while the alert was being sent stay for the next dispatch
+        done = set(tickers)
+        self.stocks_to_alert[:] = [ticker for ticker in self.stocks_to_alert if ticker not in done]
+
+    def _notified_recently(self, last_notified: datetime.datetime | None) -> bool:
+        # only notify a stock once per day
+        return last_notified is not None and datetime.datetime.now() - last_notified < datetime.timedelta(days = 1)
+
+    def _alert_breaches(self, stock_list: Sequence[Stock]) -> List[Breach]:
+        # marks stocks as notified; returns the stocks not yet notified today (rendered later by alerts.digest)
+        breaches = []
+        for stock in stock_list:
+            if not self._notified_recently(stock.last_notified):
+                stock.last_notified = datetime.datetime.now()
+                breaches.append(Breach(stock.ticker, stock.current_value, stock.stop_loss_value))
+            # later cycles skip this stock without waking the alert queue
+            self._notified[stock.ticker] = stock.last_notified
+        return breaches
+
+    def _alerts(self) -> Alerts:
+        # the owner's channels configured in .env (email, ntfy, discord); users' channels derive from it
+        alerts = Alerts()
+        alerts.set_config(AlertConfig.from_settings(get_settings()))
+        return alerts
+
+    def _subscribers_query(self, tickers: Sequence[str]):
+        # (user id, email, ntfy topic, discord webhook, ticker) per user watching one of tickers in any watchlist
+        return (
+            select(User.id, User.email, User.ntfy_topic, User.discord_webhook_url, Watchlist.ticker)
+            .join(Watchlist, Watchlist.user_id == User.id)
+            .where(Watchlist.ticker.in_(tickers))
+            .distinct()
+        )
+
+    def _alert_targets(self, breaches: Sequence[Breach], subscribers: Sequence[Any], owner: AlertConfig) -> List[AlertTarget]:
+        # the owner gets every breach; each user only the breaches of their watchlists
+        settings = get_settings()
+        targets = []
+        if breaches and owner.channels:
+            targets.append(AlertTarget(None, settings.email_to_notify, owner.channels, list(breaches)))
+
+        by_ticker = {breach.ticker: breach for breach in breaches}
+        users: Dict[int, AlertTarget] = {}
+        for user_id, email, ntfy_topic, discord_webhook_url, ticker in subscribers:
+            if ticker not in by_ticker:
+                continue
+            target = users.get(user_id)
+            if target is None:
+                channels = owner.for_user(email, ntfy_topic, discord_webhook_url).channels
+                target = users[user_id] = AlertTarget(user_id, email, channels)
+            target.breaches.append(by_ticker[ticker])
+        targets.extend(target for target in users.values() if target.channels)
+
+        if breaches and not targets:
+            # nobody can be reached: report what email is missing
+            settings.require_email_settings()
+            raise RuntimeError("No alert channel is configured for the breached stocks.")
+        return targets
+
+    def _user_name(self, name: str) -> str:
+        name = name.strip()
+        if not name:
+            raise RuntimeError("User name cannot be empty.")
+        return name
+
+    def _user_query(self, name: str):
+        return select(User).where(User.name == name)
+
+    def _validate_stop_rule(self, ratio: float | None, absolute: float | None) -> None:
+        if ratio is not None and not 0 < float(ratio) < 1:
+            raise RuntimeError("Stop-loss ratio must be greater than 0 and less than 1.")
+        if absolute is not None and float(absolute) <= 0:
+            raise RuntimeError("Absolute stop-loss distance must be greater than 0.")
+
+    def _stop_for(self, stock: Stock, price: float) -> float:
+        # stop level for a new peak at price under the stock's own rule
+        if stock.stop_loss_absolute is not None:
+            return price - float(stock.stop_loss_absolute)
+        return price * float(stock.stop_loss_ratio or self.stop_loss_ratio)
+
+    def _new_stock(
+        self,
+        new_ticker: str,
+        new_price: float,
+        stock_currency: str,
+        ratio: float | None = None,
+        absolute: float | None = None,
+    ) -> Stock:
+        self._validate_stop_rule(ratio, absolute)
+        price = float(new_price)
+        stock = Stock(
+            ticker = new_ticker,
+            current_value = price,
+            peak_value = price,
+            currency = (stock_currency or "USD").upper(),
+            stop_loss_ratio = ratio,
+            stop_loss_absolute = absolute,
+        )
+        stock.stop_loss_value = self._stop_for(stock, price)
+        return stock
+
+    def _set_stop_rule_columns(self, stock: Stock, ratio: float | None, absolute: float | None) -> None:
+        stock.stop_loss_ratio = ratio
+        stock.stop_loss_absolute = absolute
+        if stock.stop_strategy in (None, 'peak'):
+            stock.stop_loss_value = self._stop_for(stock, float(stock.peak_value))
+
+    def _set_strategy_columns(self, stock: Stock, strategy: str | None, window: int | None, param: float | None) -> None:
+        stock.stop_strategy = strategy.lower() if strategy else None
+        stock.strategy_window = window
+        stock.strategy_param = param
+        if stock.stop_strategy in (None, 'peak'):
+            # back to the default rule: stop follows the recorded peak again
+            stock.stop_loss_value = self._stop_for(stock, float(stock.peak_value))
+
+    def _apply_price(self, stock: Stock, price: float) -> None:
+        # update current value
+        stock.current_value = price
+
+        # if new value is greater than the peak value update stop loss thresholds
+        if float(stock.peak_value) < price:
+            # update new peak_value
+            threshold = self._stop_for(stock, price)
+            stock.stop_loss_value = threshold
+            stock.peak_value = price
+
+    @property
+    def stop_loss_ratio(self) -> float:
+        # global fallback; only read when rows are loaded or written, never per tick
+        return get_settings().stop_loss_ratio
+
+
+# StockTracker: 
+# check tracked stocks (stocks within DB) with QTradeAPI 
+# then match with DB to check stop loss 
+# finally update values and send alert if threshold met
+class StockManager(StockManagerBase):
+    def __init__(self, sessionmaker: sessionmaker, history: PriceHistory | None = None):
+        super().__init__(sessionmaker, history)
+        self._lock = threading.RLock()
+        # dirty rows are coalesced per ticker and written in batches
+        self._write_buffer = WriteBuffer(sessionmaker, Stock, key = 'ticker')
+        self.outbox = AlertOutboxWorker(sessionmaker)
     
     def get_tracked_stock_tickers(self) -> Sequence:
         # use to get a list of tickers (primary key) for tracked stocks (in database)
@@ -36,73 +366,119 @@ class StockManager():
             stock: Stock = session.get(Stock, ticker)
             return stock.symbol_id if stock else None
 
+    def get_tracked_symbol_ids(self) -> Dict[str, int | None]:
+        # ticker -> cached symbol id (None when not yet resolved) for every tracked stock
+        with session_manager(self.SessionLocal) as session:
+            return dict(session.execute(select(Stock.ticker, Stock.symbol_id)).all())
+
     def set_symbol_id_for(self, ticker: str, symbol_id: int) -> None:
         ticker = self._normalize_ticker(ticker)
+        with self._lock:
+            self.flush()
+            with session_manager(self.SessionLocal) as session:
+                stock: Stock = session.get(Stock, ticker)
+                if not stock:
+                    logger.warning(f"Stock with ticker {ticker} not found!")
+                    return
+                stock.symbol_id = symbol_id
+            self._forget(ticker)
+
+    def set_strategy(self, ticker: str, strategy: str | None, window: int | None = None, param: float | None = None) -> None:
+        # configure a trailing-stop strategy for a stock (see database/strategies.py); None restores peak * STOP_LOSS
+        ticker = self._normalize_ticker(ticker)
+        # validates name and parameters
+        build_strategy(strategy, window, param, self.stop_loss_ratio)
+        with self._lock:
+            self.flush()
+            with session_manager(self.SessionLocal) as session:
+                stock: Stock = session.get(Stock, ticker)
+                if not stock:
+                    raise RuntimeError(f"Stock with ticker {ticker} does not exist!")
+                self._set_strategy_columns(stock, strategy, window, param)
+            self._forget(ticker)
+
+    def set_stop_rule(self, ticker: str, ratio: float | None = None, absolute: float | None = None) -> None:
+        # per-stock stop rule: absolute trailing distance or ratio of the peak; both None restores the global STOP_LOSS
+        ticker = self._normalize_ticker(ticker)
+        self._validate_stop_rule(ratio, absolute)
+        with self._lock:
+            self.flush()
+            with session_manager(self.SessionLocal) as session:
+                stock: Stock = session.get(Stock, ticker)
+                if not stock:
+                    raise RuntimeError(f"Stock with ticker {ticker} does not exist!")
+                self._set_stop_rule_columns(stock, ratio, absolute)
+            self._forget(ticker)
+
+    # -----------------------------
+    # working set + write buffer
+    # -----------------------------
+    def _select_rows(self, tickers=None):
         with session_manager(self.SessionLocal) as session:
-            stock: Stock = session.get(Stock, ticker)
-            if not stock:
-                logger.warning(f"Stock with ticker {ticker} not found!")
-                return
-            stock.symbol_id = symbol_id
+            return session.execute(self._rows_query(tickers)).all()
+
+    def _get_working_set(self, tickers) -> StopLossEngine:
+        # must hold self._lock
+        if self._working_set_expired():
+            # pending rows must land before reloading or they would be overwritten in memory
+            self.flush()
+            self._load_working_set(self._select_rows())
+        else:
+            # stocks added since the working set was loaded
+            missing = self._missing_from_working_set(tickers)
+            if missing:
+                self._extend_working_set(self._select_rows(missing))
+        return self._working_set
+
+    def _forget(self, ticker: str) -> None:
+        with self._lock:
+            self._forget_cached(ticker)
+
+    def flush(self) -> int:
+        # write all buffered dirty rows in one transaction; returns the number of rows written
+        if self.history is not None:
+            self.history.flush()
+        return self._write_buffer.flush()
 
     def _update_stock(self, ticker: str, new_price: float) -> None:
         # specifically for updating previously existing stocks, not for adding new stocks
         ticker = ticker.upper()
         price = float(new_price)
+        # pending buffered values for this ticker must not overwrite this update later
+        self._write_buffer.discard(ticker)
         with session_manager(self.SessionLocal) as session:
             stock: Stock = session.get(Stock, ticker)
             if not stock:
                 raise RuntimeError(f"Stock with ticker {ticker} not found!")
             
-            # update current value
-            stock.current_value = price
-
-            # if new value is greater than the peak value update stop loss thresholds
-            if float(stock.peak_value) < price:
-                # update new peak_value
-                threshold = price * float(self.stop_loss_ratio)
-                stock.stop_loss_value = threshold
-                stock.peak_value = price
+            self._apply_price(stock, price)
+        self._forget(ticker)
 
     def alert_stocks(self) -> None:
-        # TODO: 
-        # - configure for other notification types
-        # - implement user configuration (to control which email is notified)
+        # breaches go to the .env owner and to every user watching the stock (Watchlist)
 
         if not self.stocks_to_alert:
             return
 
-        settings = get_settings()
-        subject = "Important: Stop-Loss Alert"
-        msg = "Stop-loss Alert!\n"
-        send_msg = False
+        # message uses stored prices: write pending updates first
+        self.flush()
+        alerts = self._alerts()
+        tickers = list(self.stocks_to_alert)
 
         with session_manager(self.SessionLocal) as session:
-            # loop through stock_list to alert
-            stock_list = session.scalars(
-                select(Stock)
-                .where(Stock.ticker.in_(map(self._normalize_ticker, self.stocks_to_alert)))
-            ).all()
-            
-            for stock in stock_list:
-                if not stock.last_notified or datetime.datetime.now() - stock.last_notified >= datetime.timedelta(days = 1):
-                    # only notify a stock once per day
-                    stock.last_notified = datetime.datetime.now()
-                    send_msg = True
-                    msg += f"{stock.ticker} (${stock.current_value}) has reached stop-loss threshold of ${stock.stop_loss_value} \n"
-
-        # if not send_msg then no stocks need to be notified
-        if send_msg:
-            settings.require_email_settings()
-            email_alerter = get_alert_channel('email')
-            email_alerter.configure_from_provider(
-                settings.email_provider,
-                settings.bot_email,
-                settings.email_password,
-            )
-            email_alerter.send_msg(msg = msg, recipient = settings.email_to_notify, subject = subject)
+            # queued in the same transaction that sets last_notified: a failed send is retried, not lost
+            # (and nothing is marked notified when nobody can be reached)
+            breaches = self._alert_breaches(session.scalars(self._alert_query(tickers)).all())
+            subscribers = session.execute(self._subscribers_query([b.ticker for b in breaches])).all() if breaches else []
+            self.outbox.enqueue_targets(session, self._alert_targets(breaches, subscribers, alerts.config), ALERT_SUBJECT)
+
+        self._alerted(tickers)
+        # first attempt right away; failures are retried by drain_alerts (tracking.scheduler.schedule_outbox)
+        self.outbox.drain(lambda: alerts)
 
-        self.stocks_to_alert.clear()
+    def drain_alerts(self) -> int:
+        # sends queued alerts that are due; returns the number of rows sent
+        return self.outbox.drain(self._alerts)
 
     def check_stock(self, stock_ticker: str, stock_price) -> None:
         # check given stock then alert 
@@ -112,53 +488,120 @@ class StockManager():
             return
 
         price = float(stock_price)
+        # stops raised by check_stocks may still be buffered: write them before comparing
+        self.flush()
         with session_manager(self.SessionLocal) as session:
             stock: Stock = session.get(Stock, stock_ticker)
             if not stock:
                 raise RuntimeError("Stock not found in db")
 
-            if float(stock.stop_loss_value) > price and stock_ticker not in self.stocks_to_alert:
-                # need to alert the stock
-                self.stocks_to_alert.append(stock_ticker)
+            if float(stock.stop_loss_value) > price:
+                self._queue_alerts([stock_ticker])
 
         self._update_stock(stock_ticker, price)
-        
+
+    def check_stocks(self, prices: Dict[str, float], symbol_ids: Dict[str, int] | None = None) -> List[str]:
+        # batch variant of check_stock for a whole quote response:
+        # compares against the in-memory working set (last-seen values) with StopLossEngine,
+        # queues only rows whose price, peak, stop or symbol id changed, and writes them
+        # in batches through the write buffer (one executemany per flush)
+        # returns the tickers that breached their stop-loss
+        prices, symbol_ids = self._normalize_quotes(prices, symbol_ids)
+        if not prices:
+            return []
+
+        with self._lock:
+            self._get_working_set(prices.keys())
+            breached = self._apply_quotes(prices, symbol_ids)
+            if self._write_buffer.due():
+                self.flush()
+        return breached
     
-    def add_stock(self, new_ticker: str, new_price: float, stock_currency: str) -> None:
+    def add_stock(
+        self,
+        new_ticker: str,
+        new_price: float,
+        stock_currency: str,
+        ratio: float | None = None,
+        absolute: float | None = None,
+    ) -> None:
         # method to add new stocks; will throw a Runtime Error if given a stock that already exists
+        # ratio / absolute: optional per-stock stop rule (see set_stop_rule)
         new_ticker = self._normalize_ticker(new_ticker)
         if not new_ticker:
             raise RuntimeError("Ticker cannot be empty.")
 
-        price = float(new_price)
         with session_manager(self.SessionLocal) as session:
             stock: Stock = session.get(Stock, new_ticker)
             if stock:
                 raise RuntimeError(f"Stock with ticker {new_ticker} already exists!")
-            
-            new_stock = Stock(
-                ticker = new_ticker,
-                current_value = price,
-                peak_value = price,
-                stop_loss_value = price * self.stop_loss_ratio,
-                currency = (stock_currency or "USD").upper()
-            )
 
-            session.add(new_stock)
+            session.add(self._new_stock(new_ticker, new_price, stock_currency, ratio, absolute))
 
     def remove_stock(self, ticker_to_remove: str) -> None:
         # method to remove a tracked ticker; will throw a Runtime Error if ticker does not exist
         ticker_to_remove = ticker_to_remove.upper()
+        with self._lock:
+            self._forget(ticker_to_remove)
+            self._notified.pop(ticker_to_remove, None)
+            with session_manager(self.SessionLocal) as session:
+                stock: Stock = session.get(Stock, ticker_to_remove)
+                if not stock:
+                    raise RuntimeError(f"Stock with ticker {ticker_to_remove} does not exist!")
+                session.execute(delete(Watchlist).where(Watchlist.ticker == ticker_to_remove))
+                session.delete(stock)
+
+    # -----------------------------
+    # users + watchlists
+    # -----------------------------
+    def add_user(self, name: str, email: str | None = None, ntfy_topic: str | None = None, discord_webhook_url: str | None = None) -> int:
+        # will throw a Runtime Error if the name is taken; returns the new user's id
+        name = self._user_name(name)
         with session_manager(self.SessionLocal) as session:
-            stock: Stock = session.get(Stock, ticker_to_remove)
-            if not stock:
-                raise RuntimeError(f"Stock with ticker {ticker_to_remove} does not exist!")
-            session.delete(stock)
+            if session.scalar(self._user_query(name)):
+                raise RuntimeError(f"User {name} already exists!")
+            user = User(name = name, email = email, ntfy_topic = ntfy_topic, discord_webhook_url = discord_webhook_url)
+            session.add(user)
+            session.flush()
+            return user.id
 
+    def remove_user(self, name: str) -> None:
+        with session_manager(self.SessionLocal) as session:
+            user: User = session.scalar(self._user_query(self._user_name(name)))
+            if not user:
+                raise RuntimeError(f"User {name} does not exist!")
+            session.execute(delete(Watchlist).where(Watchlist.user_id == user.id))
+            session.delete(user)
 
-    @property
-    def stop_loss_ratio(self) -> float:
-        return get_settings().stop_loss_ratio
-    
+    def watch(self, name: str, ticker: str, watchlist: str = DEFAULT_WATCHLIST) -> None:
+        # subscribes a user to an already tracked stock (see QTradeAPI.watch_stock)
+        ticker = self._normalize_ticker(ticker)
+        with session_manager(self.SessionLocal) as session:
+            user: User = session.scalar(self._user_query(self._user_name(name)))
+            if not user:
+                raise RuntimeError(f"User {name} does not exist!")
+            if not session.get(Stock, ticker):
+                raise RuntimeError(f"Stock with ticker {ticker} does not exist!")
+            if not session.get(Watchlist, (user.id, watchlist, ticker)):
+                session.add(Watchlist(user_id = user.id, name = watchlist, ticker = ticker))
 
-    
+    def unwatch(self, name: str, ticker: str, watchlist: str = DEFAULT_WATCHLIST) -> None:
+        # the stock stays tracked for the other users
+        ticker = self._normalize_ticker(ticker)
+        with session_manager(self.SessionLocal) as session:
+            user: User = session.scalar(self._user_query(self._user_name(name)))
+            entry = session.get(Watchlist, (user.id, watchlist, ticker)) if user else None
+            if not entry:
+                raise RuntimeError(f"{ticker} is not on {name}'s {watchlist} watchlist!")
+            session.delete(entry)
+
+    def get_watchlist(self, name: str, watchlist: str | None = None) -> List[str]:
+        # tickers of one watchlist, or of all the user's watchlists
+        with session_manager(self.SessionLocal) as session:
+            user: User = session.scalar(self._user_query(self._user_name(name)))
+            if not user:
+                raise RuntimeError(f"User {name} does not exist!")
+            query = select(Watchlist.ticker).where(Watchlist.user_id == user.id)
+            if watchlist is not None:
+                query = query.where(Watchlist.name == watchlist)
+            return list(session.scalars(query.distinct().order_by(Watchlist.ticker)).all())
@@ -0,0 +1,237 @@
+import numpy as np
+
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List, Mapping, Tuple
+
+# Purpose: columnar, in-memory stop-loss engine
+# holds a snapshot of tracked stocks as NumPy arrays so a whole quote batch is
+# evaluated with a handful of array operations instead of per-ticker ORM updates
+
+# sentinel for a missing symbol id inside the int64 column
+NO_SYMBOL_ID = -1
+
+
+@dataclass
+class BatchResult:
+    # rows whose stored values changed: dicts keyed by Stock column names (ready for executemany)
+    changed: List[Dict[str, Any]] = field(default_factory=list)
+    # tickers whose price fell below their stop-loss value
+    breached: List[str] = field(default_factory=list)
+    # tickers in the batch that are not part of the snapshot
+    unknown: List[str] = field(default_factory=list)
+
+
+class StopLossEngine():
+    '''
+    Snapshot of tracked stocks stored column-wise:
+        ticker | symbol_id | current | peak | stop
+
+    apply() follows the same rule as StockManager.check_stock:
+    - alert when stop > price (evaluated against the stop before this batch)
+    - on a new high: peak = price and stop = price * ratio
+
+    ratio is the global default; per-row rules (Stock.stop_loss_ratio / stop_loss_absolute) are resolved
+    into the ratios / offsets columns once when rows are loaded:
+    - offset set: stop = price - offset (fixed trailing distance)
+    - otherwise: stop = price * row ratio (global ratio when the row has none)
+
+    Rows marked as managed use a trailing-stop strategy (database/strategies.py):
+    their stop is set through set_stop() and apply() neither moves it nor flags breaches for them.
+    '''
+
+    def __init__(
+        self,
+        tickers: Iterable[str],
+        symbol_ids: Iterable[int | None],
+        current: Iterable[float],
+        peak: Iterable[float],
+        stop: Iterable[float],
+        ratio: float,
+        managed: Iterable[bool] | None = None,
+        ratios: Iterable[float | None] | None = None,
+        offsets: Iterable[float | None] | None = None,
+    ) -> None:
+        self.tickers = np.array(list(tickers), dtype=object)
+        self.symbol_ids = np.fromiter(
+            (NO_SYMBOL_ID if sym_id is None else int(sym_id) for sym_id in symbol_ids),
+            dtype=np.int64,
+        )
+        self.current = np.fromiter((float(v) for v in current), dtype=np.float64)
+        self.peak = np.fromiter((float(v) for v in peak), dtype=np.float64)
+        self.stop = np.fromiter((float(v) for v in stop), dtype=np.float64)
+        self.ratio = float(ratio)
+        self.managed = (
+            np.zeros(len(self.tickers), dtype=bool) if managed is None
+            else np.fromiter((bool(m) for m in managed), dtype=bool)
+        )
+        self.ratios = (
+            np.full(len(self.tickers), self.ratio) if ratios is None
+            else np.fromiter((self.ratio if r is None else float(r) for r in ratios), dtype=np.float64)
+        )
+        # NaN: no fixed trailing distance
+        self.offsets = (
+            np.full(len(self.tickers), np.nan) if offsets is None
+            else np.fromiter((np.nan if o is None else float(o) for o in offsets), dtype=np.float64)
+        )
+
+        if not (
+            len(self.tickers) == len(self.symbol_ids) == len(self.current) == len(self.peak) == len(self.stop)
+            == len(self.managed) == len(self.ratios) == len(self.offsets)
+        ):
+            raise RuntimeError("StopLossEngine columns must all have the same length.")
+
+        # ticker -> row position
+        self._index: Dict[str, int] = {ticker: i for i, ticker in enumerate(self.tickers)}
+
+    @classmethod
+    def from_rows(
+        cls,
+        rows: Iterable[Any],
+        ratio: float,
+        managed: Iterable[str] = (),
+        stop_rules: Mapping[str, Tuple[float | None, float | None]] | None = None,
+    ) -> "StopLossEngine":
+        # rows: (ticker, symbol_id, current_value, peak_value, stop_loss_value) tuples or Row objects
+        # managed: tickers whose stop is maintained by a trailing-stop strategy
+        # stop_rules: ticker -> (ratio, absolute offset) for rows that override the global ratio
+        rows = list(rows)
+        managed = set(managed)
+        stop_rules = stop_rules or {}
+        return cls(
+            tickers=(row[0] for row in rows),
+            symbol_ids=(row[1] for row in rows),
+            current=(row[2] for row in rows),
+            peak=(row[3] for row in rows),
+            stop=(row[4] for row in rows),
+            ratio=ratio,
+            managed=(row[0] in managed for row in rows),
+            ratios=(stop_rules.get(row[0], (None, None))[0] for row in rows),
+            offsets=(stop_rules.get(row[0], (None, None))[1] for row in rows),
+        )
+
+    def extend(
+        self,
+        rows: Iterable[Any],
+        managed: Iterable[str] = (),
+        stop_rules: Mapping[str, Tuple[float | None, float | None]] | None = None,
+    ) -> None:
+        # append rows (same shape as from_rows) that are not yet part of the snapshot
+        other = StopLossEngine.from_rows(
+            (row for row in rows if row[0] not in self._index), self.ratio, managed, stop_rules
+        )
+        if not len(other):
+            return
+        offset = len(self)
+        self.tickers = np.concatenate([self.tickers, other.tickers])
+        self.symbol_ids = np.concatenate([self.symbol_ids, other.symbol_ids])
+        self.current = np.concatenate([self.current, other.current])
+        self.peak = np.concatenate([self.peak, other.peak])
+        self.stop = np.concatenate([self.stop, other.stop])
+        self.managed = np.concatenate([self.managed, other.managed])
+        self.ratios = np.concatenate([self.ratios, other.ratios])
+        self.offsets = np.concatenate([self.offsets, other.offsets])
+        for ticker, pos in other._index.items():
+            self._index[ticker] = offset + pos
+
+    def remove(self, ticker: str) -> None:
+        pos = self._index.pop(ticker, None)
+        if pos is None:
+            return
+        keep = np.arange(len(self)) != pos
+        self.tickers = self.tickers[keep]
+        self.symbol_ids = self.symbol_ids[keep]
+        self.current = self.current[keep]
+        self.peak = self.peak[keep]
+        self.stop = self.stop[keep]
+        self.managed = self.managed[keep]
+        self.ratios = self.ratios[keep]
+        self.offsets = self.offsets[keep]
+        self._index = {ticker: i for i, ticker in enumerate(self.tickers)}
+
+    def __len__(self) -> int:
+        return len(self.tickers)
+
+    def __contains__(self, ticker: str) -> bool:
+        return ticker in self._index
+
+    def set_stop(self, ticker: str, stop: float) -> Dict[str, Any] | None:
+        # strategy-managed stop level; returns the row to persist when it changed
+        pos = self._index.get(ticker)
+        if pos is None or self.stop[pos] == stop:
+            return None
+        self.stop[pos] = stop
+        return self._row(pos)
+
+    def symbol_id_of(self, ticker: str) -> int | None:
+        pos = self._index.get(ticker)
+        if pos is None or self.symbol_ids[pos] == NO_SYMBOL_ID:
+            return None
+        return int(self.symbol_ids[pos])
+
+    def apply(self, prices: Mapping[str, float], symbol_ids: Mapping[str, int] | None = None) -> BatchResult:
+        # evaluate a whole quote batch; arrays are updated in place
+        result = BatchResult()
+        symbol_ids = symbol_ids or {}
+
+        positions: List[int] = []
+        values: List[float] = []
+        for ticker, price in prices.items():
+            pos = self._index.get(ticker)
+            if pos is None:
+                result.unknown.append(ticker)
+                continue
+            positions.append(pos)
+            values.append(price)
+
+        if not positions:
+            return result
+
+        idx = np.fromiter(positions, dtype=np.intp, count=len(positions))
+        price_arr = np.fromiter(values, dtype=np.float64, count=len(values))
+        new_ids = np.fromiter(
+            (symbol_ids.get(self.tickers[pos], NO_SYMBOL_ID) for pos in positions),
+            dtype=np.int64,
+            count=len(positions),
+        )
+
+        old_current = self.current[idx]
+        old_peak = self.peak[idx]
+        old_stop = self.stop[idx]
+        old_ids = self.symbol_ids[idx]
+        managed = self.managed[idx]
+
+        # breach check uses the stop-loss value prior to this batch
+        breach_mask = (old_stop > price_arr) & ~managed
+
+        new_peak = np.maximum(old_peak, price_arr)
+        peak_mask = new_peak > old_peak
+        offsets = self.offsets[idx]
+        trailing_stop = np.where(np.isnan(offsets), price_arr * self.ratios[idx], price_arr - offsets)
+        new_stop = np.where(peak_mask & ~managed, trailing_stop, old_stop)
+        merged_ids = np.where(new_ids != NO_SYMBOL_ID, new_ids, old_ids)
+
+        changed_mask = (old_current != price_arr) | peak_mask | (merged_ids != old_ids)
+
+        # write back into the snapshot
+        self.current[idx] = price_arr
+        self.peak[idx] = new_peak
+        self.stop[idx] = new_stop
+        self.symbol_ids[idx] = merged_ids
+
+        result.breached = self.tickers[idx[breach_mask]].tolist()
+
+        changed = np.flatnonzero(changed_mask)
+        result.changed = [
+            self._row(int(idx[i])) for i in changed
+        ]
+        return result
+
+    def _row(self, pos: int) -> Dict[str, Any]:
+        sym_id = int(self.symbol_ids[pos])
+        return {
+            'ticker': self.tickers[pos],
+            'symbol_id': None if sym_id == NO_SYMBOL_ID else sym_id,
+            'current_value': float(self.current[pos]),
+            'peak_value': float(self.peak[pos]),
+            'stop_loss_value': float(self.stop[pos]),
+        }
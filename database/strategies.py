@@ -0,0 +1,190 @@
+import math
+
+from collections import deque
+from dataclasses import dataclass
+from typing import Deque, Tuple
+
+# Purpose: trailing-stop strategies evaluated tick by tick with O(1) (amortized) updates
+# - state lives in memory per tracked stock; nothing is recomputed over history
+# - hold() restores a stored stop after a rebuild so warming up from history never lowers it
+# - configured per Stock row: stop_strategy | strategy_window | strategy_param
+#
+#   stop_strategy   strategy_window               strategy_param
+#   peak (default)  -                             -                    (peak * STOP_LOSS, StopLossEngine)
+#   atr             ATR length in ticks (14)      multiplier (3.0)     stop = peak - multiplier * ATR
+#   rolling_high    window in days (20)           ratio (STOP_LOSS)    stop = highest price in window * ratio
+#   ma_cross        slow MA length in ticks (50)  fast MA length (10)  alert when the fast MA crosses below the slow MA
+
+PEAK = 'peak'
+ATR = 'atr'
+ROLLING_HIGH = 'rolling_high'
+MA_CROSS = 'ma_cross'
+STRATEGIES = (PEAK, ATR, ROLLING_HIGH, MA_CROSS)
+
+DAY_SECONDS = 86400
+
+
+@dataclass
+class StopUpdate:
+    # stop level after this tick (None when the strategy has no level, ie. ma_cross or still warming up)
+    stop: float | None
+    breached: bool
+
+
+class TrailingStop():
+    # base class: update() is called once per checked quote
+
+    # seconds of price history needed to warm the strategy up after a restart
+    lookback: float = 0.0
+
+    def update(self, price: float, ts: float) -> StopUpdate:
+        raise NotImplementedError
+
+    def hold(self, stop: float, ts: float) -> None:
+        # raise the level to at least a stop restored from the database (ie. after a working-set reload)
+        # no-op for strategies without a level
+        pass
+
+
+class ATRStop(TrailingStop):
+    '''
+    Chandelier-style stop: highest price seen minus multiplier * average true range.
+    With tick data the true range is the absolute move between consecutive quotes;
+    the average is a running sum over the last `window` moves.
+    The stop only ever ratchets up.
+    '''
+
+    def __init__(self, window: int = 14, multiplier: float = 3.0, peak: float | None = None, stop: float | None = None) -> None:
+        if window < 1 or multiplier <= 0:
+            raise RuntimeError("ATR stop needs a window of at least 1 and a positive multiplier.")
+        self.window = window
+        self.multiplier = multiplier
+        self.lookback = DAY_SECONDS
+        self.peak = peak
+        self.stop = stop
+        self._ranges: Deque[float] = deque()
+        self._range_sum = 0.0
+        self._last: float | None = None
+
+    def update(self, price: float, ts: float) -> StopUpdate:
+        breached = self.stop is not None and price < self.stop
+
+        if self._last is not None:
+            true_range = abs(price - self._last)
+            self._ranges.append(true_range)
+            self._range_sum += true_range
+            if len(self._ranges) > self.window:
+                self._range_sum -= self._ranges.popleft()
+        self._last = price
+        self.peak = price if self.peak is None else max(self.peak, price)
+
+        if len(self._ranges) == self.window:
+            atr = self._range_sum / self.window
+            candidate = self.peak - self.multiplier * atr
+            self.stop = candidate if self.stop is None else max(self.stop, candidate)
+        return StopUpdate(self.stop, breached)
+
+    def hold(self, stop: float, ts: float) -> None:
+        self.stop = stop if self.stop is None else max(self.stop, stop)
+
+
+class RollingHighStop(TrailingStop):
+    '''
+    stop = ratio * highest price of the last `days` days.
+    Monotonic deque of (ts, price) with decreasing prices: the front is the window maximum,
+    each tick is pushed and popped at most once.
+    '''
+
+    def __init__(self, days: float = 20, ratio: float = 0.9) -> None:
+        if days <= 0 or not 0 < ratio < 1:
+            raise RuntimeError("Rolling-high stop needs a positive window and a ratio between 0 and 1.")
+        self.window = days * DAY_SECONDS
+        self.ratio = ratio
+        self.lookback = self.window
+        self.stop: float | None = None
+        self._highs: Deque[Tuple[float, float]] = deque()
+
+    def update(self, price: float, ts: float) -> StopUpdate:
+        breached = self.stop is not None and price < self.stop
+
+        while self._highs and self._highs[-1][1] <= price:
+            self._highs.pop()
+        self._highs.append((ts, price))
+        while self._highs[0][0] <= ts - self.window:
+            self._highs.popleft()
+
+        self.stop = self._highs[0][1] * self.ratio
+        return StopUpdate(self.stop, breached)
+
+    def hold(self, stop: float, ts: float) -> None:
+        # the restored stop counts as a high seen at ts: it leaves the window like any other
+        if self.stop is not None and self.stop >= stop:
+            return
+        # above every high in the window
+        self._highs.clear()
+        self._highs.append((ts, stop / self.ratio))
+        self.stop = stop
+
+
+class MovingAverageCrossStop(TrailingStop):
+    '''
+    Exit signal when the fast moving average crosses below the slow one.
+    Both averages are running sums over fixed-size deques.
+    '''
+
+    def __init__(self, slow: int = 50, fast: int = 10) -> None:
+        if not 1 <= fast < slow:
+            raise RuntimeError("Moving-average crossover needs 1 <= fast window < slow window.")
+        self.slow = slow
+        self.fast = fast
+        self.lookback = DAY_SECONDS
+        self._prices: Deque[float] = deque()
+        self._slow_sum = 0.0
+        self._fast_sum = 0.0
+        self._fast_above: bool | None = None
+
+    def update(self, price: float, ts: float) -> StopUpdate:
+        self._prices.append(price)
+        self._slow_sum += price
+        self._fast_sum += price
+        if len(self._prices) > self.slow:
+            self._slow_sum -= self._prices.popleft()
+        if len(self._prices) > self.fast:
+            # price leaving the fast window
+            self._fast_sum -= self._prices[-self.fast - 1]
+
+        if len(self._prices) < self.slow:
+            return StopUpdate(None, False)
+
+        fast_above = self._fast_sum / self.fast >= self._slow_sum / self.slow
+        crossed_below = self._fast_above is True and not fast_above
+        self._fast_above = fast_above
+        return StopUpdate(None, crossed_below)
+
+
+def _param(value, default: float) -> float:
+    if value is None:
+        return default
+    value = float(value)
+    return default if math.isnan(value) else value
+
+
+def build_strategy(
+    name: str | None,
+    window: int | None = None,
+    param: float | None = None,
+    default_ratio: float = 0.9,
+    peak: float | None = None,
+    stop: float | None = None,
+) -> TrailingStop | None:
+    # None for the default peak * ratio rule (handled by StopLossEngine)
+    name = (name or PEAK).lower()
+    if name == PEAK:
+        return None
+    if name == ATR:
+        return ATRStop(int(window or 14), _param(param, 3.0), peak = peak, stop = stop)
+    if name == ROLLING_HIGH:
+        return RollingHighStop(float(window or 20), _param(param, default_ratio))
+    if name == MA_CROSS:
+        return MovingAverageCrossStop(int(window or 50), int(_param(param, 10)))
+    raise RuntimeError(f"Unknown stop strategy {name}; expected one of: {', '.join(STRATEGIES)}.")
@@ -0,0 +1,84 @@
+import datetime
+import logging
+
+from database.models import SymbolCache
+from database.db import session_manager
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy import select
+from typing import Dict, Iterable
+
+logger = logging.getLogger(__name__)
+
+# symbol ids rarely change; failed lookups are retried sooner in case the symbol gets listed
+SYMBOL_TTL = datetime.timedelta(days = 7)
+NEGATIVE_TTL = datetime.timedelta(hours = 12)
+
+# SymbolCacheManager:
+# persistent ticker -> Questrade symbol lookup cache, independent of tracked Stock rows
+# so repeated syncs, removed-then-re-added tickers and failed lookups never hit the API twice
+class SymbolCacheManager():
+    def __init__(
+        self,
+        sessionmaker: sessionmaker,
+        ttl: datetime.timedelta = SYMBOL_TTL,
+        negative_ttl: datetime.timedelta = NEGATIVE_TTL,
+    ):
+        self.SessionLocal = sessionmaker
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+
+    def _normalize_ticker(self, ticker: str) -> str:
+        return ticker.strip().upper()
+
+    def _is_fresh(self, entry: SymbolCache, now: datetime.datetime) -> bool:
+        ttl = self.ttl if entry.symbol_id is not None else self.negative_ttl
+        return now - entry.fetched_at < ttl
+
+    def get_many(self, tickers: Iterable[str]) -> Dict[str, SymbolCache]:
+        # returns fresh entries only (including negative entries whose symbol_id is None)
+        tickers = {self._normalize_ticker(ticker) for ticker in tickers}
+        if not tickers:
+            return {}
+
+        now = datetime.datetime.now()
+        with session_manager(self.SessionLocal) as session:
+            entries = session.scalars(
+                select(SymbolCache).where(SymbolCache.ticker.in_(tickers))
+            ).all()
+            return {entry.ticker: entry for entry in entries if self._is_fresh(entry, now)}
+
+    def get_exchanges(self, tickers: Iterable[str]) -> Dict[str, str | None]:
+        # listing exchange per ticker regardless of TTL (a listing exchange does not change with the symbol id)
+        tickers = {self._normalize_ticker(ticker) for ticker in tickers}
+        if not tickers:
+            return {}
+
+        with session_manager(self.SessionLocal) as session:
+            return dict(session.execute(
+                select(SymbolCache.ticker, SymbolCache.listing_exchange)
+                .where(SymbolCache.ticker.in_(tickers))
+            ).all())
+
+    def get(self, ticker: str) -> SymbolCache | None:
+        return self.get_many([ticker]).get(self._normalize_ticker(ticker))
+
+    def put_many(self, entries: Iterable[Dict]) -> None:
+        # entries: dicts with ticker, symbol_id (None for a failed lookup) and optionally listing_exchange/currency
+        now = datetime.datetime.now()
+        with session_manager(self.SessionLocal) as session:
+            for entry in entries:
+                session.merge(SymbolCache(
+                    ticker = self._normalize_ticker(entry['ticker']),
+                    symbol_id = entry.get('symbol_id'),
+                    listing_exchange = entry.get('listing_exchange'),
+                    currency = entry.get('currency'),
+                    fetched_at = now,
+                ))
+
+    def put(self, ticker: str, symbol_id: int | None, listing_exchange: str | None = None, currency: str | None = None) -> None:
+        self.put_many([{
+            'ticker': ticker,
+            'symbol_id': symbol_id,
+            'listing_exchange': listing_exchange,
+            'currency': currency,
+        }])
@@ -1,63 +1,156 @@
 import requests
 import datetime
 import logging
+import threading
 
+from dataclasses import dataclass
 from database.models import Token
 from utils.env_vars import get_settings
 from sqlalchemy.orm import sessionmaker, Session
-from sqlalchemy import exc
+from sqlalchemy import exc, func, select
 from database.db import session_manager
 
 # Purpose: define a manager for Tokens (TokenManager) that provide an interface with models
-# TODO: use logging instead of print; alert user when expired/error; consider abstracting to allow for multiple API tokens
+# - one TokenManager per Questrade login, each with its own row, cache and refresh lock; database/token_pool.py pools them
+# TODO: alert user when expired/error
 
 logger = logging.getLogger(__name__)
 TOKEN_REFRESH_TIMEOUT = 15
+REFRESH_ADDRESS = 'https://login.questrade.com/oauth2/token?grant_type=refresh_token&refresh_token={token}'
+# cached access tokens are treated as stale this long before their real expiry
+CACHE_EXPIRY_MARGIN = datetime.timedelta(seconds = 30)
+# row of the primary login (login None, seeded from the .env refresh_token)
+PRIMARY_TOKEN_ID = 1
 
-# class for managing QTrade refresh and access tokens; automatically refresh tokens
-# interfaces with SQLAlchemy
-class TokenManager():
-    def __init__(self, sessionmaker: sessionmaker):
+
+@dataclass(frozen=True)
+class CachedToken:
+    # decrypted copy of the Token row kept in memory; replaced as a whole so reads need no lock
+    access_token: str
+    api_server: str
+    expiry_date: datetime.datetime
+
+    def is_fresh(self, now: datetime.datetime, margin: datetime.timedelta = CACHE_EXPIRY_MARGIN) -> bool:
+        return now < self.expiry_date - margin
+
+
+class TokenManagerBase():
+    # in-memory token cache and response parsing shared by TokenManager and AsyncTokenManager
+
+    def __init__(self, sessionmaker, login: str | None = None, seed_token: str | None = None) -> None:
         # session will be used to obtain refresh and access tokens
         self.SessionLocal = sessionmaker
+        # None: the primary login (.env refresh_token); otherwise Token.login
+        self.login = login
+        # refresh token used when the login has no row yet
+        self._seed_token = seed_token
+        # primary token keeps id 1; other logins learn their id from the first lookup
+        self._token_id: int | None = PRIMARY_TOKEN_ID if login is None else None
+        # in-process cache: header lookups are served from memory until the token nears expiry
+        self._cached: CachedToken | None = None
+
+    def _cache(self, token: Token) -> None:
+        self._cached = CachedToken(
+            access_token = token.access_token,
+            api_server = token.api_server,
+            expiry_date = token.expiry_date,
+        )
+
+    def invalidate(self) -> None:
+        # drop the cached token (ie. after a 401) so the next lookup reloads it from the database
+        self._cached = None
+
+    def cached_token(self) -> CachedToken | None:
+        # cached token if it can be served from memory, without any I/O; None otherwise
+        cached = self._cached
+        if cached is not None and cached.is_fresh(datetime.datetime.now()):
+            return cached
+        return None
+
+    def cached_access_token(self) -> str | None:
+        cached = self.cached_token()
+        return cached.access_token if cached is not None else None
+
+    def _require_seed(self, settings) -> str:
+        # refresh token for a login without a row: given to the manager, or the .env refresh_token for the primary login
+        if self._seed_token:
+            return self._seed_token
+        if self.login is None:
+            return settings.require_refresh_token()
+        raise RuntimeError(f"No refresh token configured for login {self.login}.")
+
+    def _token_query(self):
+        return select(Token).where(Token.login == self.login)
+
+    def _next_id_query(self):
+        # id for a new login's row; id 1 stays reserved for the primary token
+        return select(func.max(Token.id))
+
+    def _new_token_id(self, max_id: int | None) -> int:
+        return max(max_id or 0, PRIMARY_TOKEN_ID) + 1
+
+    def _token_from_json(self, json_results: dict) -> Token:
+        token = Token(
+            id = self._token_id,
+            login = self.login,
+            access_token = json_results['access_token'], 
+            refresh_token = json_results['refresh_token'], 
+            api_server = json_results['api_server'], 
+            expiry_date = datetime.datetime.now() + datetime.timedelta(seconds = json_results['expires_in'])
+        )
+        
+        return token
+
+
+# class for managing QTrade refresh and access tokens; automatically refresh tokens
+# interfaces with SQLAlchemy
+class TokenManager(TokenManagerBase):
+    def __init__(self, sessionmaker: sessionmaker, login: str | None = None, seed_token: str | None = None):
+        super().__init__(sessionmaker, login, seed_token)
+        # single-flight: refresh tokens are one-time-use so only one refresh may run at a time
+        self._refresh_lock = threading.Lock()
 
-        # only used for initialization
-        self._check_token()
+        # only used for initialization: a bad .env refresh_token fails at startup
+        # pooled logins are seeded on first use instead, where TokenPool sets a failing one aside
+        if login is None:
+            self._check_token()
     
     # will raise an error if None or multiple Tokens found in db
     def _get_token(self, session: Session) -> Token:
         # helper function to avoid detached instance errors: fetch token from database and load into given session
-        # token is unique (primary key id = 1)
-        token = session.get(Token, 1)
+        # one row per login (the primary token is id = 1)
+        if self._token_id is not None:
+            token = session.get(Token, self._token_id)
+        else:
+            token = session.scalar(self._token_query())
         if not token:
             raise exc.NoResultFound
-        
+
+        self._token_id = token.id
         return token
 
     # checks if token exists in DB; if a token does not exist, use environment variable to refresh one into db
     def _check_token(self):
         with session_manager(self.SessionLocal) as session:
-            # each time a new token is refreshed token will be stored on id of 1: overwritten for each new refresh
+            # each time a new token is refreshed it overwrites the login's row
             
-            # thus only one token should be in the database
-            try:
-                result = self._get_token(session)
-            except exc.NoResultFound:
-                # exception will occur if no token was in db
-                # no token in database: grab from environment variable (likely expired)
-                # will need to check for expiry separately
-                self._refresh_tokens(session, rf_token=get_settings().require_refresh_token())
-            except:
-                raise
-                
+            # thus only one token per login should be in the database
+            self._load_token(session)
+
+    def _load_token(self, session: Session) -> Token:
+        try:
+            return self._get_token(session)
+        except exc.NoResultFound:
+            # exception will occur if no token was in db
+            # no token in database: grab from environment variable or the login's seed token (likely expired)
+            # will need to check for expiry separately
+            return self._refresh_tokens(session, rf_token=self._require_seed(get_settings()))
 
     # will overwrite existing token row or add row if none exist
     # does not check for expiry logic!
     def _refresh_tokens(self, session: Session, rf_token = None):
         # session can be passed to refresh_tokens to ensure that transactions completed in refresh_tokens remain consistent with parent function
 
-        REFRESH_ADDRESS = 'https://login.questrade.com/oauth2/token?grant_type=refresh_token&refresh_token={token}'
-
         token_to_use = rf_token or self.get_refresh_token()
         if not token_to_use:
             raise RuntimeError("No refresh token available.")
@@ -81,6 +174,9 @@ class TokenManager():
             # implement logic to notify user via SMS/Email later
 
 
+        if self._token_id is None:
+            # first token of a new login
+            self._token_id = self._new_token_id(session.scalar(self._next_id_query()))
         parsed_token = self._parse_result(result)
         # parse_result returns a Token object to be commited to session
 
@@ -88,30 +184,58 @@ class TokenManager():
         # session_manager will automatically commit
 
     def get_api_server(self):
+        cached = self._cached
+        if cached is not None:
+            return cached.api_server
+
         with session_manager(self.SessionLocal) as session:
-            token:Token = session.get(Token, 1)
-            if not token:
+            try:
+                token:Token = self._get_token(session)
+            except exc.NoResultFound:
                 raise RuntimeError('No token found.')
             
             return token.api_server
         
     
+    def _ensure_token(self, margin: datetime.timedelta) -> CachedToken:
+        # loads the token and refreshes it when it expires within margin
+        # callers queue on the lock; whoever runs after a refresh reuses its result instead of refreshing again
+        with self._refresh_lock:
+            now = datetime.datetime.now()
+            cached = self._cached
+            if cached is not None and cached.is_fresh(now, margin):
+                return cached
+
+            with session_manager(self.SessionLocal) as session:
+                token = self._load_token(session)
+
+                # check for expiry
+                if now >= token.expiry_date - margin:
+                    # access token is expired or about to be: attempt to refresh
+                    logger.info(f"Attempting refresh: access token expires on: {token.expiry_date}")
+                    
+                    token = self._refresh_tokens(session, rf_token=token.refresh_token)
+
+                self._cache(token)
+                return self._cached
+
     def get_access_token(self):
         # every retrieval of the token should check for expiry 
+        # served from memory while the cached token is not near expiry: no database access or decryption
+        access_token = self.cached_access_token()
+        if access_token is not None:
+            return access_token
 
-        with session_manager(self.SessionLocal) as session:
-            token = self._get_token(session)
+        return self._ensure_token(CACHE_EXPIRY_MARGIN).access_token
 
-            # check for expiry
-            if datetime.datetime.now() >= token.expiry_date:
-                # access token is expired: attempt to refresh
-                logger.info(f"Attempting refresh: access token was expired on: {token.expiry_date}") # for testing purposes
-                
-                token = self._refresh_tokens(session, rf_token=token.refresh_token)
-                
-                
-        
-            return token.access_token 
+    def refresh_if_needed(self, margin: datetime.timedelta) -> CachedToken:
+        # proactive refresh used by the background refresher: renews the token once it is within margin of expiry
+        return self._ensure_token(max(margin, CACHE_EXPIRY_MARGIN))
+
+    def seconds_until_refresh(self, margin: datetime.timedelta) -> float:
+        # time left before the cached token enters the refresh margin
+        cached = self._cached or self._ensure_token(CACHE_EXPIRY_MARGIN)
+        return (cached.expiry_date - max(margin, CACHE_EXPIRY_MARGIN) - datetime.datetime.now()).total_seconds()
     
     def get_refresh_token(self):
         with session_manager(self.SessionLocal) as session:
@@ -121,17 +245,7 @@ class TokenManager():
 
 
     def _parse_result(self, result) -> Token:
-        json_results = result.json()
-
-        token = Token(
-            id = 1, # primary key: always 1 
-            access_token = json_results['access_token'], 
-            refresh_token = json_results['refresh_token'], 
-            api_server = json_results['api_server'], 
-            expiry_date = datetime.datetime.now() + datetime.timedelta(seconds = json_results['expires_in'])
-        )
-        
-        return token
+        return self._token_from_json(result.json())
 
 ''' Depreciated methods:
 
@@ -0,0 +1,221 @@
+import asyncio
+import datetime
+import logging
+import threading
+import time
+
+import aiohttp
+import requests
+
+from dataclasses import dataclass
+from database.async_db import call_db
+from database.token_manager import TokenManagerBase
+from sqlalchemy import exc
+from typing import Callable, Dict, List, Sequence
+from utils.env_vars import get_settings
+
+# Purpose: pool of Questrade tokens keyed by login
+# - every login keeps its own TokenManager: row, cache, single-flight refresh and api_server
+# - read-only market-data calls take the next usable login in round-robin order, so each login's
+#   rate budget (tracking/rate_limit.py buckets per login) adds up
+# - a login whose token cannot be loaded or refreshed, or that keeps getting 401s, is set aside
+#   for TOKEN_REVOKED_RETRY seconds while the others keep serving requests; the last usable login is never
+#   set aside, so a single-login pool fails exactly like a lone TokenManager
+# - account calls and streaming stay on the primary login (QTradeBase.token)
+
+logger = logging.getLogger(__name__)
+
+# consecutive 401 responses after which a login is set aside
+UNAUTHORIZED_STRIKES = 2
+
+# failures that make a login unusable for a while (refresh rejected, network errors, missing row or seed)
+TOKEN_ERRORS = (requests.RequestException, aiohttp.ClientError, asyncio.TimeoutError, exc.NoResultFound, RuntimeError)
+
+
+@dataclass(frozen=True)
+class TokenLease:
+    # credentials for one request; login None is the primary token
+    login: str | None
+    access_token: str
+    api_server: str
+
+    @property
+    def header(self) -> Dict[str, str]:
+        return {'Authorization': f"Bearer {self.access_token}"}
+
+
+class TokenPoolBase():
+    # round-robin and revocation bookkeeping shared by TokenPool and AsyncTokenPool
+
+    def __init__(
+        self,
+        managers: Sequence[TokenManagerBase],
+        revoked_retry: float | None = None,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        if not managers:
+            raise RuntimeError("A token pool needs at least one token manager.")
+        # login -> manager; the first one is the primary token
+        self.managers: Dict[str | None, TokenManagerBase] = {manager.login: manager for manager in managers}
+        self._order: List[str | None] = list(self.managers)
+        self._next = 0
+        self.revoked_retry = get_settings().token_revoked_retry if revoked_retry is None else revoked_retry
+        self._clock = clock
+        # login -> monotonic time before which it is not used
+        self._revoked: Dict[str | None, float] = {}
+        self._strikes: Dict[str | None, int] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_settings(cls, primary: TokenManagerBase, factory: Callable[[str, str], TokenManagerBase], **kwargs) -> "TokenPoolBase":
+        # primary plus one manager per QUESTRADE_LOGINS entry; factory(login, seed refresh token) builds a manager
+        logins = get_settings().questrade_logins
+        return cls([primary, *(factory(login, seed) for login, seed in logins.items())], **kwargs)
+
+    @property
+    def primary(self) -> TokenManagerBase:
+        return self.managers[self._order[0]]
+
+    def available(self) -> List[str | None]:
+        # usable logins, starting with the next one in round-robin order
+        now = self._clock()
+        with self._lock:
+            order = self._order[self._next:] + self._order[:self._next]
+            return [login for login in order if self._revoked.get(login, 0.0) <= now]
+
+    def _take(self, login: str | None) -> None:
+        with self._lock:
+            self._next = (self._order.index(login) + 1) % len(self._order)
+
+    def _cached_lease(self, login: str | None) -> TokenLease | None:
+        cached = self.managers[login].cached_token()
+        if cached is None:
+            return None
+        return TokenLease(login, cached.access_token, cached.api_server)
+
+    def _none_usable(self) -> RuntimeError:
+        return RuntimeError(f"No usable Questrade token: {len(self._order)} login(s) revoked or failing.")
+
+    def mark_revoked(self, login: str | None, error: BaseException | str) -> None:
+        logger.error(f"Token for login {login or 'primary'} is unusable ({error!r}); retrying in {self.revoked_retry:.0f}s")
+        with self._lock:
+            self._revoked[login] = self._clock() + self.revoked_retry
+            self._strikes.pop(login, None)
+        self.managers[login].invalidate()
+
+    def _set_aside(self, login: str | None, error: BaseException | str) -> bool:
+        # False for the last usable login: the caller re-raises instead
+        if self.available() == [login]:
+            return False
+        self.mark_revoked(login, error)
+        return True
+
+    def _restore(self, login: str | None) -> None:
+        if login in self._revoked:
+            logger.info(f"Token for login {login or 'primary'} is usable again")
+            with self._lock:
+                self._revoked.pop(login, None)
+
+    def unauthorized(self, login: str | None) -> None:
+        # a 401: reload the token; repeated 401s mean the token was revoked
+        with self._lock:
+            strikes = self._strikes[login] = self._strikes.get(login, 0) + 1
+        if strikes < UNAUTHORIZED_STRIKES or not self._set_aside(login, "repeated 401 responses"):
+            self.managers[login].invalidate()
+
+    def ok(self, login: str | None) -> None:
+        if self._strikes:
+            with self._lock:
+                self._strikes.pop(login, None)
+
+    def _min_delay(self, delays: Dict[str | None, float]) -> float:
+        # next refresh, or the end of a wait after which a set aside login is retried
+        now = self._clock()
+        waits = [until - now for until in self._revoked.values() if until > now]
+        return min([*delays.values(), *waits], default = self.revoked_retry)
+
+
+class TokenPool(TokenPoolBase):
+    def lease(self) -> TokenLease:
+        # next usable login's token; a login that fails to load or refresh is set aside and the next one is tried
+        for login in self.available():
+            lease = self._cached_lease(login)
+            if lease is None:
+                manager = self.managers[login]
+                try:
+                    get_api_server = manager.get_api_server
+                    access_token = manager.get_access_token()
+                    api_server = get_api_server() if callable(get_api_server) else get_api_server
+                except TOKEN_ERRORS as e:
+                    if not self._set_aside(login, e):
+                        raise
+                    continue
+                lease = TokenLease(login, access_token, api_server)
+                self._restore(login)
+            self._take(login)
+            return lease
+        raise self._none_usable()
+
+    def refresh_if_needed(self, margin: datetime.timedelta) -> None:
+        # proactive refresh of every usable login (tracking.scheduler.schedule_token_refresh)
+        # set aside logins are retried here once their wait is over
+        for login in self.available():
+            try:
+                self.managers[login].refresh_if_needed(margin)
+            except TOKEN_ERRORS as e:
+                if not self._set_aside(login, e):
+                    raise
+                continue
+            self._restore(login)
+
+    def seconds_until_refresh(self, margin: datetime.timedelta) -> float:
+        delays = {}
+        for login in self.available():
+            try:
+                delays[login] = self.managers[login].seconds_until_refresh(margin)
+            except TOKEN_ERRORS as e:
+                if not self._set_aside(login, e):
+                    raise
+        return self._min_delay(delays)
+
+
+class AsyncTokenPool(TokenPoolBase):
+    # same pool for AsyncQTradeAPI; manager methods are awaited when async and moved to a thread otherwise (call_db)
+
+    async def lease(self) -> TokenLease:
+        for login in self.available():
+            lease = self._cached_lease(login)
+            if lease is None:
+                manager = self.managers[login]
+                try:
+                    access_token = await call_db(manager.get_access_token)
+                    api_server = await call_db(manager.get_api_server)
+                except TOKEN_ERRORS as e:
+                    if not self._set_aside(login, e):
+                        raise
+                    continue
+                lease = TokenLease(login, access_token, api_server)
+                self._restore(login)
+            self._take(login)
+            return lease
+        raise self._none_usable()
+
+    async def refresh_if_needed(self, margin: datetime.timedelta) -> None:
+        for login in self.available():
+            try:
+                await call_db(self.managers[login].refresh_if_needed, margin)
+            except TOKEN_ERRORS as e:
+                if not self._set_aside(login, e):
+                    raise
+                continue
+            self._restore(login)
+
+    async def seconds_until_refresh(self, margin: datetime.timedelta) -> float:
+        delays = {}
+        for login in self.available():
+            try:
+                delays[login] = await call_db(self.managers[login].seconds_until_refresh, margin)
+            except TOKEN_ERRORS as e:
+                if not self._set_aside(login, e):
+                    raise
+        return self._min_delay(delays)
@@ -0,0 +1,134 @@
+import asyncio
+import logging
+import threading
+import time
+
+from dataclasses import dataclass
+from database.async_db import async_session_manager
+from database.db import session_manager
+from sqlalchemy import update
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from sqlalchemy.orm import sessionmaker
+from typing import Any, Callable, Dict, Iterable
+
+logger = logging.getLogger(__name__)
+
+# flush once this many distinct rows are dirty, or once the oldest dirty row is this old (seconds)
+DEFAULT_MAX_ROWS = 500
+DEFAULT_MAX_DELAY = 30.0
+
+
+@dataclass
+class WriteBufferStats:
+    rows_buffered: int = 0
+    rows_written: int = 0
+    flushes: int = 0
+
+
+class WriteBufferBase():
+    '''
+    Write-coalescing buffer for bulk UPDATEs by primary key.
+
+    Dirty rows are kept per primary key (a newer row replaces an older pending one), so a
+    ticker updated on every cycle is written once per flush. flush() writes every pending
+    row with a single executemany in one transaction: WriteBuffer on a Session,
+    AsyncWriteBuffer (awaitable flush) on an AsyncSession.
+    '''
+
+    def __init__(
+        self,
+        sessionmaker: sessionmaker | async_sessionmaker,
+        model: Any,
+        key: str,
+        max_rows: int = DEFAULT_MAX_ROWS,
+        max_delay: float = DEFAULT_MAX_DELAY,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.SessionLocal = sessionmaker
+        self.model = model
+        self.key = key
+        self.max_rows = max_rows
+        self.max_delay = max_delay
+        self._clock = clock
+        self._pending: Dict[Any, Dict[str, Any]] = {}
+        self._oldest: float | None = None
+        # guards the pending rows; each subclass keeps its flushes from overlapping
+        self._lock = threading.Lock()
+        self.stats = WriteBufferStats()
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def add(self, rows: Iterable[Dict[str, Any]]) -> None:
+        with self._lock:
+            for row in rows:
+                self._pending[row[self.key]] = row
+                self.stats.rows_buffered += 1
+            if self._pending and self._oldest is None:
+                self._oldest = self._clock()
+
+    def discard(self, key: Any) -> None:
+        with self._lock:
+            self._pending.pop(key, None)
+
+    def due(self) -> bool:
+        oldest = self._oldest
+        return len(self._pending) >= self.max_rows or (
+            oldest is not None and self._clock() - oldest >= self.max_delay
+        )
+
+    def _take(self) -> list[Dict[str, Any]]:
+        with self._lock:
+            return list(self._pending.values())
+
+    def _written(self, rows: list[Dict[str, Any]]) -> None:
+        # only cleared once written: a failed flush keeps the rows for the next attempt
+        # rows replaced while the write was in flight stay pending
+        with self._lock:
+            for row in rows:
+                if self._pending.get(row[self.key]) is row:
+                    del self._pending[row[self.key]]
+            # rows left over were replaced during the write: their age counts from now, so due() does not stay true
+            self._oldest = self._clock() if self._pending else None
+            self.stats.rows_written += len(rows)
+            self.stats.flushes += 1
+
+
+class WriteBuffer(WriteBufferBase):
+    def __init__(self, sessionmaker: sessionmaker, *args, **kwargs) -> None:
+        super().__init__(sessionmaker, *args, **kwargs)
+        self._flush_lock = threading.Lock()
+
+    def flush(self) -> int:
+        # returns the number of rows written
+        with self._flush_lock:
+            rows = self._take()
+            if not rows:
+                return 0
+
+            with session_manager(self.SessionLocal) as session:
+                # bulk UPDATE by primary key: emitted as one executemany
+                session.execute(update(self.model), rows)
+
+            self._written(rows)
+            return len(rows)
+
+
+class AsyncWriteBuffer(WriteBufferBase):
+    # flushed through an AsyncSession (see database/async_db.py); not a WriteBuffer, whose flush() is synchronous
+
+    def __init__(self, sessionmaker: async_sessionmaker, *args, **kwargs) -> None:
+        super().__init__(sessionmaker, *args, **kwargs)
+        self._flush_lock = asyncio.Lock()
+
+    async def flush(self) -> int:
+        async with self._flush_lock:
+            rows = self._take()
+            if not rows:
+                return 0
+
+            async with async_session_manager(self.SessionLocal) as session:
+                await session.execute(update(self.model), rows)
+
+            self._written(rows)
+            return len(rows)
@@ -2,9 +2,15 @@ import atexit
 import asyncio
 import logging
 
+from alerts.email_utils import close_smtp_pools
+from alerts.http_client import close_async_http_sessions, close_http_session
+from database.async_db import async_engine, async_session_maker
 from database.db import session_maker, init_db
-from tracking.api import QTradeAPI
-from tracking.scheduler import schedule_alert, schedule_checks
+from database.price_history import PriceHistory
+from tracking.alert_queue import AlertQueue
+from tracking.async_api import AsyncQTradeAPI, call_db
+from tracking.stream import QuoteStream
+from tracking.scheduler import schedule_alert, schedule_checks, schedule_market_checks, schedule_outbox, schedule_token_refresh
 from utils.env_vars import get_settings
 
 logging.basicConfig(
@@ -20,11 +26,41 @@ def exit_msg():
     logger.info("Program exited!")
 
 async def main():
-    api = QTradeAPI(sessionmaker = session_maker)
-    check_task = asyncio.create_task(schedule_checks(api))
-    alert_task = asyncio.create_task(schedule_alert(api))
+    settings = get_settings()
+    # stock and token database work runs on the event loop (aiosqlite)
+    api = AsyncQTradeAPI(sessionmaker = session_maker, async_sessionmaker = async_session_maker)
+    if settings.price_history:
+        # keep every checked quote as a tick outside bot.db
+        api.stocks.history = PriceHistory(settings.price_history_dir)
+    if settings.quote_mode == "stream":
+        # live quotes over WebSocket; coalesced prices are checked every few seconds
+        stream = QuoteStream(api, flush_interval = settings.stream_flush_interval)
+        check_task = asyncio.create_task(stream.run())
+    elif settings.quote_mode == "market":
+        # polls only while tracked exchanges are in session
+        check_task = asyncio.create_task(schedule_market_checks(api))
+    else:
+        check_task = asyncio.create_task(schedule_checks(api))
+    if settings.alert_mode == "daily":
+        alert_task = asyncio.create_task(schedule_alert(api))
+    else:
+        # breaches are dispatched within seconds (or per digest window) as check_stocks flags them
+        window = settings.alert_digest_window if settings.alert_mode == "digest" else None
+        alert_task = asyncio.create_task(AlertQueue(api, digest_window = window).run())
+    refresh_task = asyncio.create_task(schedule_token_refresh(api))
+    outbox_task = asyncio.create_task(schedule_outbox(api))
 
-    await asyncio.gather(check_task, alert_task)
+    try:
+        await asyncio.gather(check_task, alert_task, refresh_task, outbox_task)
+    finally:
+        # write buffered stock updates before exiting
+        await call_db(api.stocks.flush)
+        # release pooled keep-alive connections
+        await api.close()
+        await asyncio.to_thread(close_smtp_pools)
+        close_http_session()
+        await close_async_http_sessions()
+        await async_engine.dispose()
 
 if __name__ == "__main__":
     try:
@@ -6,18 +6,28 @@ tests generated using genAI
 import pytest
 import logging
 
+from contextlib import contextmanager
 from unittest.mock import patch, MagicMock
 
 from alerts.handler import Alerts, AlertConfig
-from alerts.email_utils import EmailAlert
+from alerts.email_utils import EmailAlert, close_smtp_pools, get_smtp_pool
 from alerts.discord_utils import DiscordAlert
 from alerts.push_utils import NTFYAlert
 
 
 
+@contextmanager
+def patch_post():
+    # webhook channels post through the shared session in alerts.http_client
+    with patch("alerts.http_client.http_session") as session:
+        yield session.return_value.post
+
+
 @pytest.fixture
 def email_alert():
-    return EmailAlert()
+    yield EmailAlert()
+    # pooled SMTP sessions are shared per account: don't leak mocks into the next test
+    close_smtp_pools()
 
 @pytest.fixture
 def discord_alert():
@@ -35,8 +45,7 @@ def test_email_send_success(email_alert):
     email_alert.configure("user@test.com", "password", "smtp.test.com", 587)
 
     with patch("smtplib.SMTP") as mock_smtp:
-        mock_server = MagicMock()
-        mock_smtp.return_value.__enter__.return_value = mock_server
+        mock_server = mock_smtp.return_value
 
         result = email_alert.send_msg("hello", "to@test.com", "subject")
 
@@ -57,6 +66,66 @@ def test_email_send_failure(email_alert, caplog):
     assert "Error Occurred" in caplog.text
 
 
+def test_email_reuses_pooled_session(email_alert):
+    email_alert.configure("user@test.com", "password", "smtp.test.com", 587)
+
+    with patch("smtplib.SMTP") as mock_smtp:
+        mock_server = mock_smtp.return_value
+        mock_server.noop.return_value = (250, b"OK")
+
+        assert email_alert.send_msg("one", "to@test.com", "subject")
+        # a second EmailAlert for the same account shares the pool
+        assert _configured().send_msg("two", "to@test.com", "subject")
+
+    # one handshake for both messages; the second send health-checked the idle session
+    mock_smtp.assert_called_once()
+    mock_server.login.assert_called_once()
+    mock_server.noop.assert_called_once()
+    assert mock_server.send_message.call_count == 2
+
+
+def test_email_pool_replaces_dead_and_expired_sessions(email_alert):
+    email_alert.configure("user@test.com", "password", "smtp.test.com", 587)
+
+    with patch("smtplib.SMTP") as mock_smtp:
+        dead, fresh, newest = MagicMock(), MagicMock(), MagicMock()
+        dead.noop.return_value = (421, b"closing")
+        mock_smtp.side_effect = [dead, fresh, newest]
+
+        assert email_alert.send_msg("one", "to@test.com", "subject")
+        # NOOP fails: reconnect
+        assert email_alert.send_msg("two", "to@test.com", "subject")
+        dead.quit.assert_called_once()
+
+        # idle too long: closed without a NOOP
+        get_smtp_pool("smtp.test.com", 587, "user@test.com", "password").idle_timeout = 0
+        assert email_alert.send_msg("three", "to@test.com", "subject")
+
+    fresh.noop.assert_not_called()
+    fresh.quit.assert_called_once()
+    assert newest.send_message.call_count == 1
+
+
+def test_email_send_batch_over_one_session(email_alert):
+    import smtplib
+
+    email_alert.configure("user@test.com", "password", "smtp.test.com", 587)
+
+    with patch("smtplib.SMTP") as mock_smtp:
+        mock_server = mock_smtp.return_value
+        mock_server.send_message.side_effect = [None, smtplib.SMTPRecipientsRefused({}), None]
+
+        results = email_alert.send_batch([
+            ("a", "one@test.com", "s"),
+            ("b", "bad@test.com", "s"),
+            ("c", "three@test.com", "s"),
+        ])
+
+    assert results == [True, False, True]
+    mock_smtp.assert_called_once()
+    mock_server.login.assert_called_once()
+
+
 def test_email_send_not_configured(email_alert, caplog):
     with caplog.at_level(logging.ERROR):
         result = email_alert.send_msg("hello", "to@test.com", "subject")
@@ -65,13 +134,19 @@ def test_email_send_not_configured(email_alert, caplog):
     assert "not yet configured" in caplog.text
 
 
+def _configured():
+    alert = EmailAlert()
+    alert.configure("user@test.com", "password", "smtp.test.com", 587)
+    return alert
+
+
 # -------------------------
 # DiscordAlert tests
 # -------------------------
 def test_discord_send_success(discord_alert):
     discord_alert.configure("https://discord.test/webhook")
 
-    with patch("requests.post") as mock_post:
+    with patch_post() as mock_post:
         mock_post.return_value.status_code = 204
         result = discord_alert.send_msg("test msg")
 
@@ -82,7 +157,7 @@ def test_discord_send_success(discord_alert):
 def test_discord_send_failure(discord_alert):
     discord_alert.configure("https://discord.test/webhook")
 
-    with patch("requests.post") as mock_post:
+    with patch_post() as mock_post:
         mock_post.return_value.status_code = 400
         result = discord_alert.send_msg("test msg")
 
@@ -103,7 +178,7 @@ def test_discord_not_configured(discord_alert, caplog):
 def test_ntfy_send_success(ntfy_alert):
     ntfy_alert.configure("mytopic")
 
-    with patch("requests.post") as mock_post:
+    with patch_post() as mock_post:
         mock_post.return_value.ok = True
         result = ntfy_alert.send_msg("hello", "recipient", "subject")
 
@@ -114,7 +189,7 @@ def test_ntfy_send_success(ntfy_alert):
 def test_ntfy_send_failure(ntfy_alert):
     ntfy_alert.configure("mytopic")
 
-    with patch("requests.post") as mock_post:
+    with patch_post() as mock_post:
         mock_post.return_value.ok = False
         result = ntfy_alert.send_msg("hello", "recipient", "subject")
 
@@ -150,3 +225,264 @@ def test_alerts_send_all_channels(monkeypatch):
     monkeypatch.setattr(alerts.push, "send_msg", lambda *a, **kw: True)
 
     alerts.send_msg("msg", "to@test.com", "subject")
+
+
+def _all_channels_config(**kwargs):
+    return AlertConfig(
+        email_provider="gmail",
+        email_username="user@test.com",
+        email_password="pass",
+        email_host="smtp.test.com",
+        email_port=587,
+        ntfy_topic="mytopic",
+        discord_webhook_url="https://discord.test/webhook",
+        **kwargs,
+    )
+
+
+def test_alerts_returns_result_per_channel(monkeypatch):
+    alerts = Alerts()
+    alerts.set_config(_all_channels_config())
+
+    def boom(*a, **kw):
+        raise ConnectionError("down")
+
+    monkeypatch.setattr(alerts.email, "send_msg", lambda *a, **kw: False)
+    monkeypatch.setattr(alerts.discord, "send_msg", boom)
+    monkeypatch.setattr(alerts.push, "send_msg", lambda *a, **kw: True)
+
+    results = alerts.send_msg("msg", "to@test.com", "subject")
+
+    assert set(results) == {"email", "discord", "push"}
+    assert results["push"].ok and results["push"].error is None
+    assert not results["email"].ok and results["email"].error == "failed"
+    assert not results["discord"].ok and "down" in results["discord"].error
+
+
+def test_alerts_slow_channel_does_not_hold_back_others(monkeypatch):
+    import threading
+    import time
+
+    alerts = Alerts()
+    alerts.set_config(_all_channels_config(timeouts={"email": 0.2, "discord": 5, "push": 5}))
+
+    release = threading.Event()
+    sent_at = {}
+    start = time.monotonic()
+
+    def slow_email(*a, **kw):
+        release.wait(5)
+        return True
+
+    def fast(channel):
+        def send(*a, **kw):
+            sent_at[channel] = time.monotonic() - start
+            return True
+        return send
+
+    monkeypatch.setattr(alerts.email, "send_msg", slow_email)
+    monkeypatch.setattr(alerts.discord, "send_msg", fast("discord"))
+    monkeypatch.setattr(alerts.push, "send_msg", fast("push"))
+
+    try:
+        results = alerts.send_msg("msg", "to@test.com", "subject")
+        elapsed = time.monotonic() - start
+    finally:
+        release.set()
+
+    assert results["email"].error == "timeout"
+    assert results["discord"].ok and results["push"].ok
+    # the other channels went out while email was still blocked
+    assert max(sent_at.values()) < 0.2
+    assert elapsed < 1
+
+
+def test_alerts_send_msg_async_times_out_per_channel(monkeypatch):
+    import asyncio
+
+    alerts = Alerts()
+    alerts.set_config(AlertConfig(ntfy_topic="mytopic", discord_webhook_url="https://discord.test/webhook",
+                                  timeouts={"push": 0.1, "discord": 5}))
+
+    async def hung(*a, **kw):
+        await asyncio.sleep(5)
+
+    async def sent(*a, **kw):
+        return True
+
+    # webhook channels send natively on the loop
+    monkeypatch.setattr(alerts.push, "send_msg_async", hung)
+    monkeypatch.setattr(alerts.discord, "send_msg_async", sent)
+
+    results = asyncio.run(alerts.send_msg_async("msg", None, "subject"))
+
+    assert set(results) == {"push", "discord"}
+    assert results["push"].error == "timeout"
+    assert results["discord"].ok
+
+
+def test_per_user_alerts_keep_their_own_destinations():
+    base = Alerts()
+    base.set_config(AlertConfig())
+    alice = base.with_config(base.config.for_user(None, None, "https://discord.test/alice"))
+    bob = base.with_config(base.config.for_user(None, None, "https://discord.test/bob"))
+
+    # alice's send is still queued when bob's channels are configured
+    [(_, alice_send, _)] = alice._channel_sends({"discord": "for alice"}, None, "subject")
+    bob._channel_sends({"discord": "for bob"}, None, "subject")
+
+    with patch_post() as mock_post:
+        mock_post.return_value.status_code = 204
+        assert alice_send()
+
+    assert mock_post.call_args.args[0] == "https://discord.test/alice"
+
+
+def test_channel_timeout_reaches_requests(discord_alert):
+    discord_alert.configure("https://discord.test/webhook")
+    discord_alert.timeout = 3
+
+    with patch_post() as mock_post:
+        mock_post.return_value.status_code = 204
+        assert discord_alert.send_msg("hi")
+
+    assert mock_post.call_args.kwargs["timeout"] == 3
+
+
+# -------------------------
+# Digest builder
+# -------------------------
+def test_digest_chunks_to_channel_limits():
+    from alerts.digest import Breach, DigestBuilder
+
+    breaches = [Breach(f"TICK{i:03d}", 123.45, 111.11) for i in range(300)]
+    digest = DigestBuilder().build(breaches, ["discord", "push", "email"])
+
+    for channel, limit in (("discord", 2000), ("push", 4096)):
+        chunks = digest[channel]
+        assert len(chunks) > 1
+        assert all(len(c.message.text.encode()) <= limit for c in chunks)
+        # every breach lands in exactly one chunk, in order
+        assert [pos for c in chunks for pos in c.items] == list(range(300))
+        assert chunks[0].message.text.startswith(f"Stop-loss Alert! (1/{len(chunks)})")
+
+    assert len(digest["email"]) == 1
+    assert "TICK000 ($123.45) has reached stop-loss threshold of $111.11" in digest["email"][0].message.text
+    assert digest["discord"][0].message.embed["description"].startswith("**TICK000**")
+
+
+def test_digest_renders_each_breach_once():
+    from alerts.digest import Breach, DigestBuilder
+
+    builder = DigestBuilder()
+    breach = Breach("A&B", 1, 2)
+    builder.build([breach], ["email"])
+    builder.build([breach], ["discord"])
+
+    assert list(builder._lines) == [breach]
+    assert "<td>A&amp;B</td>" in builder.lines(breach)[1]
+
+
+def test_discord_sends_embed(discord_alert):
+    discord_alert.configure("https://discord.test/webhook")
+    embed = {"title": "Stop-loss Alert!", "description": "**MSFT** $150"}
+
+    with patch_post() as mock_post:
+        mock_post.return_value.status_code = 204
+        assert discord_alert.send_msg("text", embed=embed)
+
+    assert mock_post.call_args.kwargs["json"] == {"embeds": [embed]}
+
+
+def test_email_includes_html_alternative(email_alert):
+    email_alert.configure("user@test.com", "password", "smtp.test.com", 587)
+
+    with patch("smtplib.SMTP") as mock_smtp:
+        assert email_alert.send_msg("plain", "to@test.com", "subject", html="<b>rich</b>")
+
+    mail = mock_smtp.return_value.send_message.call_args.args[0]
+    assert mail.get_body(("html",)).get_content().strip() == "<b>rich</b>"
+    assert mail.get_body(("plain",)).get_content().strip() == "plain"
+
+
+# -------------------------
+# Pooled webhook client
+# -------------------------
+def _response(status, headers=None, body=None):
+    response = MagicMock()
+    response.status_code = status
+    response.ok = status < 400
+    response.headers = headers or {}
+    response.json.return_value = body
+    return response
+
+
+def test_discord_retries_after_rate_limit(discord_alert, monkeypatch):
+    slept = []
+    monkeypatch.setattr("alerts.http_client.time.sleep", slept.append)
+    discord_alert.configure("https://discord.test/webhook")
+    discord_alert.timeout = 5
+
+    with patch_post() as mock_post:
+        mock_post.side_effect = [_response(429, body={"retry_after": 0.25}), _response(204)]
+        assert discord_alert.send_msg("hi")
+
+    assert slept == [0.25]
+    assert mock_post.call_count == 2
+    assert mock_post.call_args.kwargs["timeout"] == 5
+
+
+def test_rate_limit_longer_than_timeout_is_not_waited_for(discord_alert, monkeypatch):
+    slept = []
+    monkeypatch.setattr("alerts.http_client.time.sleep", slept.append)
+    discord_alert.configure("https://discord.test/webhook")
+    discord_alert.timeout = 1
+
+    with patch_post() as mock_post:
+        mock_post.return_value = _response(429, headers={"Retry-After": "30"})
+        assert not discord_alert.send_msg("hi")
+
+    assert slept == []
+    mock_post.assert_called_once()
+
+
+def test_ntfy_uses_configured_base_url(ntfy_alert):
+    ntfy_alert.configure("mytopic", "http://localhost:8080/")
+
+    with patch_post() as mock_post:
+        mock_post.return_value = _response(200)
+        assert ntfy_alert.send_msg("hello", None, "subject")
+
+    assert mock_post.call_args.args[0] == "http://localhost:8080/mytopic"
+
+
+def test_ntfy_async_send_against_local_server():
+    import asyncio
+    from aiohttp import web
+    from alerts.http_client import close_async_http_sessions
+
+    received = []
+
+    async def publish(request):
+        received.append((request.match_info["topic"], await request.text(), request.headers["Title"]))
+        return web.Response(text="{}")
+
+    async def scenario():
+        app = web.Application()
+        app.router.add_post("/{topic}", publish)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        try:
+            alert = NTFYAlert()
+            alert.configure("mytopic", f"http://127.0.0.1:{port}")
+            alert.timeout = 5
+            return [await alert.send_msg_async("hello", None, "subject") for _ in range(2)]
+        finally:
+            await close_async_http_sessions()
+            await runner.cleanup()
+
+    assert asyncio.run(scenario()) == [True, True]
+    assert received == [("mytopic", "hello", "subject")] * 2
@@ -1,12 +1,18 @@
 # tests/test_db_managers.py
 import pytest
-from unittest.mock import MagicMock, patch, PropertyMock
+from unittest.mock import AsyncMock, MagicMock, patch, PropertyMock
 import datetime
 
-from database.db import session_manager
-from database.models import Token, Stock
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from database.db import EngineProfile, create_db_engine, session_manager
+from database.models import Base, Token, Stock
 from database.token_manager import TokenManager
 from database.stock_tracker import StockManager
+from database.stop_loss import StopLossEngine
+from database.write_buffer import WriteBuffer
 
 # ------------------------
 # Dummy sessionmaker setup
@@ -58,6 +64,18 @@ def stock_manager():
         sm = StockManager(sessionmaker=DummySessionMaker())
         yield sm
 
+@pytest.fixture
+def sqlite_sessionmaker():
+    """In-memory SQLite database shared across sessions"""
+    engine = create_engine(
+        "sqlite://",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool,
+    )
+    Base.metadata.create_all(engine)
+    yield sessionmaker(bind=engine, expire_on_commit=False)
+    engine.dispose()
+
 # ------------------------
 # TokenManager tests
 # ------------------------
@@ -152,3 +170,1004 @@ def test_remove_stock_failure(stock_manager):
     with patch("database.db.session_manager", return_value=MagicMock(__enter__=lambda s: session_mock, __exit__=lambda s,e,t,tb: None)):
         with pytest.raises(RuntimeError):
             stock_manager.remove_stock("TEST")
+
+
+# ------------------------
+# StockManager batch tests (real SQLite)
+# ------------------------
+def test_check_stocks_updates_and_flags_in_one_transaction(sqlite_sessionmaker):
+    sm = StockManager(sessionmaker=sqlite_sessionmaker)
+    sm.add_stock("AAPL", 100, "USD")
+    sm.add_stock("MSFT", 200, "USD")
+    sm.add_stock("SHOP", 50, "CAD")
+
+    engine = sqlite_sessionmaker.kw["bind"]
+    statements = []
+    event.listen(engine, "before_cursor_execute",
+                 lambda conn, cur, stmt, params, ctx, many: statements.append((stmt, many)))
+
+    # AAPL: new peak, MSFT: breach, SHOP: unchanged
+    breached = sm.check_stocks({"aapl": 120, "MSFT": 150, "SHOP": 50}, {"AAPL": 8049})
+
+    assert breached == ["MSFT"]
+    assert sm.stocks_to_alert == ["MSFT"]
+    # working set loaded with one SELECT; dirty rows stay buffered until flushed
+    assert len(statements) == 1
+    assert statements[0][0].startswith("SELECT")
+
+    # SHOP did not change: only AAPL and MSFT are written, with one executemany UPDATE
+    assert sm.flush() == 2
+    assert len(statements) == 2
+    assert statements[1][0].startswith("UPDATE") and statements[1][1] is True
+
+    with session_manager(sqlite_sessionmaker) as session:
+        aapl = session.get(Stock, "AAPL")
+        msft = session.get(Stock, "MSFT")
+        assert float(aapl.peak_value) == 120
+        assert float(aapl.stop_loss_value) == pytest.approx(120 * sm.stop_loss_ratio)
+        assert aapl.symbol_id == 8049
+        assert float(msft.current_value) == 150
+        assert float(msft.peak_value) == 200
+
+
+def test_check_stocks_skips_unknown_tickers(sqlite_sessionmaker, caplog):
+    sm = StockManager(sessionmaker=sqlite_sessionmaker)
+    sm.add_stock("AAPL", 100, "USD")
+
+    breached = sm.check_stocks({"AAPL": 101, "NOPE": 5})
+
+    assert breached == []
+    assert "NOPE" in caplog.text
+    assert sm.check_stocks({}) == []
+
+
+def test_check_stocks_coalesces_writes_until_flush(sqlite_sessionmaker):
+    sm = StockManager(sessionmaker=sqlite_sessionmaker)
+    sm.add_stock("AAPL", 100, "USD")
+
+    engine = sqlite_sessionmaker.kw["bind"]
+    statements = []
+    event.listen(engine, "before_cursor_execute",
+                 lambda conn, cur, stmt, params, ctx, many: statements.append(stmt))
+
+    sm.check_stocks({"AAPL": 101})
+    sm.check_stocks({"AAPL": 102})
+    # unchanged price: nothing new is queued
+    sm.check_stocks({"AAPL": 102})
+
+    assert not any(stmt.startswith("UPDATE") for stmt in statements)
+    assert sm.flush() == 1
+    assert sm.flush() == 0
+    with session_manager(sqlite_sessionmaker) as session:
+        assert float(session.get(Stock, "AAPL").current_value) == 102
+
+
+def test_check_stocks_picks_up_added_and_removed_stocks(sqlite_sessionmaker):
+    sm = StockManager(sessionmaker=sqlite_sessionmaker)
+    sm.add_stock("AAPL", 100, "USD")
+    sm.check_stocks({"AAPL": 101})
+
+    sm.add_stock("MSFT", 200, "USD")
+    assert sm.check_stocks({"MSFT": 150}) == ["MSFT"]
+
+    # pending values of a removed stock are dropped, not written
+    sm.check_stocks({"AAPL": 105})
+    sm.remove_stock("AAPL")
+    assert sm.flush() == 1
+    assert sm.get_tracked_stock_tickers() == ["MSFT"]
+
+
+
+def test_check_stock_sees_buffered_stop(sqlite_sessionmaker):
+    sm = StockManager(sessionmaker=sqlite_sessionmaker)
+    sm.add_stock("AAPL", 100, "USD")
+    # raises the stop to 120 * ratio, held in the write buffer
+    sm.check_stocks({"AAPL": 120})
+
+    # above the stop in the db, below the buffered one
+    price = 110 * sm.stop_loss_ratio
+    sm.check_stock("AAPL", price)
+
+    assert sm.stocks_to_alert == ["AAPL"]
+    with session_manager(sqlite_sessionmaker) as session:
+        aapl = session.get(Stock, "AAPL")
+        assert float(aapl.peak_value) == 120
+        assert float(aapl.current_value) == pytest.approx(price)
+
+def test_write_buffer_flushes_when_due(sqlite_sessionmaker):
+    now = [0.0]
+    buffer = WriteBuffer(sqlite_sessionmaker, Stock, key="ticker", max_rows=2, max_delay=10, clock=lambda: now[0])
+    StockManager(sessionmaker=sqlite_sessionmaker).add_stock("AAPL", 100, "USD")
+
+    assert not buffer.due()
+    buffer.add([{"ticker": "AAPL", "current_value": 101.0}])
+    assert not buffer.due()
+    now[0] = 10.0
+    assert buffer.due()
+
+    buffer.add([{"ticker": "AAPL", "current_value": 102.0}])
+    # a newer row replaces the pending one for the same key
+    assert len(buffer) == 1
+    assert buffer.flush() == 1
+    assert buffer.stats.rows_buffered == 2 and buffer.stats.rows_written == 1
+    with session_manager(sqlite_sessionmaker) as session:
+        assert float(session.get(Stock, "AAPL").current_value) == 102
+
+
+def test_write_buffer_rows_replaced_during_flush_start_a_new_delay(sqlite_sessionmaker):
+    now = [0.0]
+    buffer = WriteBuffer(sqlite_sessionmaker, Stock, key="ticker", max_rows=10, max_delay=10, clock=lambda: now[0])
+    buffer.add([{"ticker": "AAPL", "current_value": 101.0}])
+    now[0] = 10.0
+
+    # a newer row arrives while the due flush is writing
+    rows = buffer._take()
+    buffer.add([{"ticker": "AAPL", "current_value": 102.0}])
+    buffer._written(rows)
+
+    assert len(buffer) == 1
+    # the leftover row waits a full delay instead of forcing a flush on every batch
+    assert not buffer.due()
+    now[0] = 20.0
+    assert buffer.due()
+
+
+
+# ------------------------
+# StopLossEngine tests
+# ------------------------
+@pytest.fixture
+def engine_snapshot():
+    return StopLossEngine(
+        tickers=["AAPL", "MSFT", "SHOP"],
+        symbol_ids=[8049, None, 3],
+        current=[100.0, 200.0, 50.0],
+        peak=[100.0, 200.0, 60.0],
+        stop=[90.0, 180.0, 54.0],
+        ratio=0.9,
+    )
+
+def test_engine_raises_peaks_and_flags_breaches(engine_snapshot):
+    result = engine_snapshot.apply({"AAPL": 110.0, "MSFT": 170.0, "SHOP": 50.0, "NOPE": 1.0}, {"MSFT": 27426})
+
+    assert result.breached == ["MSFT", "SHOP"]
+    assert result.unknown == ["NOPE"]
+    assert engine_snapshot.peak.tolist() == [110.0, 200.0, 60.0]
+    assert engine_snapshot.stop.tolist() == pytest.approx([99.0, 180.0, 54.0])
+
+    changed = {row["ticker"]: row for row in result.changed}
+    # SHOP price, peak and stop did not move
+    assert set(changed) == {"AAPL", "MSFT"}
+    assert changed["MSFT"]["symbol_id"] == 27426
+    assert changed["AAPL"]["symbol_id"] == 8049
+
+def test_engine_breach_uses_stop_before_batch(engine_snapshot):
+    engine_snapshot.apply({"AAPL": 150.0})
+    # stop is now 135; a drop to 120 breaches even though the previous stop was 90
+    result = engine_snapshot.apply({"AAPL": 120.0})
+    assert result.breached == ["AAPL"]
+    assert result.changed[0]["peak_value"] == 150.0
+
+
+# ------------------------
+# SymbolCacheManager tests
+# ------------------------
+from database.symbol_cache import SymbolCacheManager
+from database.models import SymbolCache
+
+def test_symbol_cache_roundtrip_and_negative_entries(sqlite_sessionmaker):
+    cache = SymbolCacheManager(sqlite_sessionmaker)
+    cache.put("aapl", 8049, "NASDAQ", "USD")
+    cache.put("NOPE", None)
+
+    entries = cache.get_many(["AAPL", "nope", "MSFT"])
+    assert set(entries) == {"AAPL", "NOPE"}
+    assert entries["AAPL"].symbol_id == 8049
+    assert entries["AAPL"].listing_exchange == "NASDAQ"
+    assert entries["NOPE"].symbol_id is None
+
+def test_symbol_cache_expires_entries(sqlite_sessionmaker):
+    cache = SymbolCacheManager(
+        sqlite_sessionmaker,
+        ttl=datetime.timedelta(days=1),
+        negative_ttl=datetime.timedelta(hours=1),
+    )
+    old = datetime.datetime.now() - datetime.timedelta(hours=2)
+    with session_manager(sqlite_sessionmaker) as session:
+        session.add(SymbolCache(ticker="AAPL", symbol_id=8049, fetched_at=old))
+        session.add(SymbolCache(ticker="NOPE", symbol_id=None, fetched_at=old))
+
+    # positive entry still fresh, negative entry expired
+    assert set(cache.get_many(["AAPL", "NOPE"])) == {"AAPL"}
+
+
+# ------------------------
+# TokenManager in-memory cache
+# ------------------------
+def test_access_token_served_from_cache(token_manager, mock_token):
+    token_manager._get_token = MagicMock(return_value=mock_token)
+
+    assert token_manager.get_access_token() == "access123"
+    assert token_manager.get_access_token() == "access123"
+    assert token_manager.get_api_server() == "api.test.com"
+
+    # only the first lookup touched the database
+    token_manager._get_token.assert_called_once()
+
+def test_access_token_refreshed_near_expiry(token_manager, mock_token):
+    mock_token.expiry_date = datetime.datetime.now() + datetime.timedelta(seconds=5)
+    fresh = Token(
+        id=1,
+        access_token="fresh_access",
+        refresh_token="fresh_refresh",
+        api_server="api.test.com",
+        expiry_date=datetime.datetime.now() + datetime.timedelta(minutes=30),
+    )
+    token_manager._get_token = MagicMock(return_value=mock_token)
+    token_manager._refresh_tokens = MagicMock(return_value=fresh)
+
+    # within the expiry margin: refreshed before the token actually expires
+    assert token_manager.get_access_token() == "fresh_access"
+    assert token_manager.get_access_token() == "fresh_access"
+    token_manager._refresh_tokens.assert_called_once()
+
+def test_access_token_cache_invalidate(token_manager, mock_token):
+    token_manager._get_token = MagicMock(return_value=mock_token)
+
+    token_manager.get_access_token()
+    token_manager.invalidate()
+    assert token_manager.cached_access_token() is None
+    token_manager.get_access_token()
+
+    assert token_manager._get_token.call_count == 2
+
+
+# ------------------------
+# Proactive single-flight refresh
+# ------------------------
+import threading
+import time as _time
+
+def test_concurrent_refresh_is_single_flight(token_manager):
+    store = {"token": Token(
+        id=1, access_token="old", refresh_token="rt-1", api_server="api.test.com",
+        expiry_date=datetime.datetime.now() + datetime.timedelta(seconds=60),
+    )}
+
+    def refresh(session, rf_token=None):
+        # one-time-use refresh token: a second refresh with the same token would fail
+        assert rf_token == "rt-1"
+        _time.sleep(0.05)
+        store["token"] = Token(
+            id=1, access_token="new", refresh_token="rt-2", api_server="api.test.com",
+            expiry_date=datetime.datetime.now() + datetime.timedelta(minutes=30),
+        )
+        return store["token"]
+
+    token_manager._get_token = MagicMock(side_effect=lambda session: store["token"])
+    token_manager._refresh_tokens = MagicMock(side_effect=refresh)
+
+    margin = datetime.timedelta(minutes=2)
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(token_manager.refresh_if_needed(margin).access_token))
+        for _ in range(8)
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert results == ["new"] * 8
+    token_manager._refresh_tokens.assert_called_once()
+    # next refresh is scheduled margin seconds before the new expiry
+    assert 27 * 60 < token_manager.seconds_until_refresh(margin) <= 28 * 60
+
+
+# ------------------------
+# Token pool
+# ------------------------
+def test_token_managers_keep_one_row_per_login(sqlite_sessionmaker, monkeypatch):
+    from cryptography.fernet import Fernet
+    from utils.env_vars import reload_settings
+    monkeypatch.setenv("encryption_key", Fernet.generate_key().decode())
+    reload_settings()
+
+    def refresh(url, timeout):
+        login = url.rsplit("=", 1)[1]
+        resp = MagicMock()
+        resp.json.return_value = {
+            "access_token": f"access-{login}", "refresh_token": f"next-{login}",
+            "api_server": f"https://{login}.test.com/", "expires_in": 1800,
+        }
+        return resp
+
+    try:
+        with patch("database.token_manager.requests.get", side_effect=refresh):
+            # a pooled login is seeded on first use; it never takes id 1, which stays reserved for the primary token
+            second = TokenManager(sqlite_sessionmaker, login="second", seed_token="second")
+            assert second.get_access_token() == "access-second"
+            primary = TokenManager(sqlite_sessionmaker, seed_token="primary")
+        with sqlite_sessionmaker() as session:
+            rows = {token.login: (token.id, token.refresh_token) for token in session.query(Token)}
+        assert rows == {None: (1, "next-primary"), "second": (2, "next-second")}
+        assert primary.get_access_token() == "access-primary"
+        assert second.get_api_server() == "https://second.test.com/"
+    finally:
+        monkeypatch.undo()
+        reload_settings()
+
+
+def test_rejected_pooled_login_does_not_stop_the_client(sqlite_sessionmaker, monkeypatch):
+    import requests
+    from cryptography.fernet import Fernet
+    from tracking.api import QTradeAPI
+    from utils.env_vars import reload_settings
+    monkeypatch.setenv("encryption_key", Fernet.generate_key().decode())
+    monkeypatch.setenv("QUESTRADE_LOGINS", "revoked:bad-seed,second:good-seed")
+    reload_settings()
+
+    def refresh(url, timeout):
+        seed = url.rsplit("=", 1)[1]
+        resp = MagicMock(status_code=400 if seed == "bad-seed" else 200)
+        if seed == "bad-seed":
+            resp.raise_for_status.side_effect = requests.HTTPError("400 Client Error")
+        resp.json.return_value = {
+            "access_token": f"access-{seed}", "refresh_token": f"next-{seed}",
+            "api_server": "https://api.test.com/", "expires_in": 1800,
+        }
+        return resp
+
+    primary = MagicMock(login=None)
+    primary.cached_token.return_value = None
+    primary.get_access_token.return_value = "access-primary"
+    primary.get_api_server.return_value = "https://api.test.com/"
+    try:
+        with patch("database.token_manager.requests.get", side_effect=refresh):
+            api = QTradeAPI(sqlite_sessionmaker, token=primary, stocks=MagicMock())
+            tokens = [api.tokens.lease().access_token for _ in range(4)]
+        # the rejected seed is set aside; the other logins keep serving requests
+        assert tokens == ["access-primary", "access-good-seed", "access-primary", "access-good-seed"]
+        assert set(api.tokens.available()) == {None, "second"}
+    finally:
+        monkeypatch.undo()
+        reload_settings()
+
+
+def test_token_pool_sets_aside_failing_logins_but_never_the_last():
+    import requests
+    from database.token_pool import TokenPool
+
+    def manager(login, fails=False):
+        mgr = MagicMock(login=login)
+        mgr.cached_token.return_value = None
+        mgr.get_access_token.return_value = f"token-{login}"
+        mgr.get_api_server.return_value = "api.test.com"
+        if fails:
+            mgr.refresh_if_needed.side_effect = requests.HTTPError("400 Client Error")
+        mgr.seconds_until_refresh.return_value = 600.0
+        return mgr
+
+    clock = MagicMock(return_value=0.0)
+    primary, revoked = manager(None), manager("revoked", fails=True)
+    pool = TokenPool([primary, revoked], revoked_retry=60, clock=clock)
+
+    assert [pool.lease().login for _ in range(4)] == [None, "revoked", None, "revoked"]
+    pool.refresh_if_needed(datetime.timedelta(minutes=2))
+    assert pool.available() == [None]
+    # the scheduler wakes up when the wait is over
+    assert pool.seconds_until_refresh(datetime.timedelta(minutes=2)) == 60.0
+
+    # repeated 401s on the only usable login: reloaded, not set aside
+    pool.unauthorized(None)
+    pool.unauthorized(None)
+    assert pool.available() == [None]
+    assert primary.invalidate.call_count == 2
+
+    clock.return_value = 61.0
+    revoked.refresh_if_needed.side_effect = None
+    pool.refresh_if_needed(datetime.timedelta(minutes=2))
+    assert set(pool.available()) == {None, "revoked"}
+
+
+# ------------------------
+# Engine profile tests
+# ------------------------
+def test_tuned_engine_profile_applies_pragmas(tmp_path):
+    engine = create_db_engine(EngineProfile(url=f"sqlite:///{tmp_path / 'bot.db'}", busy_timeout=1234))
+    with engine.connect() as conn:
+        assert conn.exec_driver_sql("PRAGMA journal_mode").scalar() == "wal"
+        # NORMAL
+        assert conn.exec_driver_sql("PRAGMA synchronous").scalar() == 1
+        assert conn.exec_driver_sql("PRAGMA busy_timeout").scalar() == 1234
+    assert engine.echo is False
+    engine.dispose()
+
+
+def test_default_engine_profile_keeps_sqlite_defaults(tmp_path):
+    engine = create_db_engine(EngineProfile(url=f"sqlite:///{tmp_path / 'bot.db'}", tuned=False))
+    with engine.connect() as conn:
+        assert conn.exec_driver_sql("PRAGMA journal_mode").scalar() == "delete"
+    engine.dispose()
+
+
+def test_engine_profile_from_settings(monkeypatch):
+    from utils.env_vars import reload_settings
+    monkeypatch.setenv("DB_PROFILE", "default")
+    monkeypatch.setenv("SQL_ECHO", "true")
+    monkeypatch.setenv("DB_POOL_SIZE", "3")
+    try:
+        profile = EngineProfile.from_settings(reload_settings())
+        assert profile.tuned is False
+        assert profile.echo is True
+        assert profile.pool_size == 3
+    finally:
+        monkeypatch.undo()
+        reload_settings()
+
+
+# ------------------------
+# Async database layer
+# ------------------------
+import asyncio
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from database.async_stock_tracker import AsyncStockManager
+from database.async_token_manager import AsyncTokenManager
+
+
+@pytest.fixture
+def async_sqlite_sessionmaker():
+    """In-memory aiosqlite database shared across sessions"""
+    engine = create_async_engine("sqlite+aiosqlite://", poolclass=StaticPool)
+
+    async def create():
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+
+    asyncio.run(create())
+    yield async_sessionmaker(bind=engine, expire_on_commit=False)
+    asyncio.run(engine.dispose())
+
+
+def test_async_check_stocks_matches_sync_manager(async_sqlite_sessionmaker):
+    sm = AsyncStockManager(sessionmaker=async_sqlite_sessionmaker)
+
+    async def scenario():
+        await sm.add_stock("AAPL", 100, "USD")
+        await sm.add_stock("MSFT", 200, "USD")
+        # concurrent batches (ie. several watchlists) share one working set
+        results = await asyncio.gather(
+            sm.check_stocks({"aapl": 120}, {"AAPL": 8049}),
+            sm.check_stocks({"MSFT": 150}),
+        )
+        written = await sm.flush()
+        return results, written, await sm.get_tracked_symbol_ids()
+
+    results, written, symbol_ids = asyncio.run(scenario())
+
+    assert results == [[], ["MSFT"]]
+    assert sm.stocks_to_alert == ["MSFT"]
+    assert written == 2
+    assert symbol_ids == {"AAPL": 8049, "MSFT": None}
+
+
+def test_async_write_buffer_is_not_a_sync_write_buffer(async_sqlite_sessionmaker):
+    from database.write_buffer import AsyncWriteBuffer, WriteBufferBase
+
+    buffer = AsyncWriteBuffer(async_sqlite_sessionmaker, Stock, key="ticker")
+    # code typed as WriteBuffer calls flush() synchronously and must never get a coroutine
+    assert isinstance(buffer, WriteBufferBase) and not isinstance(buffer, WriteBuffer)
+
+
+def _push_alerts(send_each):
+    from alerts.handler import Alerts, AlertConfig
+
+    alerts = Alerts()
+    alerts.set_config(AlertConfig(ntfy_topic="topic"))
+    alerts.send_each = send_each
+    alerts.send_each_async = AsyncMock(side_effect=send_each)
+    return alerts
+
+
+def _sent(*channels):
+    from alerts.handler import ChannelResult
+    return lambda messages, recipient, subject: {c: ChannelResult(c, c in channels) for c in messages}
+
+
+def test_async_alert_stocks_notifies_once_per_day(async_sqlite_sessionmaker):
+    sm = AsyncStockManager(sessionmaker=async_sqlite_sessionmaker)
+    alerts = _push_alerts(MagicMock(side_effect=_sent("push")))
+    sm._alerts = MagicMock(return_value=alerts)
+
+    async def scenario():
+        await sm.add_stock("MSFT", 200, "USD")
+        await sm.check_stocks({"MSFT": 150})
+        await sm.alert_stocks()
+        # breached again the same day: no second message
+        sm.stocks_to_alert.append("MSFT")
+        await sm.alert_stocks()
+        await sm.remove_stock("MSFT")
+        return await sm.get_tracked_stock_tickers()
+
+    assert asyncio.run(scenario()) == []
+    alerts.send_each_async.assert_awaited_once()
+    assert "MSFT ($150" in alerts.send_each_async.call_args.args[0]["push"].text
+
+
+def test_async_token_manager_single_flight_refresh(async_sqlite_sessionmaker, monkeypatch):
+    from cryptography.fernet import Fernet
+    from utils.env_vars import reload_settings
+    # tokens are stored encrypted
+    monkeypatch.setenv("encryption_key", Fernet.generate_key().decode())
+    reload_settings()
+    tm = AsyncTokenManager(sessionmaker=async_sqlite_sessionmaker)
+    calls = []
+
+    async def refresh(session, rf_token):
+        calls.append(rf_token)
+        await asyncio.sleep(0.01)
+        return await session.merge(Token(
+            id=1, access_token=f"access-{len(calls)}", refresh_token=f"rt-{len(calls)}",
+            api_server="api.test.com", expiry_date=datetime.datetime.now() + datetime.timedelta(minutes=30),
+        ))
+
+    tm._refresh_tokens = refresh
+
+    async def scenario():
+        with patch("database.async_token_manager.get_settings") as mock_settings:
+            mock_settings.return_value.require_refresh_token.return_value = "seed"
+            # no token row yet: seeded once from the refresh_token setting
+            tokens = await asyncio.gather(*(tm.get_access_token() for _ in range(5)))
+        tm.invalidate()
+        # served from the database row, no refresh
+        return tokens, await tm.get_access_token(), await tm.get_api_server()
+
+    try:
+        tokens, reloaded, api_server = asyncio.run(scenario())
+    finally:
+        monkeypatch.undo()
+        reload_settings()
+
+    assert tokens == ["access-1"] * 5
+    assert calls == ["seed"]
+    assert reloaded == "access-1"
+    assert api_server == "api.test.com"
+
+
+# ------------------------
+# Price history tests
+# ------------------------
+from database.price_history import PriceHistory
+
+
+def _utc(*args):
+    return datetime.datetime(*args, tzinfo=datetime.timezone.utc)
+
+
+def test_price_history_appends_and_queries_ranges(tmp_path):
+    history = PriceHistory(tmp_path)
+    history.append_many([8049, 27426], [100.0, 50.0], ts=_utc(2026, 3, 2, 23, 59, 59))
+    history.append(8049, 101.0, ts=_utc(2026, 3, 3, 0, 0, 1))
+    history.append(8049, 102.0, ts=_utc(2026, 3, 3, 14, 30))
+
+    # one fixed-width segment per UTC day
+    assert history.flush() == 4
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["2026-03-02.ticks", "2026-03-03.ticks"]
+    assert (tmp_path / "2026-03-02.ticks").stat().st_size == 2 * 20
+
+    ticks = history.query(8049, _utc(2026, 3, 2), _utc(2026, 3, 3, 12))
+    assert ticks["price"].tolist() == [100.0, 101.0]
+    assert history.query(27426, _utc(2026, 3, 3), _utc(2026, 3, 4)).size == 0
+
+
+def test_price_history_downsamples_to_ohlc_bars(tmp_path):
+    history = PriceHistory(tmp_path)
+    start = _utc(2026, 3, 3, 14, 30)
+    for seconds, price in [(0, 10.0), (20, 12.0), (40, 9.0), (50, 11.0), (130, 15.0)]:
+        history.append(1, price, ts=start + datetime.timedelta(seconds=seconds))
+
+    bars = history.downsample(1, start, start + datetime.timedelta(hours=1), datetime.timedelta(minutes=1))
+
+    assert bars["count"].tolist() == [4, 1]
+    assert bars[0]["open"] == 10.0 and bars[0]["high"] == 12.0
+    assert bars[0]["low"] == 9.0 and bars[0]["close"] == 11.0
+    # empty minute between the two bars is omitted
+    assert bars["ts"][1] - bars["ts"][0] == 2 * 60_000
+
+
+def test_check_stocks_records_price_history(sqlite_sessionmaker, tmp_path):
+    history = PriceHistory(tmp_path, clock=lambda: _utc(2026, 3, 3, 15).timestamp())
+    sm = StockManager(sessionmaker=sqlite_sessionmaker, history=history)
+    sm.add_stock("AAPL", 100, "USD")
+    sm.add_stock("MSFT", 200, "USD")
+
+    # MSFT has no symbol id yet: not recorded
+    sm.check_stocks({"AAPL": 101, "MSFT": 199}, {"AAPL": 8049})
+    sm.flush()
+
+    ticks = history.query(8049, _utc(2026, 3, 3), _utc(2026, 3, 4))
+    assert ticks["price"].tolist() == [101.0]
+    assert history.prune(datetime.date(2026, 3, 4)) == 1
+
+
+# ------------------------
+# Trailing-stop strategies
+# ------------------------
+from database.strategies import ATRStop, RollingHighStop, MovingAverageCrossStop, build_strategy
+from database.db import upgrade_schema
+
+
+def test_rolling_high_stop_drops_expired_highs():
+    stop = RollingHighStop(days=1, ratio=0.5)
+    assert stop.update(100.0, 0).stop == 50.0
+    assert stop.update(80.0, 3600).stop == 50.0
+    # the 100 high leaves the one-day window
+    assert stop.update(90.0, 86400).stop == 45.0
+    assert stop.update(40.0, 86401).breached
+
+
+def test_atr_stop_ratchets_up_only():
+    stop = ATRStop(window=2, multiplier=1.0)
+    stop.update(100.0, 0)
+    assert stop.update(102.0, 1).stop is None
+    # ATR (2 + 2) / 2 = 2 below the peak of 104
+    assert stop.update(104.0, 2).stop == 102.0
+    # larger ranges would lower the stop: it stays put
+    assert stop.update(96.0, 3).stop == 102.0
+    assert stop.update(101.0, 4).breached is True
+
+
+def test_held_stop_is_a_floor_until_it_leaves_the_window():
+    stop = RollingHighStop(days=1, ratio=0.5)
+    stop.update(100.0, 0)
+    # lower than the current level: kept as is
+    stop.hold(40.0, 10)
+    assert stop.stop == 50.0
+    stop.hold(60.0, 10)
+    assert stop.update(100.0, 20).stop == 60.0
+    assert stop.update(100.0, 86410).stop == 50.0
+
+    atr = ATRStop(window=2, multiplier=1.0, stop=90.0)
+    for ts, price in enumerate([100.0, 90.0, 100.0]):
+        atr.update(price, ts)
+    assert atr.stop == 90.0
+
+
+def test_moving_average_cross_flags_cross_below():
+    stop = MovingAverageCrossStop(slow=3, fast=1)
+    updates = [stop.update(price, i) for i, price in enumerate([10.0, 11.0, 12.0, 13.0, 9.0])]
+    assert [u.breached for u in updates] == [False, False, False, False, True]
+
+
+def test_build_strategy_validates_names():
+    assert build_strategy(None) is None
+    assert build_strategy("peak") is None
+    with pytest.raises(RuntimeError):
+        build_strategy("bogus")
+    with pytest.raises(RuntimeError):
+        build_strategy("ma_cross", window=5, param=10)
+
+
+def test_check_stocks_uses_configured_strategy(sqlite_sessionmaker):
+    sm = StockManager(sessionmaker=sqlite_sessionmaker)
+    sm.add_stock("AAPL", 100, "USD")
+    sm.add_stock("MSFT", 100, "USD")
+    sm.set_strategy("AAPL", "rolling_high", window=5, param=0.95)
+
+    # MSFT keeps the peak * STOP_LOSS rule
+    assert sm.check_stocks({"AAPL": 110, "MSFT": 110}) == []
+    # 104 < 110 * 0.95 for AAPL only
+    assert sm.check_stocks({"AAPL": 104, "MSFT": 104}) == ["AAPL"]
+    sm.flush()
+
+    with session_manager(sqlite_sessionmaker) as session:
+        aapl = session.get(Stock, "AAPL")
+        assert aapl.stop_strategy == "rolling_high"
+        assert float(aapl.stop_loss_value) == pytest.approx(110 * 0.95)
+
+    with pytest.raises(RuntimeError):
+        sm.set_strategy("AAPL", "bogus")
+
+
+def test_working_set_reload_keeps_strategies_and_stored_stops(sqlite_sessionmaker):
+    sm = StockManager(sessionmaker=sqlite_sessionmaker)
+    sm.add_stock("AAPL", 100, "USD")
+    sm.set_strategy("AAPL", "rolling_high", window=5, param=0.5)
+    # raised above what the strategy alone would give (ie. by an earlier run)
+    with session_manager(sqlite_sessionmaker) as session:
+        session.get(Stock, "AAPL").stop_loss_value = 80
+
+    # a new strategy is held at the stored stop instead of dropping to 100 * 0.5
+    assert sm.check_stocks({"AAPL": 100}) == []
+    strategy = sm._strategies["AAPL"]
+    assert strategy.stop == 80
+    sm.flush()
+
+    # reload: the same strategy object, nothing rebuilt
+    sm._working_set_loaded = -float("inf")
+    sm.check_stocks({"AAPL": 101})
+    assert sm._strategies["AAPL"] is strategy
+
+    # configuration changed outside this manager: rebuilt on the next reload
+    with session_manager(sqlite_sessionmaker) as session:
+        session.get(Stock, "AAPL").strategy_param = 0.6
+    sm._working_set_loaded = -float("inf")
+    sm.check_stocks({"AAPL": 101})
+    assert sm._strategies["AAPL"] is not strategy
+    assert sm._strategies["AAPL"].stop == 80
+    sm.flush()
+    with session_manager(sqlite_sessionmaker) as session:
+        assert float(session.get(Stock, "AAPL").stop_loss_value) == 80
+
+
+def test_upgrade_schema_adds_new_nullable_columns():
+    engine = create_engine("sqlite://", poolclass=StaticPool)
+    with engine.begin() as conn:
+        conn.exec_driver_sql(
+            "CREATE TABLE stock_table (ticker VARCHAR(20) PRIMARY KEY, symbol_id INTEGER, current_value NUMERIC NOT NULL, "
+            "peak_value NUMERIC NOT NULL, stop_loss_value NUMERIC NOT NULL, last_notified DATETIME, currency VARCHAR(3))"
+        )
+    with engine.begin() as conn:
+        upgrade_schema(conn)
+        columns = {row[1] for row in conn.exec_driver_sql("PRAGMA table_info(stock_table)")}
+    assert {"stop_strategy", "strategy_window", "strategy_param"} <= columns
+
+
+def test_per_stock_stop_rules_override_global_ratio(sqlite_sessionmaker):
+    sm = StockManager(sessionmaker=sqlite_sessionmaker)
+    sm.add_stock("AAPL", 100, "USD", ratio=0.5)
+    sm.add_stock("MSFT", 100, "USD", absolute=5)
+    sm.add_stock("SHOP", 100, "CAD")
+    with pytest.raises(RuntimeError):
+        sm.add_stock("BAD", 100, "USD", ratio=1.5)
+
+    with patch("database.stock_tracker.get_settings") as mock_settings:
+        mock_settings.return_value.stop_loss_ratio = 0.9
+        sm.check_stocks({"AAPL": 200, "MSFT": 200, "SHOP": 200})
+        # settings are read once when the working set is loaded, not per batch
+        sm.check_stocks({"AAPL": 210, "MSFT": 210, "SHOP": 210})
+        assert mock_settings.call_count == 1
+    sm.flush()
+
+    with session_manager(sqlite_sessionmaker) as session:
+        stops = {t: float(session.get(Stock, t).stop_loss_value) for t in ("AAPL", "MSFT", "SHOP")}
+    assert stops == pytest.approx({"AAPL": 105.0, "MSFT": 205.0, "SHOP": 189.0})
+
+    # back to the global ratio
+    sm.set_stop_rule("AAPL")
+    with session_manager(sqlite_sessionmaker) as session:
+        assert float(session.get(Stock, "AAPL").stop_loss_value) == pytest.approx(210 * sm.stop_loss_ratio)
+
+
+# ------------------------
+# Alert outbox
+# ------------------------
+from alerts.digest import Breach
+from database.alert_outbox import AlertOutboxWorker
+from database.models import AlertOutbox
+
+
+class _Clock:
+    def __init__(self):
+        self.now = datetime.datetime(2026, 3, 2, 10, 0)
+
+    def __call__(self):
+        return self.now
+
+
+def _outbox_rows(sessionmaker):
+    with sessionmaker() as session:
+        return session.query(AlertOutbox).order_by(AlertOutbox.id).all()
+
+
+def test_alert_stocks_queues_and_sends_through_outbox(sqlite_sessionmaker):
+    sm = StockManager(sessionmaker=sqlite_sessionmaker)
+    send_each = MagicMock(side_effect=_sent("push"))
+    sm._alerts = MagicMock(return_value=_push_alerts(send_each))
+
+    sm.add_stock("MSFT", 200, "USD")
+    sm.add_stock("AAPL", 100, "USD")
+    sm.check_stocks({"MSFT": 150, "AAPL": 80})
+    sm.alert_stocks()
+
+    # one message holding both breaches
+    send_each.assert_called_once()
+    assert send_each.call_args.args[0]["push"].text.count("has reached stop-loss") == 2
+    rows = _outbox_rows(sqlite_sessionmaker)
+    assert {(r.ticker, r.channel, r.status, r.attempts) for r in rows} == {
+        ("MSFT", "push", "sent", 1), ("AAPL", "push", "sent", 1),
+    }
+    assert f"MSFT:{datetime.date.today().isoformat()}" in {r.idempotency_key for r in rows}
+
+
+def test_breach_notified_today_does_not_wake_the_queue_again(sqlite_sessionmaker):
+    sm = StockManager(sessionmaker=sqlite_sessionmaker)
+    send_each = MagicMock(side_effect=_sent("push"))
+    sm._alerts = MagicMock(return_value=_push_alerts(send_each))
+    sm.on_breach = MagicMock()
+
+    sm.add_stock("MSFT", 200, "USD")
+    assert sm.check_stocks({"MSFT": 150}) == ["MSFT"]
+    sm.alert_stocks()
+    # next cycle, still below the stop: nothing queued, on_breach not called
+    assert sm.check_stocks({"MSFT": 149}) == []
+    assert sm.stocks_to_alert == []
+
+    sm.on_breach.assert_called_once_with(["MSFT"])
+    send_each.assert_called_once()
+
+    # a stock added again later starts over
+    sm.remove_stock("MSFT")
+    sm.add_stock("MSFT", 200, "USD")
+    assert sm.check_stocks({"MSFT": 150}) == ["MSFT"]
+
+
+def test_outbox_retries_failed_channel_with_backoff(sqlite_sessionmaker):
+    clock = _Clock()
+    outbox = AlertOutboxWorker(sqlite_sessionmaker, backoff_base=30, backoff_max=3600, max_attempts=5, clock=clock)
+    with sqlite_sessionmaker.begin() as session:
+        assert outbox.enqueue(session, [Breach("MSFT", 150, 180)], ["push", "email"], "to@test.com", "subject") == 2
+    with sqlite_sessionmaker.begin() as session:
+        # same ticker, same day: already queued
+        assert outbox.enqueue(session, [Breach("MSFT", 150, 180)], ["push", "email"], "to@test.com", "subject") == 0
+
+    send_each = MagicMock(side_effect=_sent("email"))
+    assert outbox.drain(lambda: _push_alerts(send_each)) == 1
+    push = [r for r in _outbox_rows(sqlite_sessionmaker) if r.channel == "push"][0]
+    assert (push.status, push.attempts) == ("pending", 1)
+    assert push.next_attempt_at == clock.now + datetime.timedelta(seconds=30)
+
+    # still backing off: nothing is sent
+    send_each.reset_mock()
+    clock.now += datetime.timedelta(seconds=10)
+    assert outbox.drain(lambda: _push_alerts(send_each)) == 0
+    send_each.assert_not_called()
+
+    clock.now += datetime.timedelta(seconds=60)
+    send_each.side_effect = _sent("push")
+    assert outbox.drain(lambda: _push_alerts(send_each)) == 1
+    assert set(send_each.call_args.args[0]) == {"push"}
+    assert {r.status for r in _outbox_rows(sqlite_sessionmaker)} == {"sent"}
+
+
+def test_outbox_keeps_delivered_rows_when_drain_crashes(sqlite_sessionmaker):
+    outbox = AlertOutboxWorker(sqlite_sessionmaker, clock=_Clock())
+    with sqlite_sessionmaker.begin() as session:
+        outbox.enqueue(session, [Breach("MSFT", 150, 180)], ["push"], "a@test.com", "subject")
+        outbox.enqueue(session, [Breach("AAPL", 80, 90)], ["push"], "b@test.com", "subject")
+
+    delivered = []
+
+    def crash_on_second(messages, recipient, subject):
+        if delivered:
+            raise RuntimeError("worker killed")
+        delivered.append(recipient)
+        return _sent("push")(messages, recipient, subject)
+
+    with pytest.raises(RuntimeError):
+        outbox.drain(lambda: _push_alerts(MagicMock(side_effect=crash_on_second)))
+
+    # the first delivery was committed before the crash: the next drain only sends the other one
+    send_each = MagicMock(side_effect=_sent("push"))
+    assert outbox.drain(lambda: _push_alerts(send_each)) == 1
+    (recipient,) = [call.args[1] for call in send_each.call_args_list]
+    assert recipient != delivered[0]
+    assert {r.status for r in _outbox_rows(sqlite_sessionmaker)} == {"sent"}
+
+
+def test_outbox_gives_up_after_max_attempts(sqlite_sessionmaker):
+    clock = _Clock()
+    outbox = AlertOutboxWorker(sqlite_sessionmaker, backoff_base=1, backoff_max=1, max_attempts=2, clock=clock)
+    with sqlite_sessionmaker.begin() as session:
+        outbox.enqueue(session, [Breach("MSFT", 150, 180)], ["push"], None, "subject")
+
+    failing = lambda: _push_alerts(MagicMock(side_effect=_sent()))
+    for _ in range(3):
+        outbox.drain(failing)
+        clock.now += datetime.timedelta(seconds=5)
+
+    row = _outbox_rows(sqlite_sessionmaker)[0]
+    assert (row.status, row.attempts, row.last_error) == ("failed", 2, "failed")
+    assert outbox.backoff(1) == datetime.timedelta(seconds=1)
+
+
+def test_outbox_sends_digest_chunks_and_retries_only_unsent(sqlite_sessionmaker):
+    from alerts.handler import ChannelResult
+
+    clock = _Clock()
+    outbox = AlertOutboxWorker(sqlite_sessionmaker, backoff_base=30, backoff_max=30, max_attempts=5, clock=clock)
+    breaches = [Breach(f"T{i:03d}", 10, 9) for i in range(120)]
+    with sqlite_sessionmaker.begin() as session:
+        outbox.enqueue(session, breaches, ["discord", "email"], "to@test.com", "subject")
+
+    sent = []
+    def send_each(messages, recipient, subject):
+        sent.append(messages)
+        # the second discord chunk fails
+        return {c: ChannelResult(c, not (c == "discord" and len(sent) == 2)) for c in messages}
+
+    outbox.drain(lambda: _push_alerts(send_each))
+
+    discord = [m["discord"] for m in sent if "discord" in m]
+    assert all(len(m.text) <= 2000 for m in discord)
+    assert len(discord) == 2
+    # email has no size limit: one message with an HTML table
+    assert sum("email" in m for m in sent) == 1
+    assert sent[0]["email"].html.count("<tr><td>") == 120
+
+    rows = _outbox_rows(sqlite_sessionmaker)
+    pending = [r for r in rows if r.status == "pending"]
+    assert pending and all(r.channel == "discord" for r in pending)
+    # the first discord chunk went out and is not retried
+    assert any(r.channel == "discord" and r.status == "sent" for r in rows)
+
+
+def test_watchlists_share_one_tracked_stock(sqlite_sessionmaker):
+    sm = StockManager(sessionmaker=sqlite_sessionmaker)
+    sm.add_stock("MSFT", 200, "USD")
+    for name in ("alice", "bob", "carol"):
+        sm.add_user(name)
+        sm.watch(name, "msft")
+    sm.watch("bob", "MSFT", "tech")
+    sm.watch("bob", "MSFT", "tech")
+
+    # one Stock row (and one quote) however many users watch it
+    assert sm.get_tracked_symbol_ids() == {"MSFT": None}
+    assert sm.get_watchlist("bob") == ["MSFT"]
+    assert sm.get_watchlist("bob", "tech") == ["MSFT"]
+    with pytest.raises(RuntimeError):
+        sm.watch("alice", "AAPL")
+    with pytest.raises(RuntimeError):
+        sm.add_user("alice")
+
+    sm.unwatch("alice", "MSFT")
+    assert sm.get_watchlist("alice") == []
+    sm.remove_stock("MSFT")
+    assert sm.get_watchlist("bob") == []
+
+
+def test_alert_stocks_fans_out_to_subscribed_users(sqlite_sessionmaker):
+    from alerts.handler import AlertConfig, Alerts
+
+    sm = StockManager(sessionmaker=sqlite_sessionmaker)
+    alerts = Alerts()
+    alerts.set_config(AlertConfig(
+        email_provider="gmail", email_username="bot@test.com", email_password="pw", email_host="smtp.test.com",
+    ))
+    sent = []
+    def send_each(messages, recipient, subject):
+        sent.append((recipient, frozenset(messages)))
+        return _sent(*messages)(messages, recipient, subject)
+    alerts.send_each = send_each
+    sm._alerts = MagicMock(return_value=alerts)
+
+    sm.add_stock("MSFT", 200, "USD")
+    sm.add_stock("AAPL", 100, "USD")
+    alice = sm.add_user("alice", email="alice@test.com", ntfy_topic="alice-topic")
+    bob = sm.add_user("bob", discord_webhook_url="https://discord.test/hook")
+    sm.add_user("carol", email="carol@test.com")
+    sm.watch("alice", "MSFT")
+    sm.watch("bob", "MSFT")
+    sm.watch("bob", "MSFT", "tech")
+    sm.watch("carol", "AAPL")
+
+    with patch("database.stock_tracker.get_settings") as settings:
+        settings.return_value.email_to_notify = "owner@test.com"
+        sm.check_stocks({"MSFT": 150, "AAPL": 100})
+        sm.alert_stocks()
+
+    # carol's stock did not breach; bob gets one alert despite two watchlists
+    assert sorted(sent, key=str) == sorted([
+        ("owner@test.com", frozenset({"email"})),
+        ("alice@test.com", frozenset({"email", "push"})),
+        (None, frozenset({"discord"})),
+    ], key=str)
+    rows = _outbox_rows(sqlite_sessionmaker)
+    assert {(r.user_id, r.channel, r.status) for r in rows} == {
+        (None, "email", "sent"), (alice, "email", "sent"), (alice, "push", "sent"), (bob, "discord", "sent"),
+    }
+    assert f"MSFT:{datetime.date.today().isoformat()}:{alice}" in {r.idempotency_key for r in rows}
+
+    # a user's channels reuse the bot account and only swap destinations
+    config = alerts.config.for_user(None, "topic", None)
+    assert config.channels == ["push"] and config.email_username == "bot@test.com"
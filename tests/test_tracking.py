@@ -17,6 +17,7 @@ def api(mock_sessionmaker):
 
     # patch StockManager methods
     api.stocks.check_stock = MagicMock()
+    api.stocks.check_stocks = MagicMock(return_value=[])
     api.stocks.get_tracked_stock_tickers = MagicMock(return_value=["AAPL"])
 
     return api
@@ -74,7 +75,7 @@ def test_check_stock_info_success(api):
             mock_response = MagicMock()
             mock_response.raise_for_status.return_value = None
             mock_response.json.return_value = {
-                "quotes": [{"symbol": "AAPL", "lastTradePrice": 150.0}]
+                "quotes": [{"symbol": "AAPL", "symbolId": 123, "lastTradePrice": 150.0}]
             }
             mock_get.return_value = mock_response
 
@@ -85,7 +86,9 @@ def test_check_stock_info_success(api):
             except RuntimeError:
                 pass
 
-            api.stocks.check_stock.assert_called_with("AAPL", 150.0)
+            # whole response is evaluated in one batch
+            api.stocks.check_stocks.assert_called_once_with({"AAPL": 150.0}, {"AAPL": 123})
+            api.stocks.check_stock.assert_not_called()
 
 def test_get_all_stocks(api):
     api.get_stock_symbol = MagicMock(return_value=123)
@@ -94,4 +97,811 @@ def test_get_all_stocks(api):
     api.get_all_stocks()
 
     api.get_stock_symbol.assert_called_once_with("AAPL")
-    api.check_stock_info.assert_called_once_with([123])
\ No newline at end of file
+    api.check_stock_info.assert_called_once_with([123])
+
+# -------------------------
+# AsyncQTradeAPI (local aiohttp stand-in server)
+# -------------------------
+import asyncio
+from aiohttp import web
+from tracking.async_api import AsyncQTradeAPI, ClientSessionPool
+
+
+async def _start_stand_in(routes):
+    app = web.Application()
+    app.add_routes(routes)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://127.0.0.1:{port}"
+
+
+def _async_api(mock_sessionmaker, base_url):
+    api = AsyncQTradeAPI(mock_sessionmaker, pool=ClientSessionPool())
+    api.token.get_access_token = MagicMock(return_value="fake-token")
+    api.token.get_api_server = MagicMock(return_value=base_url)
+    api.stocks.check_stocks = MagicMock(return_value=[])
+    api.stocks.get_tracked_symbol_ids = MagicMock(return_value={"AAPL": 8049, "MSFT": None})
+    return api
+
+
+def test_async_get_all_stocks_reuses_pooled_connection(mock_sessionmaker):
+    peers = set()
+
+    async def search(request):
+        peers.add(request.transport.get_extra_info("peername"))
+        assert request.headers["Authorization"] == "Bearer fake-token"
+        return web.json_response({"symbols": [{"symbolId": 27426}]})
+
+    async def quotes(request):
+        peers.add(request.transport.get_extra_info("peername"))
+        ids = request.query["ids"].split(",")
+        symbols = {"8049": "AAPL", "27426": "MSFT"}
+        return web.json_response({"quotes": [
+            {"symbol": symbols[i], "symbolId": int(i), "lastTradePrice": 100.0} for i in ids
+        ]})
+
+    async def scenario():
+        runner, base_url = await _start_stand_in([
+            web.get("/v1/symbols/search", search),
+            web.get("/v1/markets/quotes/", quotes),
+        ])
+        api = _async_api(mock_sessionmaker, base_url)
+        try:
+            await api.get_all_stocks()
+        finally:
+            await api.close()
+            await runner.cleanup()
+        return api
+
+    api = asyncio.run(scenario())
+
+    api.stocks.check_stocks.assert_called_once_with(
+        {"AAPL": 100.0, "MSFT": 100.0}, {"AAPL": 8049, "MSFT": 27426}
+    )
+    # both requests travelled over the same keep-alive connection
+    assert len(peers) == 1
+
+
+def test_async_request_failure_raises(mock_sessionmaker):
+    async def search(request):
+        return web.Response(status=500)
+
+    async def scenario():
+        runner, base_url = await _start_stand_in([web.get("/v1/symbols/search", search)])
+        api = _async_api(mock_sessionmaker, base_url)
+        try:
+            with pytest.raises(RuntimeError):
+                await api.get_stock_symbol("AAPL")
+        finally:
+            await api.close()
+            await runner.cleanup()
+
+    asyncio.run(scenario())
+
+
+def test_async_api_awaits_async_managers(mock_sessionmaker):
+    from unittest.mock import AsyncMock
+
+    async def quotes(request):
+        return web.json_response({"quotes": [{"symbol": "AAPL", "symbolId": 8049, "lastTradePrice": 100.0}]})
+
+    async def scenario():
+        runner, base_url = await _start_stand_in([web.get("/v1/markets/quotes/", quotes)])
+        api = _async_api(mock_sessionmaker, base_url)
+        # async managers (AsyncStockManager/AsyncTokenManager) are awaited on the loop
+        api.token.get_api_server = AsyncMock(return_value=base_url)
+        api.stocks.get_tracked_symbol_ids = AsyncMock(return_value={"AAPL": 8049})
+        api.stocks.check_stocks = AsyncMock(return_value=[])
+        try:
+            await api.get_all_stocks()
+        finally:
+            await api.close()
+            await runner.cleanup()
+        return api
+
+    api = asyncio.run(scenario())
+    api.stocks.check_stocks.assert_awaited_once_with({"AAPL": 100.0}, {"AAPL": 8049})
+
+
+# -------------------------
+# Rate limiter
+# -------------------------
+import datetime
+import time
+from tracking.rate_limit import TokenBucket, RateLimiter, endpoint_class
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_token_bucket_allows_burst_then_paces():
+    clock = FakeClock()
+    bucket = TokenBucket(rate=20, clock=clock)
+
+    waits = [bucket.reserve() for _ in range(22)]
+
+    assert waits[:20] == [0.0] * 20
+    assert waits[20] == pytest.approx(1 / 20)
+    assert waits[21] == pytest.approx(2 / 20)
+    assert bucket.stats.calls == 22
+    assert bucket.stats.throttled == 2
+    assert bucket.stats.max_wait == pytest.approx(0.1)
+
+    clock.now += 1.0
+    assert bucket.reserve() == 0.0
+
+
+def test_token_bucket_adapts_to_rate_limit_headers():
+    clock = FakeClock()
+    bucket = TokenBucket(rate=20, clock=clock)
+
+    # a fresh hourly window keeps the configured rate instead of spreading 15000 requests over the hour
+    bucket.update_from_headers({
+        "X-RateLimit-Remaining": "15000",
+        "X-RateLimit-Reset": str(time.time() + 3600),
+    })
+    assert bucket.rate == 20
+
+    # a small remaining budget only caps the burst
+    bucket.update_from_headers({
+        "X-RateLimit-Remaining": "10",
+        "X-RateLimit-Reset": str(time.time() + 100),
+    })
+    assert [bucket.reserve() for _ in range(10)] == [0.0] * 10
+    assert bucket.reserve() == pytest.approx(1 / 20)
+    assert bucket.rate == 20
+
+    # exhausted budget pauses until the reset
+    clock.now += 1
+    bucket.update_from_headers({
+        "X-RateLimit-Remaining": "0",
+        "X-RateLimit-Reset": str(time.time() + 5),
+    })
+    assert bucket.reserve() == pytest.approx(5, rel=1e-2)
+
+    # window reset restores the configured rate
+    clock.now += 6
+    bucket.reserve()
+    assert bucket.rate == 20
+
+
+def test_rate_limiter_classifies_endpoints():
+    assert endpoint_class("/v1/markets/quotes/") == "market"
+    assert endpoint_class("/v1/symbols/search") == "market"
+    assert endpoint_class("/v1/accounts/123/positions") == "account"
+
+    limiter = RateLimiter()
+    limiter.acquire("/v1/accounts")
+    assert limiter.stats()["account"].calls == 1
+    assert limiter.stats()["market"].calls == 0
+
+
+def test_requests_go_through_rate_limiter(api):
+    api._limiter = RateLimiter()
+    with patch.object(type(api.token), "get_api_server", new_callable=PropertyMock) as mock_server:
+        mock_server.return_value = "api.test.com"
+        with patch("tracking.api.requests.get") as mock_get:
+            mock_get.return_value.json.return_value = {"accounts": [{"number": "1"}]}
+            mock_get.return_value.headers = {}
+            assert api.get_accounts() == [{"number": "1"}]
+
+    assert api.rate_limit_stats()["account"].calls == 1
+
+
+# -------------------------
+# Chunked quote fetching
+# -------------------------
+from tracking import api as api_module
+
+
+def test_quote_chunks_respect_size_and_url_length(api):
+    ids = list(range(1_000_000, 1_000_250)) + [1_000_000]  # duplicate is dropped
+    chunks = list(api._quote_chunks(ids))
+
+    assert sum(len(c) for c in chunks) == 250
+    assert all(len(c) <= api_module.QUOTE_CHUNK_SIZE for c in chunks)
+    assert all(len(",".join(map(str, c))) <= api_module.QUOTE_IDS_MAX_LENGTH for c in chunks)
+
+
+def test_check_stock_info_streams_chunks(api):
+    def fake_get(url, headers, params, timeout):
+        ids = params["ids"].split(",")
+        resp = MagicMock()
+        resp.headers = {}
+        resp.raise_for_status.return_value = None
+        resp.json.return_value = {"quotes": [
+            {"symbol": f"T{i}", "symbolId": int(i), "lastTradePrice": 1.0} for i in ids
+        ]}
+        return resp
+
+    ids = list(range(1, 251))
+    with patch.object(type(api.token), "get_api_server", new_callable=PropertyMock) as mock_server:
+        mock_server.return_value = "api.test.com"
+        with patch("tracking.api.requests.get", side_effect=fake_get) as mock_get:
+            api.check_stock_info(ids)
+
+    assert mock_get.call_count == 3
+    # each chunk is evaluated as it arrives
+    assert api.stocks.check_stocks.call_count == 3
+    seen = set()
+    for call in api.stocks.check_stocks.call_args_list:
+        seen.update(call.args[1].values())
+    assert seen == set(ids)
+
+
+def test_check_stock_info_all_chunks_fail(api):
+    with patch.object(type(api.token), "get_api_server", new_callable=PropertyMock) as mock_server:
+        mock_server.return_value = "api.test.com"
+        with patch("tracking.api.requests.get") as mock_get:
+            mock_get.return_value.headers = {}
+            mock_get.return_value.raise_for_status.side_effect = requests.HTTPError("boom")
+            with pytest.raises(RuntimeError):
+                api.check_stock_info([1, 2, 3])
+
+
+def test_iter_quotes_stops_fetching_when_consumer_stops(api):
+    started = threading.Event()
+    unblock = threading.Event()
+    calls = []
+
+    def fake_get(url, headers, params, timeout):
+        calls.append(params["ids"])
+        if len(calls) > 1:
+            started.set()
+            unblock.wait(5)
+        resp = MagicMock(headers={})
+        resp.json.return_value = {"quotes": [{"symbol": f"T{i}", "symbolId": int(i), "lastTradePrice": 1.0} for i in params["ids"].split(",")]}
+        return resp
+
+    with patch.object(type(api.token), "get_api_server", new_callable=PropertyMock) as mock_server, \
+            patch("tracking.api.requests.get", side_effect=fake_get), patch.object(api_module, "QUOTE_WORKERS", 1):
+        mock_server.return_value = "api.test.com"
+        quotes = api.iter_quotes(list(range(1, 301)))
+        assert len(next(quotes)) == api_module.QUOTE_CHUNK_SIZE
+        assert started.wait(5)
+
+        closer = threading.Thread(target=quotes.close)
+        closer.start()
+        # close does not wait for the chunk in flight
+        closer.join(2)
+        stopped = not closer.is_alive()
+        unblock.set()
+        closer.join(5)
+
+    assert stopped
+    # the third chunk was never started; its ids are free for the next request
+    assert len(calls) == 2
+    assert api.quotes.claim([300]).owned == [300]
+
+def test_quote_chunks_are_spread_across_pooled_logins(api):
+    from database.token_manager import CachedToken
+    from database.token_pool import TokenPool
+
+    second = MagicMock(login="second")
+    second.cached_token.return_value = CachedToken("second-token", "api2.test.com", datetime.datetime.max)
+    api.tokens = TokenPool([api.token, second], revoked_retry=60)
+    api._limiter = RateLimiter()
+    used = []
+
+    def fake_get(url, headers, params, timeout):
+        used.append((url.split("/v1")[0], headers["Authorization"]))
+        resp = MagicMock(headers={})
+        resp.json.return_value = {"quotes": [{"symbol": f"T{i}", "symbolId": int(i), "lastTradePrice": 1.0} for i in params["ids"].split(",")]}
+        return resp
+
+    with patch.object(type(api.token), "get_api_server", new_callable=PropertyMock) as mock_server:
+        mock_server.return_value = "api.test.com"
+        with patch("tracking.api.requests.get", side_effect=fake_get):
+            api.check_stock_info(list(range(1, 401)))
+
+    # each login's chunks go to its own api_server and count against its own budget
+    assert sorted(set(used)) == [
+        ("https://api.test.com", "Bearer fake-token"), ("https://api2.test.com", "Bearer second-token"),
+    ]
+    stats = api.rate_limit_stats()
+    assert stats["market"].calls == stats["market:second"].calls == 2
+
+
+def test_revoked_login_is_set_aside_for_market_data(api):
+    from database.token_pool import TokenPool
+
+    revoked = MagicMock(login="revoked")
+    revoked.cached_token.return_value = None
+    revoked.get_access_token.side_effect = requests.HTTPError("400 Client Error")
+    api.tokens = TokenPool([revoked, api.token], revoked_retry=60)
+
+    with patch.object(type(api.token), "get_api_server", new_callable=PropertyMock) as mock_server:
+        mock_server.return_value = "api.test.com"
+        with patch("tracking.api.requests.get") as mock_get:
+            mock_get.return_value.json.return_value = {"symbols": [{"symbol": "AAPL", "symbolId": 8049}]}
+            mock_get.return_value.headers = {}
+            assert api.get_stock_symbol("AAPL") == 8049
+            assert api.get_stock_symbol("AAPL") == 8049
+
+    # tried once, then skipped until its wait is over
+    revoked.get_access_token.assert_called_once()
+    assert api.tokens.available() == [None]
+
+
+# -------------------------
+# Quote cache
+# -------------------------
+import threading
+from tracking.quote_cache import QuoteCache, _quote_size
+
+
+def _quotes_response(url, headers, params, timeout):
+    resp = MagicMock(headers={})
+    resp.json.return_value = {"quotes": [
+        {"symbol": f"T{i}", "symbolId": int(i), "lastTradePrice": 1.0, "currency": "USD"} for i in params["ids"].split(",")
+    ]}
+    return resp
+
+
+def test_quote_cache_expires_and_evicts_least_recently_used():
+    now = [0.0]
+    quote = {"symbolId": 1, "symbol": "T1", "lastTradePrice": 1.0}
+    cache = QuoteCache(ttl=5, max_bytes=10 ** 6, clock=lambda: now[0])
+
+    assert cache.claim([1]).owned == [1]
+    cache.put([1], [quote])
+    assert cache.claim([1]).cached == [quote]
+    now[0] = 5.0
+    # stale: fetched again
+    assert cache.claim([1]).owned == [1]
+
+    # room for two quotes: touching 1 makes 2 the least recently used
+    cache = QuoteCache(ttl=5, max_bytes=2 * _quote_size(quote), clock=lambda: now[0])
+    for sym_id in (1, 2, 3):
+        if sym_id == 3:
+            cache.claim([1])
+        cache.claim([sym_id])
+        cache.put([sym_id], [dict(quote, symbolId=sym_id)])
+    assert [q["symbolId"] for q in cache.claim([1, 3]).cached] == [1, 3]
+    assert cache.claim([2]).owned == [2]
+    assert cache.stats().evictions == 1
+
+
+def test_abandoned_claim_leaves_later_fetches_alone():
+    quote = {"symbolId": 1, "symbol": "T1", "lastTradePrice": 1.0}
+    cache = QuoteCache(ttl=0)
+
+    first = cache.claim([1, 2])
+    cache.put([1], [quote])
+    # ttl 0: the next request fetches id 1 again while the first caller still owns id 2
+    second = cache.claim([1])
+    waiter = cache.claim([1])
+    cache.abandon(first)
+
+    assert first.futures[2].result() is None
+    assert not second.futures[1].done()
+    cache.put([1], [quote])
+    assert cache.wait(waiter.waiting, timeout=1) == [quote]
+
+
+def test_add_tracked_stock_reuses_polled_quote(api):
+    api.quotes = QuoteCache(ttl=60)
+    api.stocks.get_symbol_id_for = MagicMock(return_value=2)
+    api.stocks.add_stock = MagicMock()
+    api.stocks.set_symbol_id_for = MagicMock()
+
+    with patch.object(type(api.token), "get_api_server", new_callable=PropertyMock) as mock_server:
+        mock_server.return_value = "api.test.com"
+        with patch("tracking.api.requests.get", side_effect=_quotes_response) as mock_get:
+            api.check_stock_info([1, 2])
+            api.add_tracked_stock("T2")
+
+    mock_get.assert_called_once()
+    api.stocks.add_stock.assert_called_once_with("T2", 1.0, "USD")
+    assert api.quote_cache_stats().hits == 1
+
+
+def test_concurrent_quote_requests_share_one_fetch(api):
+    api.quotes = QuoteCache(ttl=0)
+    entered = threading.Event()
+    release = threading.Event()
+
+    def slow_get(url, headers, params, timeout):
+        entered.set()
+        release.wait(5)
+        return _quotes_response(url, headers, params, timeout)
+
+    results = {}
+    with patch.object(type(api.token), "get_api_server", new_callable=PropertyMock) as mock_server:
+        mock_server.return_value = "api.test.com"
+        with patch("tracking.api.requests.get", side_effect=slow_get) as mock_get:
+            first = threading.Thread(target=lambda: results.update(first=api._get_quotes_by_ids([7])))
+            first.start()
+            entered.wait(5)
+            second = threading.Thread(target=lambda: results.update(second=api._get_quotes_by_ids([7])))
+            second.start()
+            while api.quote_cache_stats().coalesced == 0:
+                time.sleep(0.01)
+            release.set()
+            first.join(5)
+            second.join(5)
+
+    mock_get.assert_called_once()
+    assert results["first"][7] == results["second"][7]
+    # ttl 0: nothing kept once the fetch is shared
+    assert api.quote_cache_stats().entries == 0
+
+
+# -------------------------
+# Symbol resolution + persistent cache
+# -------------------------
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from database.models import Base
+from database.symbol_cache import SymbolCacheManager
+from tracking.api import SymbolNotFound
+
+
+@pytest.fixture
+def symbol_cache():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(engine)
+    yield SymbolCacheManager(sessionmaker(bind=engine, expire_on_commit=False))
+    engine.dispose()
+
+
+def test_lookup_symbol_ids_uses_cache_and_negative_cache(api, symbol_cache):
+    api.symbols = symbol_cache
+    symbols = {
+        "AAPL": {"symbol": "AAPL", "symbolId": 8049, "listingExchange": "NASDAQ", "currency": "USD"},
+        "SHOP.TO": {"symbol": "SHOP.TO", "symbolId": 3, "listingExchange": "TSX", "currency": "CAD"},
+    }
+
+    def search(ticker):
+        if ticker not in symbols:
+            raise SymbolNotFound(ticker)
+        return symbols[ticker]
+
+    api._search_symbol = MagicMock(side_effect=search)
+
+    first = api.lookup_symbol_ids(["AAPL", "SHOP.TO", "NOPE"])
+    second = api.lookup_symbol_ids(["AAPL", "SHOP.TO", "NOPE"])
+
+    assert first == second == {"AAPL": 8049, "SHOP.TO": 3}
+    # every ticker, including the failed one, was searched exactly once
+    assert api._search_symbol.call_count == 3
+    assert symbol_cache.get("SHOP.TO").listing_exchange == "TSX"
+
+
+def test_lookup_symbol_ids_does_not_cache_transient_failures(api, symbol_cache):
+    api.symbols = symbol_cache
+    api._search_symbol = MagicMock(side_effect=RuntimeError("Failed to get response"))
+
+    assert api.lookup_symbol_ids(["AAPL"]) == {}
+    assert api.lookup_symbol_ids(["AAPL"]) == {}
+    assert api._search_symbol.call_count == 2
+
+
+def test_pick_symbol_prefers_exact_match(api):
+    result = {"symbols": [{"symbol": "AAPL.MX", "symbolId": 1}, {"symbol": "AAPL", "symbolId": 8049}]}
+    assert api._pick_symbol("AAPL", result)["symbolId"] == 8049
+    with pytest.raises(SymbolNotFound):
+        api._pick_symbol("NOPE", {"symbols": []})
+
+
+def test_unauthorized_response_invalidates_cached_token(api):
+    api.token.invalidate = MagicMock()
+    unauthorized = MagicMock(status_code=401, headers={})
+    unauthorized.raise_for_status.side_effect = requests.HTTPError("401")
+    ok = MagicMock(status_code=200, headers={})
+    ok.json.return_value = {"accounts": []}
+
+    with patch.object(type(api.token), "get_api_server", new_callable=PropertyMock) as mock_server:
+        mock_server.return_value = "api.test.com"
+        with patch("tracking.api.requests.get", side_effect=[unauthorized, ok]):
+            assert api.get_accounts() == []
+
+    api.token.invalidate.assert_called_once()
+
+
+# -------------------------
+# QuoteStream (local WebSocket stand-in)
+# -------------------------
+import json
+from websockets.asyncio.server import serve
+from tracking.stream import QuoteStream
+
+
+def test_quote_stream_coalesces_flushes_and_reconnects(mock_sessionmaker):
+    connections = []
+
+    async def ws_handler(ws):
+        token = await ws.recv()
+        connections.append(token)
+        await ws.send(json.dumps({"success": True}))
+        if len(connections) == 1:
+            # several ticks for the same ticker, the last one should win; delta without symbol name
+            for price in (101.0, 102.0, 103.0):
+                await ws.send(json.dumps({"quotes": [{"symbol": "AAPL", "symbolId": 8049, "lastTradePrice": price}]}))
+            await ws.send(json.dumps({"quotes": [{"symbolId": 27426, "lastTradePrice": 55.0}]}))
+            # drop the connection: the stream must reconnect
+            return
+        await ws.send(json.dumps({"quotes": [{"symbolId": 27426, "lastTradePrice": 56.0}]}))
+        await ws.wait_closed()
+
+    async def scenario():
+        async with serve(ws_handler, "127.0.0.1", 0) as ws_server:
+            ws_port = ws_server.sockets[0].getsockname()[1]
+
+            async def quotes(request):
+                assert request.query["stream"] == "true"
+                assert request.query["mode"] == "WebSocket"
+                assert set(request.query["ids"].split(",")) == {"8049", "27426"}
+                return web.json_response({"streamPort": ws_port})
+
+            runner, base_url = await _start_stand_in([web.get("/v1/markets/quotes/", quotes)])
+            api = _async_api(mock_sessionmaker, base_url)
+            api.stocks.get_tracked_symbol_ids = MagicMock(return_value={"AAPL": 8049, "MSFT": 27426})
+            stream = QuoteStream(api, flush_interval=0.05, initial_backoff=0.01, max_backoff=0.05)
+            task = asyncio.create_task(stream.run())
+            try:
+                for _ in range(200):
+                    await asyncio.sleep(0.01)
+                    flushed = [call.args[0] for call in api.stocks.check_stocks.call_args_list]
+                    if len(connections) >= 2 and any(prices.get("MSFT") == 56.0 for prices in flushed):
+                        break
+            finally:
+                await stream.stop()
+                await task
+                await api.close()
+                await runner.cleanup()
+        return api
+
+    api = asyncio.run(scenario())
+
+    # authenticated on the first connection and again after reconnecting
+    assert connections[:2] == ["fake-token", "fake-token"]
+    latest = {}
+    for call in api.stocks.check_stocks.call_args_list:
+        latest.update(call.args[0])
+    # delta without a symbol name is mapped back through the subscription
+    assert latest == {"AAPL": 103.0, "MSFT": 56.0}
+
+
+def test_quote_stream_resubscribes_when_tracked_stocks_change(mock_sessionmaker):
+    subscriptions = []
+
+    async def ws_handler(ws):
+        await ws.recv()
+        await ws.wait_closed()
+
+    async def scenario():
+        async with serve(ws_handler, "127.0.0.1", 0) as ws_server:
+            ws_port = ws_server.sockets[0].getsockname()[1]
+
+            async def quotes(request):
+                subscriptions.append(set(request.query["ids"].split(",")))
+                return web.json_response({"streamPort": ws_port})
+
+            runner, base_url = await _start_stand_in([web.get("/v1/markets/quotes/", quotes)])
+            api = _async_api(mock_sessionmaker, base_url)
+            tracked = {"AAPL": 8049}
+            api.stocks.get_tracked_symbol_ids = MagicMock(side_effect=lambda: dict(tracked))
+            stream = QuoteStream(api, flush_interval=0.05, initial_backoff=0.01, max_backoff=0.05, resubscribe_interval=0.05)
+            task = asyncio.create_task(stream.run())
+            try:
+                for _ in range(200):
+                    await asyncio.sleep(0.01)
+                    if subscriptions and stream._ws is not None:
+                        break
+                # e.g. add_tracked_stock while streaming
+                tracked["MSFT"] = 27426
+                for _ in range(200):
+                    await asyncio.sleep(0.01)
+                    if len(subscriptions) >= 2:
+                        break
+            finally:
+                await stream.stop()
+                await task
+                await api.close()
+                await runner.cleanup()
+
+    asyncio.run(scenario())
+
+    assert subscriptions[:2] == [{"8049"}, {"8049", "27426"}]
+
+
+def test_stream_port_is_requested_on_the_primary_login(mock_sessionmaker):
+    from database.token_manager import CachedToken
+    from database.token_pool import AsyncTokenPool
+
+    authorizations = []
+
+    async def quotes(request):
+        authorizations.append(request.headers["Authorization"])
+        return web.json_response({"streamPort": 4000})
+
+    async def scenario():
+        runner, base_url = await _start_stand_in([web.get("/v1/markets/quotes/", quotes)])
+        api = _async_api(mock_sessionmaker, base_url)
+        second = MagicMock(login="second")
+        second.cached_token.return_value = CachedToken("second-token", base_url, datetime.datetime.max)
+        api.tokens = AsyncTokenPool([api.token, second], revoked_retry=60)
+        stream = QuoteStream(api)
+        try:
+            # round-robin would hand the second request to the pooled login
+            return [await stream._stream_url([8049]) for _ in range(2)]
+        finally:
+            await api.close()
+            await runner.cleanup()
+
+    urls = asyncio.run(scenario())
+
+    # the websocket authenticates with the primary token, so the port must be opened with it too
+    assert authorizations == ["Bearer fake-token", "Bearer fake-token"]
+    assert all(url.endswith(":4000/") for url in urls)
+
+
+def test_quote_stream_keeps_only_latest_tick(mock_sessionmaker):
+    api = _async_api(mock_sessionmaker, "http://127.0.0.1:1")
+    stream = QuoteStream(api)
+
+    async def scenario():
+        for price in (1.0, 2.0, 3.0):
+            await stream._ingest(json.dumps({"quotes": [{"symbol": "AAPL", "symbolId": 8049, "lastTradePrice": price}]}))
+        await stream.flush()
+        # nothing new since the last flush
+        await stream.flush()
+
+    asyncio.run(scenario())
+    api.stocks.check_stocks.assert_called_once_with({"AAPL": 3.0}, {"AAPL": 8049})
+
+
+def test_quote_mode_defaults_to_rest_polling():
+    from utils.env_vars import _parse_quote_mode
+
+    # streaming is opt-in: upgrading must not switch existing deployments to the WebSocket
+    assert _parse_quote_mode(None) == "poll"
+    assert _parse_quote_mode("STREAM") == "stream"
+
+
+# -------------------------
+# Market hours + market-aware scheduler
+# -------------------------
+import datetime
+from zoneinfo import ZoneInfo
+from tracking.market_hours import MarketCalendar, PRE, REGULAR, AFTER, CLOSED
+from tracking.scheduler import schedule_market_checks
+
+ET = ZoneInfo("America/New_York")
+
+
+def _et(*args):
+    return datetime.datetime(*args, tzinfo=ET)
+
+
+def test_market_calendar_sessions():
+    calendar = MarketCalendar()
+
+    assert calendar.session("NASDAQ", _et(2026, 10, 19, 8, 0)) == PRE
+    assert calendar.session("NASDAQ", _et(2026, 10, 19, 10, 0)) == REGULAR
+    assert calendar.session("NYSE", _et(2026, 10, 19, 17, 0)) == AFTER
+    assert calendar.session("NYSE", _et(2026, 10, 19, 21, 0)) == CLOSED
+    # weekend, US holiday, early close
+    assert calendar.session("NYSE", _et(2026, 10, 17, 10, 0)) == CLOSED
+    assert calendar.session("NYSE", _et(2026, 11, 26, 10, 0)) == CLOSED
+    assert calendar.session("NYSE", _et(2026, 11, 27, 14, 0)) == CLOSED
+    # Canadian Thanksgiving: TSX closed while US markets trade
+    assert calendar.session("TSX", _et(2026, 10, 12, 10, 0)) == CLOSED
+    assert calendar.session("NYSE", _et(2026, 10, 12, 10, 0)) == REGULAR
+    # TSX has no pre-market session
+    assert calendar.session("TSX", _et(2026, 10, 19, 8, 0)) == CLOSED
+
+
+def test_market_calendar_next_active():
+    saturday = _et(2026, 10, 17, 12, 0)
+
+    assert MarketCalendar().next_active("NYSE", saturday) == _et(2026, 10, 19, 4, 0)
+    regular_only = MarketCalendar(extended_hours=False)
+    assert regular_only.next_active("NYSE", saturday) == _et(2026, 10, 19, 9, 30)
+    assert not regular_only.is_active("NYSE", _et(2026, 10, 19, 8, 0))
+
+
+def _run_one_cycle(api_helper, calendar, now):
+    sleeps = []
+
+    async def fake_sleep(delay):
+        sleeps.append(delay)
+        raise asyncio.CancelledError
+
+    class FrozenDatetime(datetime.datetime):
+        @classmethod
+        def now(cls, tz=None):
+            return now.astimezone(tz)
+
+    with patch("tracking.scheduler.asyncio.sleep", fake_sleep), \
+            patch("tracking.scheduler.datetime.datetime", FrozenDatetime):
+        with pytest.raises(asyncio.CancelledError):
+            asyncio.run(schedule_market_checks(api_helper, calendar, active_delay=60, closed_delay=1800))
+    return sleeps[0]
+
+
+def test_market_checks_skip_closed_exchanges(api):
+    api.tracked_exchanges = MagicMock(return_value={"AAPL": "NASDAQ", "SHOP.TO": "TSX"})
+    api.get_all_stocks = MagicMock()
+
+    # Canadian Thanksgiving: only the US listing is quoted
+    delay = _run_one_cycle(api, MarketCalendar(), _et(2026, 10, 12, 10, 0))
+
+    api.get_all_stocks.assert_called_once_with({"NASDAQ"})
+    assert delay == 60
+
+
+def test_market_checks_sleep_while_closed(api):
+    api.tracked_exchanges = MagicMock(return_value={"AAPL": "NASDAQ"})
+    api.get_all_stocks = MagicMock()
+
+    # 20 minutes before pre-market opens
+    delay = _run_one_cycle(api, MarketCalendar(), _et(2026, 10, 19, 3, 40))
+
+    api.get_all_stocks.assert_not_called()
+    assert delay == pytest.approx(20 * 60)
+
+
+def test_filter_by_exchange_uses_symbol_cache(api, symbol_cache):
+    api.symbols = symbol_cache
+    symbol_cache.put("AAPL", 8049, "NASDAQ", "USD")
+    symbol_cache.put("SHOP.TO", 3, "TSX", "CAD")
+    tracked = {"AAPL": 8049, "SHOP.TO": 3, "OLD": 7}
+
+    # tickers without a cached exchange match None
+    assert api._filter_by_exchange(tracked, {"NASDAQ", None}) == {"AAPL": 8049, "OLD": 7}
+    assert api._filter_by_exchange(tracked, {"TSX"}) == {"SHOP.TO": 3}
+
+
+def test_alert_queue_dispatches_breaches_in_one_batch():
+    import asyncio
+    import threading
+    from unittest.mock import AsyncMock
+    from tracking.alert_queue import AlertQueue
+
+    api = MagicMock()
+    api.stocks.alert_stocks = AsyncMock()
+
+    async def scenario():
+        queue = AlertQueue(api, digest_window=0.05)
+        queue.attach()
+        # on the loop (AsyncStockManager) and from a worker thread (StockManager)
+        api.stocks.on_breach(["MSFT"])
+        worker = threading.Thread(target=api.stocks.on_breach, args=(["AAPL", "TSLA"],))
+        worker.start()
+        worker.join()
+        return await asyncio.wait_for(queue.dispatch_once(), 1)
+
+    assert sorted(asyncio.run(scenario())) == ["AAPL", "MSFT", "TSLA"]
+    api.stocks.alert_stocks.assert_awaited_once()
+
+
+def test_stock_manager_notifies_on_new_breaches_only():
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+    from sqlalchemy.pool import StaticPool
+    from database.models import Base
+    from database.stock_tracker import StockManager
+
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(engine)
+    sm = StockManager(sessionmaker(bind=engine, expire_on_commit=False))
+    sm.on_breach = MagicMock()
+
+    sm.add_stock("MSFT", 200, "USD")
+    sm.check_stocks({"MSFT": 150})
+    # still below the stop: already queued
+    sm.check_stocks({"MSFT": 149})
+
+    sm.on_breach.assert_called_once_with(["MSFT"])
+    engine.dispose()
@@ -0,0 +1,74 @@
+import asyncio
+import logging
+
+from typing import Iterable, List
+
+from .api import QTradeAPI
+from .async_api import AsyncQTradeAPI, call_db
+
+# Purpose: event-driven alert dispatch
+# - StockManager.on_breach pushes newly breached tickers onto an asyncio queue
+# - run() wakes up on the first breach and calls alert_stocks() within seconds
+# - digest mode holds the first breach for a window so the ones that follow go out in the same message
+# - the once-per-day dedupe stays in alert_stocks (Stock.last_notified / AlertOutbox idempotency keys)
+
+logger = logging.getLogger(__name__)
+
+# short pause after the first breach in immediate mode: one quote batch usually flags several stocks
+IMMEDIATE_COALESCE = 0.5
+
+
+class AlertQueue():
+    def __init__(self, api_helper: QTradeAPI | AsyncQTradeAPI, digest_window: float | None = None) -> None:
+        # digest_window: seconds to collect breaches before dispatching (None: immediate)
+        self.api = api_helper
+        self.window = IMMEDIATE_COALESCE if digest_window is None else digest_window
+        self._queue: asyncio.Queue[str] = asyncio.Queue()
+        self._loop: asyncio.AbstractEventLoop | None = None
+
+    def attach(self) -> None:
+        # must run on the event loop that will consume the queue
+        self._loop = asyncio.get_running_loop()
+        self.api.stocks.on_breach = self.notify
+
+    def _put(self, tickers: List[str]) -> None:
+        for ticker in tickers:
+            self._queue.put_nowait(ticker)
+
+    def notify(self, tickers: Iterable[str]) -> None:
+        # called by AsyncStockManager on the loop, or by StockManager from a worker thread
+        tickers = list(tickers)
+        try:
+            on_loop = asyncio.get_running_loop() is self._loop
+        except RuntimeError:
+            on_loop = False
+        if on_loop or self._loop is None:
+            self._put(tickers)
+        else:
+            self._loop.call_soon_threadsafe(self._put, tickers)
+
+    def _drain(self) -> List[str]:
+        tickers = []
+        while not self._queue.empty():
+            tickers.append(self._queue.get_nowait())
+        return tickers
+
+    async def dispatch_once(self) -> List[str]:
+        # waits for a breach, collects the window's breaches, sends one alert; returns the tickers dispatched
+        tickers = [await self._queue.get()]
+        await asyncio.sleep(self.window)
+        tickers.extend(self._drain())
+
+        logger.info(f"Dispatching alerts for {len(set(tickers))} breached stock(s)")
+        await call_db(self.api.stocks.alert_stocks)
+        return tickers
+
+    async def run(self) -> None:
+        self.attach()
+        while True:
+            try:
+                await self.dispatch_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Alert dispatch failed.")
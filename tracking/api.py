@@ -1,34 +1,65 @@
 import requests
-import asyncio
 import logging
-import time
 
-from typing import List, Dict, Any, Iterable
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import List, Dict, Any, Iterable, Iterator, Set
 from database.token_manager import TokenManager
-from database.stock_tracker import StockManager
+from database.token_pool import TokenPool, TokenPoolBase
+from database.stock_tracker import DEFAULT_WATCHLIST, StockManager
+from database.symbol_cache import SymbolCacheManager
 from sqlalchemy.orm import sessionmaker
+from tracking.quote_cache import QuoteCache, QuoteCacheStats
+from tracking.rate_limit import RateLimiter, RateLimitStats, rate_limiter
 
-''' Websocket not implemented
-from websockets.exceptions import ConnectionClosed
-from websockets.asyncio.client import connect
-'''
 # implementation of QTradeWorker
 # - utilizes both StockTracker and TokenManager
-# - adds async functionality and websocket connection to the QuestTrade API
+# - market-data requests (quotes, symbol search) are spread across the logins of a TokenPool; account calls use the primary token
+# - every quote path goes through iter_quotes and its QuoteCache: fresh quotes are reused, concurrent requests share one fetch
+# - async variant in tracking/async_api.py, websocket streaming in tracking/stream.py
 
 
 logger = logging.getLogger(__name__)
 REQUEST_TIMEOUT = 15
 
-class QTradeAPI():
-    def __init__(self, sessionmaker: sessionmaker) -> None:
-        self.token = TokenManager(sessionmaker)
-        self.stocks = StockManager(sessionmaker)
-
-        # for async relating to WebSocket, currently incomplete
-        self._running = False
-        self._change_lock = asyncio.Lock()
-        self._latest_changes = {}
+QUOTES_PATH = '/v1/markets/quotes/'
+# quote requests are split so the ids parameter keeps request URLs well below common length limits
+QUOTE_CHUNK_SIZE = 100
+QUOTE_IDS_MAX_LENGTH = 1500
+# concurrent quote chunk requests; overall pace is still set by the rate limiter
+QUOTE_WORKERS = 4
+# how long a caller waits on another caller's in-flight quote fetch (one fetch makes up to 3 attempts)
+QUOTE_WAIT_TIMEOUT = REQUEST_TIMEOUT * 3
+# concurrent symbols/search requests when resolving many tickers
+SYMBOL_WORKERS = 8
+
+
+class SymbolNotFound(RuntimeError):
+    # symbols/search succeeded but returned no match: safe to negative-cache
+    pass
+
+
+class QTradeBase():
+    # shared state and helpers for the sync (QTradeAPI) and async (AsyncQTradeAPI) clients
+
+    def __init__(
+        self,
+        sessionmaker: sessionmaker,
+        limiter: RateLimiter | None = None,
+        token=None,
+        stocks=None,
+        tokens: TokenPoolBase | None = None,
+        quotes: QuoteCache | None = None,
+    ) -> None:
+        # token/stocks: pre-built managers (ie. the async ones); default to the sync managers on sessionmaker
+        self.token = token or TokenManager(sessionmaker)
+        # primary token plus the QUESTRADE_LOGINS tokens, for market data
+        self.tokens = tokens or self._token_pool(sessionmaker)
+        self.stocks = stocks or StockManager(sessionmaker)
+        self.symbols = SymbolCacheManager(sessionmaker)
+        # token buckets per endpoint class, shared process-wide by default
+        self._limiter = limiter or rate_limiter
+        # quotes by symbolId, shared by every quote path of this client (pass one QuoteCache to share it across clients)
+        self.quotes = quotes or QuoteCache.from_settings()
 
     @property
     def header(self):
@@ -36,97 +67,241 @@ class QTradeAPI():
             'Authorization': f"Bearer {self.token.get_access_token()}"
         }
         return header
+
+    def _reauthorize(self) -> Dict[str, str]:
+        # after a 401 the cached access token cannot be trusted: reload it (refreshing if expired)
+        self.token.invalidate()
+        return self.header
     
-    def get_stock_symbol(self, ticker):
-        # make REST API request to get symbol
-        ticker = ticker.strip().upper()
-        end_point = f'{self._base_url()}/v1/symbols/search'
-        headers = self.header
-        
-        # REST API rate-limit is 20 requests a second 
+    def _token_pool(self, sessionmaker: sessionmaker) -> TokenPoolBase:
+        return TokenPool.from_settings(self.token, lambda login, seed: TokenManager(sessionmaker, login, seed))
+
+    def rate_limit_stats(self) -> Dict[str, RateLimitStats]:
+        # how often and how long callers waited on the rate limiter, per endpoint class
+        return self._limiter.stats()
+
+    def quote_cache_stats(self) -> QuoteCacheStats:
+        # hits, misses and requests served by another caller's in-flight fetch
+        return self.quotes.stats()
+
+    def _base_url(self) -> str:
+        get_api_server = self.token.get_api_server
+        api_server = get_api_server() if callable(get_api_server) else get_api_server
+        return self._format_base_url(api_server)
+
+    def _format_base_url(self, api_server: str) -> str:
+        api_server = str(api_server).rstrip("/")
+        if api_server.startswith(("http://", "https://")):
+            return api_server.removesuffix("/v1")
+        return f"https://{api_server.removesuffix('/v1')}"
+
+    def _extract_ticker_currency(self, position: Dict[str, Any]) -> tuple[str, str]:
+        # Questrade position symbol format may include suffixes; prefer 'symbol'
+        symbol = position.get("symbol")
+        if not symbol:
+            raise RuntimeError("Position missing symbol")
+        currency = position.get("currency") or position.get("currentMarketValueCurrency") or "USD"
+        return str(symbol).upper(), str(currency).upper()
+
+    def _pick_symbol(self, ticker: str, result: Dict[str, Any]) -> Dict[str, Any]:
+        # symbols/search is a prefix search: prefer the exact ticker, otherwise the first match
+        symbols = result.get('symbols') or result.get('symbol') or []
+        if not symbols:
+            raise SymbolNotFound(f"No Questrade symbol found for {ticker}.")
+        for symbol in symbols:
+            if str(symbol.get('symbol', '')).upper() == ticker:
+                return symbol
+        return symbols[0]
+
+    def _symbol_cache_entry(self, ticker: str, symbol: Dict[str, Any] | None) -> Dict[str, Any]:
+        if symbol is None:
+            # negative cache entry
+            return {'ticker': ticker, 'symbol_id': None}
+        return {
+            'ticker': ticker,
+            'symbol_id': int(symbol['symbolId']),
+            'listing_exchange': symbol.get('listingExchange'),
+            'currency': symbol.get('currency'),
+        }
+
+    def _cached_symbol_ids(self, tickers: List[str]) -> tuple[Dict[str, int], List[str]]:
+        # split tickers into cached ids and tickers that still need a lookup
+        # fresh negative entries are neither returned nor looked up again
+        cached = self.symbols.get_many(tickers)
+        mapping: Dict[str, int] = {}
+        misses: List[str] = []
+        for ticker in tickers:
+            entry = cached.get(ticker.strip().upper())
+            if entry is None:
+                misses.append(ticker)
+            elif entry.symbol_id is not None:
+                mapping[ticker] = entry.symbol_id
+            else:
+                logger.debug(f"Skipping {ticker}: cached as not found")
+        return mapping, misses
+
+    def tracked_exchanges(self) -> Dict[str, str | None]:
+        # ticker -> listing exchange (None when unknown) for every tracked stock
+        tickers = list(self.stocks.get_tracked_symbol_ids())
+        exchanges = self.symbols.get_exchanges(tickers)
+        return {ticker: exchanges.get(ticker) for ticker in tickers}
+
+    def _filter_by_exchange(self, tracked: Dict[str, int | None], exchanges: Set[str | None]) -> Dict[str, int | None]:
+        # keep only tickers listed on one of the given exchanges (None matches tickers with an unknown exchange)
+        listing = self.symbols.get_exchanges(tracked.keys())
+        return {ticker: sym_id for ticker, sym_id in tracked.items() if listing.get(ticker) in exchanges}
+
+    def _quote_chunks(self, ids: Iterable[int]) -> Iterator[List[int]]:
+        # split (deduplicated) ids into URL-safe chunks for the quotes endpoint
+        chunk: List[int] = []
+        length = 0
+        for sym_id in dict.fromkeys(ids):
+            # id plus separating comma
+            size = len(str(sym_id)) + (1 if chunk else 0)
+            if chunk and (len(chunk) >= QUOTE_CHUNK_SIZE or length + size > QUOTE_IDS_MAX_LENGTH):
+                yield chunk
+                chunk = []
+                length = 0
+                size -= 1
+            chunk.append(sym_id)
+            length += size
+        if chunk:
+            yield chunk
+
+    def _quote_price(self, quote: Dict[str, Any]) -> float | None:
+        price = quote.get("lastTradePrice") or quote.get("bidPrice") or quote.get("askPrice")
+        return float(price) if price is not None else None
+
+    def _collect_quotes(self, quotes: Iterable[Dict[str, Any]]) -> tuple[Dict[str, float], Dict[str, int]]:
+        # split a quote response into ticker -> price and ticker -> symbolId for StockManager.check_stocks
+        prices: Dict[str, float] = {}
+        symbol_ids: Dict[str, int] = {}
+        for stock in quotes:
+            # changed Ticker limitations to allow for a greater 
+            # range of tickers (ie. > 5 chars)
+            stock_ticker = stock['symbol']
+            stock_price = self._quote_price(stock)
+            if stock_price is None:
+                logger.warning(f"Skipping {stock_ticker}: quote did not include a usable price.")
+                continue
+            prices[stock_ticker] = stock_price
+            # cache symbol id when present
+            sym_id = stock.get('symbolId')
+            if sym_id is not None:
+                symbol_ids[stock_ticker] = int(sym_id)
+        return prices, symbol_ids
+
+
+class QTradeAPI(QTradeBase):
+    def _send(self, base_url: str, path: str, headers: Dict[str, str], params: Dict[str, Any] | None = None, login: str | None = None) -> requests.Response:
+        # every REST request waits for a token from the rate limiter (the login's own budget) then feeds back the server's budget
+        self._limiter.acquire(path, login)
+        resp = requests.get(f"{base_url}{path}", headers=headers, params=params, timeout=REQUEST_TIMEOUT)
+        self._limiter.update_from_headers(path, resp.headers, login)
+        return resp
+
+    def _market_get(self, path: str, params: Dict[str, Any]) -> requests.Response:
+        # read-only market-data request on the next pooled login; a 401 moves on to a fresh lease
+        lease = self.tokens.lease()
         for attempt in range(3):
             # arbitrary number of attempts
+            resp = None
             try:
-                result = requests.get(
-                    end_point,
-                    headers=headers,
-                    params={'prefix': ticker},
-                    timeout=REQUEST_TIMEOUT,
-                )
-                time.sleep(0.2)
-
-                result.raise_for_status()
-                result = result.json()
-                symbols = result.get('symbols') or result.get('symbol') or []
-                if symbols:
-                    return symbols[0]['symbolId']
-                else:
-                    raise RuntimeError(f"No Questrade symbol found for {ticker}.")
-                
+                resp = self._send(self._format_base_url(lease.api_server), path, lease.header, params, lease.login)
+                resp.raise_for_status()
+                self.tokens.ok(lease.login)
+                return resp
             except requests.RequestException as e:
-                logger.error(f'Error: {e} occurred while retrieving object, retrying!')
-                # possible refresh required
-                token = self.token.get_access_token()
-        
-        raise RuntimeError('Failed to get response')
+                logger.error(f"GET {path} failed: {e}; attempt {attempt+1}/3")
+                if resp is not None and resp.status_code == 401:
+                    # possible refresh required
+                    self.tokens.unauthorized(lease.login)
+                    lease = self.tokens.lease()
+        raise RuntimeError(f"Failed to GET {path}")
+
+    def _search_symbol(self, ticker: str) -> Dict[str, Any]:
+        # make REST API request to get symbol details
+        ticker = ticker.strip().upper()
+        # REST API rate-limit is 20 requests a second per login: enforced by the shared rate limiter
+        try:
+            result = self._market_get('/v1/symbols/search', {'prefix': ticker})
+        except RuntimeError:
+            raise RuntimeError('Failed to get response')
+        return self._pick_symbol(ticker, result.json())
+
+    def get_stock_symbol(self, ticker):
+        return self._search_symbol(ticker)['symbolId']
     
+    def _fetch_quote_chunk(self, chunk: List[int]) -> List[Dict[str, Any]]:
+        try:
+            resp = self._market_get(QUOTES_PATH, {'ids': ",".join(map(str, chunk))})
+        except RuntimeError:
+            # callers waiting on these ids stop waiting
+            self.quotes.release(chunk)
+            raise RuntimeError(f"Failed to fetch quotes for {len(chunk)} ids")
+        # will return a dict where the quotes key contains a list of stocks given by id
+        quotes = resp.json().get('quotes', [])
+        self.quotes.put(chunk, quotes)
+        return quotes
+
+    def iter_quotes(self, ids: Iterable[int]) -> Iterator[List[Dict[str, Any]]]:
+        '''
+        unified quote fetcher: fresh cached quotes are yielded first, the remaining ids are split into URL-safe chunks
+        and fetched concurrently (paced by the shared rate limiter, each chunk on the next pooled login), each chunk's
+        quotes are yielded as soon as they arrive, then the quotes other callers were already fetching
+        chunks that fail every attempt are logged and skipped
+        '''
+        claim = self.quotes.claim(ids)
+        if claim.cached:
+            yield claim.cached
+
+        chunks = list(self._quote_chunks(claim.owned))
+        pool = ThreadPoolExecutor(max_workers=min(QUOTE_WORKERS * len(self.tokens.managers), len(chunks))) if chunks else None
+        try:
+            if pool is not None:
+                futures = [pool.submit(self._fetch_quote_chunk, chunk) for chunk in chunks]
+                for future in as_completed(futures):
+                    try:
+                        yield future.result()
+                    except RuntimeError as e:
+                        logger.error(f"Skipping quote chunk: {e}")
+        finally:
+            if pool is not None:
+                # consumer stopped early: drop the chunks not started yet instead of waiting for every fetch
+                pool.shutdown(wait=False, cancel_futures=True)
+            # hand the unfetched ids back so waiters do not hang
+            self.quotes.abandon(claim)
+
+        shared = self.quotes.wait(claim.waiting, QUOTE_WAIT_TIMEOUT)
+        if len(shared) < len(claim.waiting):
+            logger.warning(f"Skipping {len(claim.waiting) - len(shared)} quote(s) another in-flight request did not return")
+        if shared:
+            yield shared
+
     def check_stock_info(self, id_list: List[int]) -> None:
         if not id_list:
             return
 
-        end_point = f'{self._base_url()}/v1/markets/quotes/'
-        headers = self.header
-
         # REST API rate-limit is 20 requests a second; much more efficient to provide list of stock_ids
-        for attempt in range(3):
-            # arbitrary number of attempts
-            try:
-                result = requests.get(
-                    end_point,
-                    headers=headers,
-                    params={'ids': ",".join(map(str, id_list))},
-                    timeout=REQUEST_TIMEOUT,
-                )
-                # will return a dict where the stock key contains a list of stocks given by id
-                time.sleep(0.2)
-                result.raise_for_status()
-                result = result.json()
-                if result:
-                    for stock in result.get('quotes', []):
-                        # changed Ticker limitations to allow for a greater 
-                        # range of tickers (ie. > 5 chars)
-                        stock_ticker = stock['symbol']
-                        stock_price = self._quote_price(stock)
-                        if stock_price is None:
-                            logger.warning(f"Skipping {stock_ticker}: quote did not include a usable price.")
-                            continue
-                        # cache symbol id when present
-                        try:
-                            sym_id = stock.get('symbolId')
-                            if sym_id is not None:
-                                self.stocks.set_symbol_id_for(stock_ticker, int(sym_id))
-                        except Exception:
-                            pass
-                        self.stocks.check_stock(stock_ticker, stock_price)
-                    return
-                else:
-                    logger.error(f'Error: result was empty.')
-                    # will automatically try again
-                
-            except requests.RequestException as e:
-                logger.error(f'Error: {e} occurred while retrieving object, retrying!')
-                # possible refresh required
-                token = self.token.get_access_token()
-
-        raise RuntimeError('Failed to get response')
+        received = False
+        for quotes in self.iter_quotes(id_list):
+            received = True
+            prices, symbol_ids = self._collect_quotes(quotes)
+            # evaluate each chunk in a single transaction as soon as it arrives
+            self.stocks.check_stocks(prices, symbol_ids)
+
+        if not received:
+            raise RuntimeError('Failed to get response')
     
-    def get_all_stocks(self):
-        stock_list = self.stocks.get_tracked_stock_tickers()
-        # prefer cached ids
+    def get_all_stocks(self, exchanges: Set[str | None] | None = None):
+        # prefer cached ids: loaded for every tracked stock with a single query
+        tracked = self.stocks.get_tracked_symbol_ids()
+        if exchanges is not None:
+            # skip tickers whose exchange is closed
+            tracked = self._filter_by_exchange(tracked, exchanges)
         id_list: List[int] = []
         missing: List[str] = []
-        for stock in stock_list:
-            stock_id = self.stocks.get_symbol_id_for(stock)
+        for stock, stock_id in tracked.items():
             if stock_id is None:
                 missing.append(stock)
             else:
@@ -144,29 +319,20 @@ class QTradeAPI():
     # -----------------------------
     # Questrade account integration
     # -----------------------------
-    def _base_url(self) -> str:
-        get_api_server = self.token.get_api_server
-        api_server = get_api_server() if callable(get_api_server) else get_api_server
-        api_server = str(api_server).rstrip("/")
-        if api_server.startswith(("http://", "https://")):
-            return api_server.removesuffix("/v1")
-        return f"https://{api_server.removesuffix('/v1')}"
-
     def _get(self, path: str, params: Dict[str, Any] | None = None) -> Dict[str, Any]:
-        url = f"{self._base_url()}{path}"
+        base_url = self._base_url()
         headers = self.header
         for attempt in range(3):
             resp = None
             try:
-                resp = requests.get(url, headers=headers, params=params, timeout=REQUEST_TIMEOUT)
-                time.sleep(0.2)
+                resp = self._send(base_url, path, headers, params)
                 resp.raise_for_status()
                 return resp.json()
             except requests.RequestException as e:
                 logger.error(f"GET {path} failed: {e}; attempt {attempt+1}/3")
                 # force token refresh on 401
                 if resp is not None and resp.status_code == 401:
-                    _ = self.token.get_access_token()
+                    headers = self._reauthorize()
         raise RuntimeError(f"Failed to GET {path}")
 
     def get_accounts(self) -> List[Dict[str, Any]]:
@@ -186,36 +352,32 @@ class QTradeAPI():
             positions.extend(self.get_positions(str(acct_id)))
         return positions
 
-    def _extract_ticker_currency(self, position: Dict[str, Any]) -> tuple[str, str]:
-        # Questrade position symbol format may include suffixes; prefer 'symbol'
-        symbol = position.get("symbol")
-        if not symbol:
-            raise RuntimeError("Position missing symbol")
-        currency = position.get("currency") or position.get("currentMarketValueCurrency") or "USD"
-        return str(symbol).upper(), str(currency).upper()
-
-    def _batch(self, iterable: Iterable[Any], size: int) -> Iterable[List[Any]]:
-        batch: List[Any] = []
-        for item in iterable:
-            batch.append(item)
-            if len(batch) >= size:
-                yield batch
-                batch = []
-        if batch:
-            yield batch
-
-    def _quote_price(self, quote: Dict[str, Any]) -> float | None:
-        price = quote.get("lastTradePrice") or quote.get("bidPrice") or quote.get("askPrice")
-        return float(price) if price is not None else None
-
     def lookup_symbol_ids(self, tickers: List[str]) -> Dict[str, int]:
-        # Use symbols/search per ticker due to API; cache as needed
-        mapping: Dict[str, int] = {}
-        for ticker in tickers:
-            try:
-                mapping[ticker] = self.get_stock_symbol(ticker)
-            except Exception:
-                logger.warning(f"Could not resolve symbol id for {ticker}")
+        # resolve through the persistent symbol cache first; misses are searched concurrently
+        mapping, misses = self._cached_symbol_ids(tickers)
+        if not misses:
+            return mapping
+
+        entries: List[Dict[str, Any]] = []
+        with ThreadPoolExecutor(max_workers=min(SYMBOL_WORKERS, len(misses))) as pool:
+            futures = {pool.submit(self._search_symbol, ticker): ticker for ticker in misses}
+            for future in as_completed(futures):
+                ticker = futures[future]
+                try:
+                    symbol = future.result()
+                except SymbolNotFound:
+                    logger.warning(f"Could not resolve symbol id for {ticker}")
+                    entries.append(self._symbol_cache_entry(ticker, None))
+                    continue
+                except Exception:
+                    # transient failure: not cached so the next sync retries
+                    logger.warning(f"Could not resolve symbol id for {ticker}")
+                    continue
+                entries.append(self._symbol_cache_entry(ticker, symbol))
+                mapping[ticker] = int(symbol['symbolId'])
+
+        if entries:
+            self.symbols.put_many(entries)
         return mapping
 
     def sync_tracked_from_accounts(self) -> None:
@@ -248,33 +410,12 @@ class QTradeAPI():
             logger.info("No symbol ids resolved for new tickers")
             return
 
-        # Fetch quotes in chunks and add
-        # Reuse check_stock_info to update values? Here we need prices, so query directly
-        quotes_url = f"{self._base_url()}/v1/markets/quotes/"
-        headers = self.header
+        # Fetch quotes through the chunked fetcher
         prices: Dict[int, float] = {}
-        for chunk in self._batch(ids, 50):
-            for attempt in range(3):
-                resp = None
-                try:
-                    resp = requests.get(
-                        quotes_url,
-                        headers=headers,
-                        params={"ids": ",".join(map(str, chunk))},
-                        timeout=REQUEST_TIMEOUT,
-                    )
-                    time.sleep(0.2)
-                    resp.raise_for_status()
-                    data = resp.json()
-                    for q in data.get("quotes", []):
-                        price = self._quote_price(q)
-                        if price is not None:
-                            prices[q["symbolId"]] = price
-                    break
-                except requests.RequestException as e:
-                    logger.error(f"quotes fetch failed: {e}")
-                    if resp is not None and resp.status_code == 401:
-                        _ = self.token.get_access_token()
+        for sym_id, q in self._get_quotes_by_ids(ids).items():
+            price = self._quote_price(q)
+            if price is not None:
+                prices[sym_id] = price
 
         # Add to DB
         for ticker in to_add:
@@ -293,29 +434,10 @@ class QTradeAPI():
     # GUI-facing helpers
     # -----------------------------
     def _get_quotes_by_ids(self, ids: List[int]) -> Dict[int, Dict[str, Any]]:
-        quotes_url = f"{self._base_url()}/v1/markets/quotes/"
-        headers = self.header
         result: Dict[int, Dict[str, Any]] = {}
-        for chunk in self._batch(ids, 50):
-            for attempt in range(3):
-                resp = None
-                try:
-                    resp = requests.get(
-                        quotes_url,
-                        headers=headers,
-                        params={"ids": ",".join(map(str, chunk))},
-                        timeout=REQUEST_TIMEOUT,
-                    )
-                    time.sleep(0.2)
-                    resp.raise_for_status()
-                    data = resp.json()
-                    for q in data.get("quotes", []):
-                        result[q["symbolId"]] = q
-                    break
-                except requests.RequestException as e:
-                    logger.error(f"quotes fetch failed: {e}")
-                    if resp is not None and resp.status_code == 401:
-                        _ = self.token.get_access_token()
+        for quotes in self.iter_quotes(ids):
+            for q in quotes:
+                result[q["symbolId"]] = q
         return result
 
     def add_tracked_stock(self, ticker: str, currency: str | None = None) -> None:
@@ -324,7 +446,9 @@ class QTradeAPI():
         ticker = ticker.strip().upper() 
         sym_id = self.stocks.get_symbol_id_for(ticker)
         if sym_id is None:
-            sym_id = self.get_stock_symbol(ticker)
+            sym_id = self.lookup_symbol_ids([ticker]).get(ticker)
+            if sym_id is None:
+                raise RuntimeError(f"No Questrade symbol found for {ticker}.")
 
         quotes = self._get_quotes_by_ids([sym_id])
         q = quotes.get(sym_id, {})
@@ -341,67 +465,15 @@ class QTradeAPI():
         except Exception:
             pass
 
+    def watch_stock(self, user: str, ticker: str, watchlist: str = DEFAULT_WATCHLIST, currency: str | None = None) -> None:
+        """Add a ticker to a user's watchlist, tracking it first if no one watches it yet (one quote per ticker for all users)."""
+        ticker = ticker.strip().upper()
+        if ticker not in set(self.stocks.get_tracked_stock_tickers()):
+            self.add_tracked_stock(ticker, currency)
+        self.stocks.watch(user, ticker, watchlist)
+
     def remove_tracked_stock(self, ticker: str) -> None:
         """Remove a tracked stock by ticker."""
         logger.info(f"Removing tracked stock: {ticker}")
         self.stocks.remove_stock(ticker)
         logger.info(f"Successfully removed tracked stock: {ticker}")
-
-
-
-
-
-
-
-
-
-    ''' TODO: complete WebSocket streaming for live data feeds
-
-    async def async_get_access_token(self):
-        # since token.access_token is a property, use lambda to turn to func
-        return await asyncio.to_thread(self.token.get_access_token)
-    
-
-    async def get_websocket_listener(self):
-
-        while self.running:
-            try:
-                async with connect(uri = "") as ws:
-                    pass
-            except ConnectionClosed:
-                pass
-
-    async def update_stock_data(self):
-        while self.running:
-            # process changes and save in shallow copy to free resource
-            async with self._change_lock:
-                latest_changes = self._latest_changes.copy()
-                self._latest_changes.clear()
-
-            for change_key, changed_price in latest_changes.items():
-                await asyncio.to_thread(self.stocks.check_stock, change_key, changed_price)
-            
-            await asyncio.sleep(300)
-            # sleep for 5 minutes
-
-    
-    async def _start(self):
-        self.running = True
-        websocket_tast = asyncio.create_task(self.get_websocket_listener())
-        update_task = asyncio.create_task(self.update_stock_data())
-
-        await asyncio.gather(websocket_tast, update_task)
-
-    async def _stop(self):
-        self.running = False
-    '''
-
-
-            
-        
-
-
-        
-
-
-    
@@ -0,0 +1,367 @@
+import aiohttp
+import asyncio
+import logging
+
+from typing import List, Dict, Any, AsyncIterator, Iterable, Set
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from sqlalchemy.orm import sessionmaker
+from database.async_db import call_db
+from database.async_stock_tracker import AsyncStockManager
+from database.stock_tracker import DEFAULT_WATCHLIST
+from database.async_token_manager import AsyncTokenManager
+from database.token_manager import TokenManager
+from database.token_pool import AsyncTokenPool, TokenLease, TokenPoolBase
+from tracking.api import QTradeBase, SymbolNotFound, REQUEST_TIMEOUT, QUOTES_PATH, QUOTE_WAIT_TIMEOUT
+from tracking.quote_cache import QuoteCache
+from tracking.rate_limit import RateLimiter, endpoint_class
+
+# async variant of QTradeAPI
+# - HTTP requests run on the event loop through pooled keep-alive aiohttp sessions
+# - with an async_sessionmaker, stock and token database work runs on the loop too (AsyncStockManager/AsyncTokenManager);
+#   sync managers and the symbol cache are moved off the loop with to_thread
+
+logger = logging.getLogger(__name__)
+
+# connection pool limits per api_server
+POOL_LIMIT = 20
+KEEPALIVE_TIMEOUT = 60
+
+
+class ClientSessionPool():
+    '''
+    Keeps one aiohttp.ClientSession (and therefore one keep-alive connection pool)
+    per api_server so every AsyncQTradeAPI talking to the same server reuses connections
+    instead of repeating TCP + TLS handshakes
+    '''
+
+    def __init__(self, limit: int = POOL_LIMIT, keepalive_timeout: float = KEEPALIVE_TIMEOUT) -> None:
+        self._limit = limit
+        self._keepalive_timeout = keepalive_timeout
+        # api_server -> (session, loop the session was created on)
+        self._sessions: Dict[str, tuple[aiohttp.ClientSession, asyncio.AbstractEventLoop]] = {}
+
+    def get(self, api_server: str) -> aiohttp.ClientSession:
+        # must be called from within a running event loop
+        session, session_loop = self._sessions.get(api_server, (None, None))
+        loop = asyncio.get_running_loop()
+        if session is None or session.closed or session_loop is not loop:
+            # sessions are bound to the loop they were created on
+            connector = aiohttp.TCPConnector(
+                limit=self._limit,
+                keepalive_timeout=self._keepalive_timeout,
+            )
+            session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=REQUEST_TIMEOUT),
+                raise_for_status=True,
+            )
+            self._sessions[api_server] = (session, loop)
+        return session
+
+    async def close(self) -> None:
+        sessions = [session for session, _ in self._sessions.values()]
+        self._sessions.clear()
+        for session in sessions:
+            if not session.closed:
+                await session.close()
+
+
+# shared by every AsyncQTradeAPI in the process
+client_pool = ClientSessionPool()
+
+
+class AsyncQTradeAPI(QTradeBase):
+    def __init__(
+        self,
+        sessionmaker: sessionmaker,
+        pool: ClientSessionPool | None = None,
+        limiter: RateLimiter | None = None,
+        async_sessionmaker: async_sessionmaker | None = None,
+        quotes: QuoteCache | None = None,
+    ) -> None:
+        self._async_sessionmaker = async_sessionmaker
+        if async_sessionmaker is not None:
+            super().__init__(
+                sessionmaker, limiter,
+                token = AsyncTokenManager(async_sessionmaker),
+                stocks = AsyncStockManager(async_sessionmaker),
+                quotes = quotes,
+            )
+        else:
+            super().__init__(sessionmaker, limiter, quotes = quotes)
+        self._pool = pool or client_pool
+
+    def _token_pool(self, sessionmaker: sessionmaker) -> TokenPoolBase:
+        # pooled logins use the same kind of manager as the primary token
+        if self._async_sessionmaker is not None:
+            return AsyncTokenPool.from_settings(self.token, lambda login, seed: AsyncTokenManager(self._async_sessionmaker, login, seed))
+        return AsyncTokenPool.from_settings(self.token, lambda login, seed: TokenManager(sessionmaker, login, seed))
+
+    async def close(self) -> None:
+        await self._pool.close()
+
+    async def _access_token(self) -> str:
+        # served from TokenManager's in-memory cache; only hits the database or
+        # refreshes the token near expiry, so the thread hop is only taken then
+        access_token = self.token.cached_access_token()
+        if access_token is None:
+            access_token = await call_db(self.token.get_access_token)
+        return access_token
+
+    async def _api_base_url(self) -> str:
+        return self._format_base_url(await call_db(self.token.get_api_server))
+
+    def _pooled(self, path: str, primary: bool) -> bool:
+        # read-only market data may use any pooled login; account calls (and primary=True requests) belong to the primary login
+        return not primary and endpoint_class(path) == 'market'
+
+    async def _lease(self, path: str, primary: bool = False) -> TokenLease:
+        if self._pooled(path, primary):
+            return await self.tokens.lease()
+        return TokenLease(self.token.login, await self._access_token(), await call_db(self.token.get_api_server))
+
+    async def _relogin(self, path: str, lease: TokenLease, primary: bool = False) -> TokenLease:
+        # after a 401: reload the token (refreshing if expired); pooled market data may move on to another login
+        if self._pooled(path, primary):
+            self.tokens.unauthorized(lease.login)
+        else:
+            self.token.invalidate()
+        return await self._lease(path, primary)
+
+    async def _request(self, path: str, params: Dict[str, Any] | None = None, primary: bool = False) -> Dict[str, Any]:
+        # primary: stay on the primary login (ie. a stream port the websocket then opens with the primary token)
+        lease = await self._lease(path, primary)
+        for attempt in range(3):
+            base_url = self._format_base_url(lease.api_server)
+            session = self._pool.get(base_url)
+            # shared rate limiter (per login budget); waiting does not block the event loop
+            await self._limiter.acquire_async(path, lease.login)
+            try:
+                async with session.get(f"{base_url}{path}", headers=lease.header, params=params) as resp:
+                    self._limiter.update_from_headers(path, resp.headers, lease.login)
+                    data = await resp.json()
+                self.tokens.ok(lease.login)
+                return data
+            except aiohttp.ClientResponseError as e:
+                self._limiter.update_from_headers(path, e.headers, lease.login)
+                logger.error(f"GET {path} failed: {e.status} {e.message}; attempt {attempt+1}/3")
+                if e.status == 401:
+                    # force token refresh on 401
+                    lease = await self._relogin(path, lease, primary)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                logger.error(f"GET {path} failed: {e!r}; attempt {attempt+1}/3")
+        raise RuntimeError(f"Failed to GET {path}")
+
+    async def _get(self, path: str, params: Dict[str, Any] | None = None) -> Dict[str, Any]:
+        return await self._request(path, params)
+
+    async def _search_symbol(self, ticker: str) -> Dict[str, Any]:
+        ticker = ticker.strip().upper()
+        result = await self._request('/v1/symbols/search', {'prefix': ticker})
+        return self._pick_symbol(ticker, result)
+
+    async def get_stock_symbol(self, ticker: str) -> int:
+        return (await self._search_symbol(ticker))['symbolId']
+
+    async def _fetch_quote_chunk(self, chunk: List[int]) -> List[Dict[str, Any]]:
+        try:
+            data = await self._request(QUOTES_PATH, {'ids': ",".join(map(str, chunk))})
+        except RuntimeError:
+            # callers waiting on these ids stop waiting
+            self.quotes.release(chunk)
+            raise
+        quotes = data.get('quotes', [])
+        self.quotes.put(chunk, quotes)
+        return quotes
+
+    async def iter_quotes(self, ids: Iterable[int]) -> AsyncIterator[List[Dict[str, Any]]]:
+        # async counterpart of QTradeAPI.iter_quotes: cached quotes first, then all missing chunks are
+        # requested concurrently (paced by the rate limiter) and each chunk's quotes are yielded as soon as it arrives,
+        # then the quotes other callers were already fetching
+        claim = self.quotes.claim(ids)
+        if claim.cached:
+            yield claim.cached
+
+        tasks = [
+            asyncio.create_task(self._fetch_quote_chunk(chunk))
+            for chunk in self._quote_chunks(claim.owned)
+        ]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                try:
+                    quotes = await next_done
+                except RuntimeError as e:
+                    logger.error(f"Skipping quote chunk: {e}")
+                    continue
+                yield quotes
+        finally:
+            # consumer stopped early: do not leave requests running, and hand the unfetched ids back so waiters do not hang
+            for task in tasks:
+                task.cancel()
+            self.quotes.abandon(claim)
+
+        shared = await self.quotes.wait_async(claim.waiting, QUOTE_WAIT_TIMEOUT)
+        if len(shared) < len(claim.waiting):
+            logger.warning(f"Skipping {len(claim.waiting) - len(shared)} quote(s) another in-flight request did not return")
+        if shared:
+            yield shared
+
+    async def _get_quotes_by_ids(self, ids: List[int]) -> Dict[int, Dict[str, Any]]:
+        result: Dict[int, Dict[str, Any]] = {}
+        async for quotes in self.iter_quotes(ids):
+            for q in quotes:
+                result[q['symbolId']] = q
+        return result
+
+    async def check_stock_info(self, id_list: List[int]) -> None:
+        if not id_list:
+            return
+
+        received = False
+        async for quotes in self.iter_quotes(id_list):
+            received = True
+            prices, symbol_ids = self._collect_quotes(quotes)
+            # evaluate each chunk in a single transaction as soon as it arrives
+            await call_db(self.stocks.check_stocks, prices, symbol_ids)
+
+        if not received:
+            raise RuntimeError('Failed to get response')
+
+    async def lookup_symbol_ids(self, tickers: List[str]) -> Dict[str, int]:
+        # resolve through the persistent symbol cache first; misses are searched concurrently
+        mapping, misses = await asyncio.to_thread(self._cached_symbol_ids, tickers)
+        if not misses:
+            return mapping
+
+        results = await asyncio.gather(
+            *(self._search_symbol(ticker) for ticker in misses),
+            return_exceptions=True,
+        )
+        entries: List[Dict[str, Any]] = []
+        for ticker, result in zip(misses, results):
+            if isinstance(result, SymbolNotFound):
+                logger.warning(f"Could not resolve symbol id for {ticker}")
+                entries.append(self._symbol_cache_entry(ticker, None))
+            elif isinstance(result, Exception):
+                # transient failure: not cached so the next sync retries
+                logger.warning(f"Could not resolve symbol id for {ticker}")
+            else:
+                entries.append(self._symbol_cache_entry(ticker, result))
+                mapping[ticker] = int(result['symbolId'])
+
+        if entries:
+            await asyncio.to_thread(self.symbols.put_many, entries)
+        return mapping
+
+    async def tracked_exchanges(self) -> Dict[str, str | None]:
+        tickers = list(await call_db(self.stocks.get_tracked_symbol_ids))
+        exchanges = await asyncio.to_thread(self.symbols.get_exchanges, tickers)
+        return {ticker: exchanges.get(ticker) for ticker in tickers}
+
+    async def get_all_stocks(self, exchanges: Set[str | None] | None = None) -> None:
+        # prefer cached ids: loaded for every tracked stock with a single query
+        tracked = await call_db(self.stocks.get_tracked_symbol_ids)
+        if exchanges is not None:
+            # skip tickers whose exchange is closed
+            tracked = await asyncio.to_thread(self._filter_by_exchange, tracked, exchanges)
+        id_list: List[int] = []
+        missing: List[str] = []
+        for stock, stock_id in tracked.items():
+            if stock_id is None:
+                missing.append(stock)
+            else:
+                id_list.append(stock_id)
+        if missing:
+            resolved = await self.lookup_symbol_ids(missing)
+            id_list.extend(resolved.values())
+        # symbol ids for newly resolved tickers are persisted by check_stocks
+        await self.check_stock_info(id_list)
+
+    # -----------------------------
+    # Questrade account integration
+    # -----------------------------
+    async def get_accounts(self) -> List[Dict[str, Any]]:
+        data = await self._get("/v1/accounts")
+        return data.get("accounts", [])
+
+    async def get_positions(self, account_id: str) -> List[Dict[str, Any]]:
+        data = await self._get(f"/v1/accounts/{account_id}/positions")
+        return data.get("positions", [])
+
+    async def get_positions_all_accounts(self) -> List[Dict[str, Any]]:
+        account_ids = [str(acct["number"]) for acct in await self.get_accounts() if acct.get("number")]
+        results = await asyncio.gather(*(self.get_positions(acct_id) for acct_id in account_ids))
+        return [position for positions in results for position in positions]
+
+    async def sync_tracked_from_accounts(self) -> None:
+        """
+        Async counterpart of QTradeAPI.sync_tracked_from_accounts: add positions from all
+        Questrade accounts that are not yet tracked. Existing stocks are left unchanged.
+        """
+        positions = await self.get_positions_all_accounts()
+        ticker_currency: Dict[str, str] = {}
+        for pos in positions:
+            try:
+                ticker, currency = self._extract_ticker_currency(pos)
+                ticker_currency[ticker] = currency
+            except Exception as e:
+                logger.warning(f"Skipping position due to parse error: {e}")
+
+        existing = set(await call_db(self.stocks.get_tracked_stock_tickers))
+        to_add = [t for t in ticker_currency.keys() if t not in existing]
+        if not to_add:
+            logger.info("No new symbols to add from Questrade positions")
+            return
+
+        id_map = await self.lookup_symbol_ids(to_add)
+        if not id_map:
+            logger.info("No symbol ids resolved for new tickers")
+            return
+
+        quotes = await self._get_quotes_by_ids(list(id_map.values()))
+        for ticker in to_add:
+            sym_id = id_map.get(ticker)
+            price = self._quote_price(quotes.get(sym_id, {})) or 0.0
+            currency = ticker_currency.get(ticker, "USD")
+            try:
+                await call_db(self.stocks.add_stock, ticker, float(price), currency)
+                if sym_id is not None:
+                    await call_db(self.stocks.set_symbol_id_for, ticker, int(sym_id))
+                logger.info(f"Added {ticker} at {price} {currency} from Questrade positions")
+            except RuntimeError:
+                logger.warning(f"Failed to add {ticker}: already exists or validation error")
+
+    # -----------------------------
+    # GUI-facing helpers
+    # -----------------------------
+    async def add_tracked_stock(self, ticker: str, currency: str | None = None) -> None:
+        """Add a new tracked stock by ticker. Resolves symbolId, fetches current price, and caches symbolId."""
+        ticker = ticker.strip().upper()
+        sym_id = await call_db(self.stocks.get_symbol_id_for, ticker)
+        if sym_id is None:
+            sym_id = (await self.lookup_symbol_ids([ticker])).get(ticker)
+            if sym_id is None:
+                raise RuntimeError(f"No Questrade symbol found for {ticker}.")
+
+        quotes = await self._get_quotes_by_ids([sym_id])
+        q = quotes.get(sym_id, {})
+        price = self._quote_price(q)
+        if price is None:
+            raise RuntimeError(f"Could not get a usable quote price for {ticker}.")
+        use_currency = currency or q.get("currency") or "USD"
+
+        await call_db(self.stocks.add_stock, ticker, float(price), str(use_currency).upper())
+        await call_db(self.stocks.set_symbol_id_for, ticker, int(sym_id))
+
+    async def watch_stock(self, user: str, ticker: str, watchlist: str = DEFAULT_WATCHLIST, currency: str | None = None) -> None:
+        """Add a ticker to a user's watchlist, tracking it first if no one watches it yet (one quote per ticker for all users)."""
+        ticker = ticker.strip().upper()
+        if ticker not in set(await call_db(self.stocks.get_tracked_stock_tickers)):
+            await self.add_tracked_stock(ticker, currency)
+        await call_db(self.stocks.watch, user, ticker, watchlist)
+
+    async def remove_tracked_stock(self, ticker: str) -> None:
+        """Remove a tracked stock by ticker."""
+        logger.info(f"Removing tracked stock: {ticker}")
+        await call_db(self.stocks.remove_stock, ticker)
+        logger.info(f"Successfully removed tracked stock: {ticker}")
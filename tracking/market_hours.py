@@ -0,0 +1,162 @@
+import datetime
+import json
+import logging
+
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterable, List, Set, Tuple
+from zoneinfo import ZoneInfo
+
+# Purpose: exchange session awareness for the scheduler
+# - pre-market / regular / after-hours sessions per exchange in the exchange's local time
+# - holidays and early closes come from a local calendar file (tracking/market_calendar.json by default)
+
+logger = logging.getLogger(__name__)
+
+PRE = 'pre'
+REGULAR = 'regular'
+AFTER = 'after'
+CLOSED = 'closed'
+
+DEFAULT_CALENDAR_PATH = Path(__file__).with_name('market_calendar.json')
+
+Window = Tuple[datetime.time, datetime.time]
+
+
+@dataclass(frozen=True)
+class ExchangeHours:
+    # key into the calendar file
+    market: str
+    timezone: str
+    regular: Window
+    pre: Window | None = None
+    after: Window | None = None
+
+
+US_HOURS = ExchangeHours(
+    market = 'US',
+    timezone = 'America/New_York',
+    pre = (datetime.time(4, 0), datetime.time(9, 30)),
+    regular = (datetime.time(9, 30), datetime.time(16, 0)),
+    after = (datetime.time(16, 0), datetime.time(20, 0)),
+)
+
+CA_HOURS = ExchangeHours(
+    market = 'CA',
+    timezone = 'America/Toronto',
+    regular = (datetime.time(9, 30), datetime.time(16, 0)),
+    # TSX post-market crossing session
+    after = (datetime.time(16, 15), datetime.time(17, 0)),
+)
+
+# Questrade listingExchange values
+EXCHANGE_HOURS: Dict[str, ExchangeHours] = {
+    'NYSE': US_HOURS,
+    'NASDAQ': US_HOURS,
+    'NYSEAM': US_HOURS,
+    'AMEX': US_HOURS,
+    'ARCA': US_HOURS,
+    'BATS': US_HOURS,
+    'PINX': US_HOURS,
+    'OTCBB': US_HOURS,
+    'TSX': CA_HOURS,
+    'TSXV': CA_HOURS,
+    'CNSX': CA_HOURS,
+    'NEO': CA_HOURS,
+}
+
+
+class MarketCalendar():
+    '''
+    Answers "is this exchange trading right now?" for the market-hours scheduler.
+    Unknown exchanges (ie. symbols resolved before listing exchanges were cached) use US hours.
+    '''
+
+    def __init__(self, path: str | Path | None = None, extended_hours: bool = True) -> None:
+        self.extended_hours = extended_hours
+        self._holidays: Dict[str, Set[datetime.date]] = {}
+        self._early_closes: Dict[str, Dict[datetime.date, datetime.time]] = {}
+        self._load(Path(path) if path else DEFAULT_CALENDAR_PATH)
+
+    def _load(self, path: Path) -> None:
+        try:
+            with open(path, encoding = 'utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError) as exc:
+            raise RuntimeError(f"Could not load market calendar {path}: {exc}") from exc
+
+        for market, entry in data.items():
+            self._holidays[market] = {datetime.date.fromisoformat(day) for day in entry.get('holidays', [])}
+            self._early_closes[market] = {
+                datetime.date.fromisoformat(day): datetime.time.fromisoformat(close)
+                for day, close in entry.get('early_closes', {}).items()
+            }
+
+    def hours_for(self, exchange: str | None) -> ExchangeHours:
+        return EXCHANGE_HOURS.get((exchange or '').upper(), US_HOURS)
+
+    def is_trading_day(self, exchange: str | None, day: datetime.date) -> bool:
+        hours = self.hours_for(exchange)
+        return day.weekday() < 5 and day not in self._holidays.get(hours.market, set())
+
+    def _windows(self, hours: ExchangeHours, day: datetime.date) -> List[Tuple[str, Window]]:
+        # sessions for a trading day; early closes shorten the regular session and drop after-hours
+        early_close = self._early_closes.get(hours.market, {}).get(day)
+        windows: List[Tuple[str, Window]] = []
+        if hours.pre:
+            windows.append((PRE, hours.pre))
+        windows.append((REGULAR, (hours.regular[0], early_close or hours.regular[1])))
+        if hours.after and not early_close:
+            windows.append((AFTER, hours.after))
+        return windows
+
+    def session(self, exchange: str | None, when: datetime.datetime | None = None) -> str:
+        hours = self.hours_for(exchange)
+        when = when or datetime.datetime.now(datetime.timezone.utc)
+        local = when.astimezone(ZoneInfo(hours.timezone))
+
+        if not self.is_trading_day(exchange, local.date()):
+            return CLOSED
+
+        now = local.time()
+        for name, (start, end) in self._windows(hours, local.date()):
+            if start <= now < end:
+                return name
+        return CLOSED
+
+    def is_active(self, exchange: str | None, when: datetime.datetime | None = None) -> bool:
+        active = (REGULAR, PRE, AFTER) if self.extended_hours else (REGULAR,)
+        return self.session(exchange, when) in active
+
+    def next_active(self, exchange: str | None, when: datetime.datetime | None = None) -> datetime.datetime | None:
+        # start of the next session this exchange trades in (now if already active)
+        when = when or datetime.datetime.now(datetime.timezone.utc)
+        if self.is_active(exchange, when):
+            return when
+
+        hours = self.hours_for(exchange)
+        tz = ZoneInfo(hours.timezone)
+        local = when.astimezone(tz)
+        # long weekends plus holidays never span more than a couple of weeks
+        for offset in range(15):
+            day = local.date() + datetime.timedelta(days = offset)
+            if not self.is_trading_day(exchange, day):
+                continue
+            for name, (start, _) in self._windows(hours, day):
+                if name != REGULAR and not self.extended_hours:
+                    continue
+                start_at = datetime.datetime.combine(day, start, tzinfo = tz)
+                if start_at > local:
+                    return start_at
+        return None
+
+    def active_exchanges(self, exchanges: Iterable[str | None], when: datetime.datetime | None = None) -> Set[str | None]:
+        return {exchange for exchange in set(exchanges) if self.is_active(exchange, when)}
+
+    def seconds_until_active(self, exchanges: Iterable[str | None], when: datetime.datetime | None = None) -> float | None:
+        # time until any of the given exchanges opens; None if none opens within the lookahead
+        when = when or datetime.datetime.now(datetime.timezone.utc)
+        starts = [start for start in (self.next_active(exchange, when) for exchange in set(exchanges)) if start]
+        if not starts:
+            return None
+        return max((min(starts) - when).total_seconds(), 0.0)
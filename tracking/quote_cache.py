@@ -0,0 +1,166 @@
+import asyncio
+import sys
+import threading
+import time
+
+from collections import OrderedDict
+from concurrent.futures import Future, InvalidStateError, wait
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterable, List
+
+from utils.env_vars import get_settings
+
+# Purpose: one in-memory quote cache for every REST quote path of a client
+# - quotes are keyed by symbolId and reused by other callers for ttl seconds (polling, add/sync of tracked stocks, GUI)
+# - concurrent requests for the same id share one in-flight fetch: claim() hands each id to exactly one fetcher,
+#   the others wait on its future until put() or release()
+# - least recently used quotes are evicted once the estimated size goes over max_bytes
+# - safe to use from worker threads; the async client awaits in-flight fetches with asyncio.wrap_future
+
+DEFAULT_TTL = 5.0
+DEFAULT_MAX_BYTES = 4 * 1024 * 1024
+
+Quote = Dict[str, Any]
+
+
+def _quote_size(quote: Quote) -> int:
+    # rough footprint of a quote: a flat dict of scalars
+    return sys.getsizeof(quote) + sum(sys.getsizeof(key) + sys.getsizeof(value) for key, value in quote.items())
+
+
+@dataclass
+class _Entry:
+    quote: Quote
+    fetched_at: float
+    size: int
+
+
+@dataclass
+class QuoteClaim:
+    # fresh quotes served from memory
+    cached: List[Quote] = field(default_factory = list)
+    # ids this caller must fetch, then hand to put() (or release() on failure)
+    owned: List[int] = field(default_factory = list)
+    # the in-flight future of each owned id; abandon() resolves the ones put()/release() never reached
+    futures: Dict[int, Future] = field(default_factory = dict)
+    # ids another caller is already fetching
+    waiting: Dict[int, Future] = field(default_factory = dict)
+
+
+@dataclass
+class QuoteCacheStats:
+    hits: int = 0
+    misses: int = 0
+    # ids served by another caller's in-flight fetch
+    coalesced: int = 0
+    evictions: int = 0
+    entries: int = 0
+    bytes: int = 0
+
+
+class QuoteCache():
+    def __init__(self, ttl: float = DEFAULT_TTL, max_bytes: int = DEFAULT_MAX_BYTES, clock: Callable[[], float] = time.monotonic) -> None:
+        # ttl 0 disables reuse (in-flight fetches are still shared); max_bytes 0 keeps nothing
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._clock = clock
+        self._entries: OrderedDict[int, _Entry] = OrderedDict()
+        self._inflight: Dict[int, Future] = {}
+        self._stats = QuoteCacheStats()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_settings(cls) -> "QuoteCache":
+        settings = get_settings()
+        return cls(settings.quote_cache_ttl, settings.quote_cache_max_bytes)
+
+    def claim(self, ids: Iterable[int]) -> QuoteClaim:
+        # split (deduplicated) ids into cached quotes, ids to fetch and ids already being fetched
+        claim = QuoteClaim()
+        with self._lock:
+            now = self._clock()
+            for sym_id in dict.fromkeys(ids):
+                entry = self._entries.get(sym_id)
+                if entry is not None and now - entry.fetched_at < self.ttl:
+                    self._entries.move_to_end(sym_id)
+                    claim.cached.append(entry.quote)
+                    self._stats.hits += 1
+                elif sym_id in self._inflight:
+                    claim.waiting[sym_id] = self._inflight[sym_id]
+                    self._stats.coalesced += 1
+                else:
+                    self._inflight[sym_id] = claim.futures[sym_id] = Future()
+                    claim.owned.append(sym_id)
+                    self._stats.misses += 1
+        return claim
+
+    def put(self, ids: Iterable[int], quotes: Iterable[Quote]) -> None:
+        # store fetched quotes and hand them to the callers waiting on ids (None for ids the response left out)
+        by_id = {quote['symbolId']: quote for quote in quotes if quote.get('symbolId') is not None}
+        with self._lock:
+            now = self._clock()
+            for sym_id, quote in by_id.items():
+                self._store(sym_id, quote, now)
+            resolved = [(self._inflight.pop(sym_id, None), by_id.get(sym_id)) for sym_id in ids]
+        for future, quote in resolved:
+            if future is not None:
+                future.set_result(quote)
+
+    def release(self, ids: Iterable[int]) -> None:
+        # fetch failed or was abandoned: waiters get None and the next claim fetches again
+        self.put(ids, [])
+
+    def abandon(self, claim: QuoteClaim) -> None:
+        # fetch stopped early (consumer gone, task cancelled): release only this claim's unresolved ids;
+        # ids already put may have been claimed again by another caller, whose fetch must not be touched
+        with self._lock:
+            unresolved = [future for future in claim.futures.values() if not future.done()]
+            for sym_id, future in claim.futures.items():
+                if self._inflight.get(sym_id) is future:
+                    del self._inflight[sym_id]
+        for future in unresolved:
+            try:
+                future.set_result(None)
+            except InvalidStateError:
+                # resolved by a worker in the meantime
+                pass
+
+    def _store(self, sym_id: int, quote: Quote, now: float) -> None:
+        # must hold self._lock
+        old = self._entries.pop(sym_id, None)
+        if old is not None:
+            self._stats.bytes -= old.size
+        size = _quote_size(quote)
+        if self.ttl <= 0 or size > self.max_bytes:
+            return
+        self._entries[sym_id] = _Entry(quote, now, size)
+        self._stats.bytes += size
+        while self._stats.bytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last = False)
+            self._stats.bytes -= evicted.size
+            self._stats.evictions += 1
+
+    def wait(self, waiting: Dict[int, Future], timeout: float | None = None) -> List[Quote]:
+        # quotes fetched by other callers; ids whose fetch failed or did not finish in time are left out
+        if not waiting:
+            return []
+        done, _ = wait(waiting.values(), timeout = timeout)
+        return [future.result() for future in done if future.result() is not None]
+
+    async def wait_async(self, waiting: Dict[int, Future], timeout: float | None = None) -> List[Quote]:
+        if not waiting:
+            return []
+        done, _ = await asyncio.wait([asyncio.wrap_future(future) for future in waiting.values()], timeout = timeout)
+        return [task.result() for task in done if task.result() is not None]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._stats.bytes = 0
+
+    def stats(self) -> QuoteCacheStats:
+        with self._lock:
+            return QuoteCacheStats(
+                self._stats.hits, self._stats.misses, self._stats.coalesced,
+                self._stats.evictions, len(self._entries), self._stats.bytes,
+            )
@@ -0,0 +1,199 @@
+import asyncio
+import logging
+import threading
+import time
+
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Mapping
+
+# Purpose: shared token-bucket rate limiting for Questrade REST calls
+# - one bucket per endpoint class (market data vs account calls), shared by every client in the process
+# - Questrade budgets are per token: requests made with a pooled login (database/token_pool.py) use that login's buckets
+# - safe to use from worker threads (acquire) and from the event loop (acquire_async)
+# - adapts to X-RateLimit-Remaining / X-RateLimit-Reset response headers
+
+logger = logging.getLogger(__name__)
+
+# Questrade limits: account calls 30 req/s, market data calls 20 req/s
+ENDPOINT_LIMITS: Dict[str, float] = {
+    'market': 20.0,
+    'account': 30.0,
+}
+
+MARKET_PATH_PREFIXES = ('/v1/markets', '/v1/symbols')
+
+
+def endpoint_class(path: str) -> str:
+    # classify a request path the same way Questrade does for rate limiting
+    return 'market' if path.startswith(MARKET_PATH_PREFIXES) else 'account'
+
+
+@dataclass
+class RateLimitStats:
+    calls: int = 0
+    # calls that had to wait for a token
+    throttled: int = 0
+    total_wait: float = 0.0
+    max_wait: float = 0.0
+
+    def record(self, wait: float) -> None:
+        self.calls += 1
+        if wait > 0:
+            self.throttled += 1
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+
+    @property
+    def average_wait(self) -> float:
+        return self.total_wait / self.calls if self.calls else 0.0
+
+
+def _header_number(headers: Mapping[str, Any], name: str) -> float | None:
+    value = headers.get(name)
+    if not isinstance(value, (str, int, float)):
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return None
+
+
+class TokenBucket():
+    '''
+    Token bucket refilled at `rate` tokens per second up to `capacity`.
+
+    Callers reserve a token under a short threading.Lock; when the bucket is empty the token
+    is borrowed (balance goes negative) and the caller sleeps for its share of the deficit.
+    Reservations are therefore served in order and the lock is never held while waiting,
+    which keeps the bucket usable from both threads and coroutines.
+    '''
+
+    def __init__(self, rate: float, capacity: float | None = None, clock: Callable[[], float] = time.monotonic) -> None:
+        if rate <= 0:
+            raise RuntimeError("Rate limit must be greater than 0.")
+        self._base_rate = float(rate)
+        self._rate = float(rate)
+        self._capacity = float(capacity if capacity is not None else rate)
+        self._tokens = self._capacity
+        self._clock = clock
+        self._updated = clock()
+        # monotonic time until which the server-provided budget applies
+        self._budget_until: float | None = None
+        self._lock = threading.Lock()
+        self.stats = RateLimitStats()
+
+    @property
+    def rate(self) -> float:
+        return self._rate
+
+    def _refill(self, now: float) -> None:
+        if self._budget_until is not None and now >= self._budget_until:
+            # server window has reset: restore configured rate
+            self._rate = self._base_rate
+            self._budget_until = None
+        elapsed = now - self._updated
+        if elapsed > 0:
+            self._tokens = min(self._capacity, self._tokens + elapsed * self._rate)
+            self._updated = now
+
+    def reserve(self) -> float:
+        # takes one token and returns how long the caller must wait before using it
+        with self._lock:
+            now = self._clock()
+            self._refill(now)
+            self._tokens -= 1
+            wait = 0.0 if self._tokens >= 0 else -self._tokens / self._rate
+            self.stats.record(wait)
+            return wait
+
+    def acquire(self) -> float:
+        wait = self.reserve()
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    async def acquire_async(self) -> float:
+        wait = self.reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return wait
+
+    def update_from_headers(self, headers: Mapping[str, Any] | None) -> None:
+        '''
+        X-RateLimit-Remaining: requests left in the current server window
+        X-RateLimit-Reset: unix timestamp at which the window resets
+
+        The window is long (an hour for market data), so the remaining budget only caps the burst
+        the bucket may send right away; the steady rate stays at the configured per-second limit.
+        An exhausted budget pauses the bucket until the reset.
+        '''
+        if not headers:
+            return
+        remaining = _header_number(headers, 'X-RateLimit-Remaining')
+        reset = _header_number(headers, 'X-RateLimit-Reset')
+        if remaining is None or reset is None:
+            return
+
+        seconds_left = reset - time.time()
+        if seconds_left <= 0:
+            return
+
+        with self._lock:
+            now = self._clock()
+            self._refill(now)
+            if remaining <= 0:
+                # nothing left: next token becomes available at the reset
+                self._budget_until = now + seconds_left
+                self._rate = 1 / seconds_left
+                self._tokens = min(self._tokens, 0.0)
+                logger.warning(f"Rate limit exhausted; pausing requests for {seconds_left:.1f}s")
+            else:
+                # budget left (ie. a new window): configured rate, no burst beyond what the server still allows
+                self._budget_until = None
+                self._rate = self._base_rate
+                self._tokens = min(self._tokens, remaining)
+
+
+class RateLimiter():
+    # registry of token buckets keyed by endpoint class (and login for pooled tokens)
+
+    def __init__(self, limits: Mapping[str, float] | None = None, clock: Callable[[], float] = time.monotonic) -> None:
+        self._limits = dict(limits or ENDPOINT_LIMITS)
+        self._clock = clock
+        # buckets of the primary token
+        self.buckets: Dict[str, TokenBucket] = {
+            name: TokenBucket(rate, clock=clock) for name, rate in self._limits.items()
+        }
+        # (endpoint class, login) -> bucket, created on first use
+        self._login_buckets: Dict[tuple[str, str], TokenBucket] = {}
+        self._lock = threading.Lock()
+
+    def bucket(self, path: str, login: str | None = None) -> TokenBucket:
+        name = endpoint_class(path)
+        if login is None:
+            return self.buckets[name]
+        key = (name, login)
+        bucket = self._login_buckets.get(key)
+        if bucket is None:
+            with self._lock:
+                bucket = self._login_buckets.setdefault(key, TokenBucket(self._limits[name], clock=self._clock))
+        return bucket
+
+    def acquire(self, path: str, login: str | None = None) -> float:
+        return self.bucket(path, login).acquire()
+
+    async def acquire_async(self, path: str, login: str | None = None) -> float:
+        return await self.bucket(path, login).acquire_async()
+
+    def update_from_headers(self, path: str, headers: Mapping[str, Any] | None, login: str | None = None) -> None:
+        self.bucket(path, login).update_from_headers(headers)
+
+    def stats(self) -> Dict[str, RateLimitStats]:
+        # pooled logins are reported as "<class>:<login>"
+        stats = {name: bucket.stats for name, bucket in self.buckets.items()}
+        stats.update({f"{name}:{login}": bucket.stats for (name, login), bucket in list(self._login_buckets.items())})
+        return stats
+
+
+# shared by every QTradeAPI / AsyncQTradeAPI in the process
+rate_limiter = RateLimiter()
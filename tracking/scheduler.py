@@ -1,33 +1,98 @@
 import asyncio
+import datetime
 import logging
 
 from .api import QTradeAPI
+from .async_api import AsyncQTradeAPI, call_db
+from .market_hours import MarketCalendar
+from utils.env_vars import get_settings
 
 logger = logging.getLogger(__name__)
 
-async def schedule_checks(api_helper: QTradeAPI, delay: int = 300):
+async def schedule_checks(api_helper: QTradeAPI | AsyncQTradeAPI, delay: int = 300):
     # default 5 minute delay between updates
     while True:
         try:
-            await asyncio.to_thread(api_helper.get_all_stocks)
+            if isinstance(api_helper, AsyncQTradeAPI):
+                # network requests run natively on the event loop
+                await api_helper.get_all_stocks()
+            else:
+                await asyncio.to_thread(api_helper.get_all_stocks)
         except Exception:
             logger.exception("Scheduled stock check failed.")
         await asyncio.sleep(delay)
 
 
-async def schedule_alert(api_helper: QTradeAPI, delay: int = 86400):
+async def schedule_market_checks(
+    api_helper: QTradeAPI | AsyncQTradeAPI,
+    calendar: MarketCalendar | None = None,
+    active_delay: float | None = None,
+    closed_delay: float | None = None,
+):
+    # market-hours aware polling: fast cadence while any tracked exchange is in session,
+    # sleeps until the next session (re-checking at least every closed_delay seconds) otherwise
+    settings = get_settings()
+    if calendar is None:
+        calendar = MarketCalendar(settings.market_calendar_path, extended_hours = settings.extended_hours)
+    active_delay = active_delay or settings.poll_interval_active
+    closed_delay = closed_delay or settings.poll_interval_closed
+
+    while True:
+        delay = closed_delay
+        try:
+            exchanges = await call_db(api_helper.tracked_exchanges)
+            now = datetime.datetime.now(datetime.timezone.utc)
+            active = calendar.active_exchanges(exchanges.values(), now)
+            if active:
+                # only tickers whose exchange is open are quoted
+                if isinstance(api_helper, AsyncQTradeAPI):
+                    await api_helper.get_all_stocks(exchanges = active)
+                else:
+                    await asyncio.to_thread(api_helper.get_all_stocks, active)
+                delay = active_delay
+            else:
+                until_open = calendar.seconds_until_active(exchanges.values(), now)
+                if until_open is not None:
+                    delay = min(closed_delay, max(until_open, 1))
+                logger.debug(f"Markets closed; next check in {delay:.0f}s")
+        except Exception:
+            logger.exception("Scheduled stock check failed.")
+        await asyncio.sleep(delay)
+
+
+async def schedule_alert(api_helper: QTradeAPI | AsyncQTradeAPI, delay: int = 86400):
     # default once per day notification
     while True:
         try:
-            await asyncio.to_thread(api_helper.stocks.alert_stocks)
+            # runs on the loop with AsyncStockManager, in a worker thread with StockManager
+            await call_db(api_helper.stocks.alert_stocks)
         except Exception:
             logger.exception("Scheduled alert dispatch failed.")
         await asyncio.sleep(delay)
 
-'''
-TODO:
-usage of to_thread can be avoided by reworking db and network operations 
-using async-friendly packages/extensions
-'''
+async def schedule_outbox(api_helper: QTradeAPI | AsyncQTradeAPI, delay: float | None = None):
+    # retries queued alerts (database/alert_outbox.py) independently of the quote loop
+    if delay is None:
+        delay = get_settings().outbox_interval
+    while True:
+        try:
+            await call_db(api_helper.stocks.drain_alerts)
+        except Exception:
+            logger.exception("Alert outbox drain failed.")
+        await asyncio.sleep(delay)
 
+async def schedule_token_refresh(api_helper: QTradeAPI | AsyncQTradeAPI, margin: int | None = None, retry_delay: int = 30):
+    # renews every pooled access token `margin` seconds before expiry so no request pays for the refresh round trip
+    # (set aside logins are retried here once their wait is over)
+    if margin is None:
+        margin = get_settings().token_refresh_margin
+    refresh_margin = datetime.timedelta(seconds = margin)
 
+    while True:
+        try:
+            await call_db(api_helper.tokens.refresh_if_needed, refresh_margin)
+            delay = await call_db(api_helper.tokens.seconds_until_refresh, refresh_margin)
+        except Exception:
+            logger.exception("Scheduled token refresh failed.")
+            delay = retry_delay
+        await asyncio.sleep(max(delay, 1))
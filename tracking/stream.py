@@ -0,0 +1,206 @@
+import asyncio
+import json
+import logging
+
+from typing import Any, Dict, List, Set
+from urllib.parse import urlsplit
+from websockets.asyncio.client import connect
+from websockets.exceptions import ConnectionClosed, InvalidHandshake, InvalidURI
+from tracking.api import QUOTES_PATH
+from tracking.async_api import AsyncQTradeAPI, call_db
+
+# Purpose: live quote ingestion over Questrade's market-data WebSocket stream
+# - subscribes to every tracked symbolId (REST call returns the stream port)
+# - ticks are coalesced per ticker in memory; only the latest price is kept
+# - latest prices are flushed to StockManager.check_stocks every flush_interval seconds
+# - dropped connections are re-established with exponential backoff
+# - the tracked set is compared with the subscription every resubscribe_interval seconds; stocks added or
+#   removed while streaming (add_tracked_stock, watch_stock, sync_tracked_from_accounts) trigger a resubscribe
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_FLUSH_INTERVAL = 2.0
+INITIAL_BACKOFF = 1.0
+MAX_BACKOFF = 60.0
+RESUBSCRIBE_INTERVAL = 30.0
+
+
+class QuoteStream():
+    def __init__(
+        self,
+        api: AsyncQTradeAPI,
+        flush_interval: float = DEFAULT_FLUSH_INTERVAL,
+        initial_backoff: float = INITIAL_BACKOFF,
+        max_backoff: float = MAX_BACKOFF,
+        resubscribe_interval: float = RESUBSCRIBE_INTERVAL,
+    ) -> None:
+        self.api = api
+        self.flush_interval = flush_interval
+        self.resubscribe_interval = resubscribe_interval
+        self.initial_backoff = initial_backoff
+        self.max_backoff = max_backoff
+        self._backoff = initial_backoff
+
+        self._running = False
+        # latest price per ticker since the last flush
+        self._change_lock = asyncio.Lock()
+        self._latest_changes: Dict[str, float] = {}
+        self._latest_ids: Dict[str, int] = {}
+        # streamed deltas may only carry the symbolId
+        self._tickers_by_id: Dict[int, str] = {}
+        # tracked tickers without a symbol id at the last subscription (not a reason to resubscribe)
+        self._unresolved: Set[str] = set()
+        self._ws = None
+
+    # -----------------------------
+    # subscription
+    # -----------------------------
+    async def _subscribed_ids(self) -> List[int]:
+        tracked = await call_db(self.api.stocks.get_tracked_symbol_ids)
+        missing = [ticker for ticker, sym_id in tracked.items() if sym_id is None]
+        if missing:
+            tracked.update(await self.api.lookup_symbol_ids(missing))
+        self._tickers_by_id = {
+            int(sym_id): ticker for ticker, sym_id in tracked.items() if sym_id is not None
+        }
+        self._unresolved = {ticker for ticker, sym_id in tracked.items() if sym_id is None}
+        return list(self._tickers_by_id)
+
+    async def subscription_changed(self) -> bool:
+        # one query for the tracked tickers; symbol lookups only happen when resubscribing
+        tracked = set(await call_db(self.api.stocks.get_tracked_symbol_ids)) - self._unresolved
+        return tracked != set(self._tickers_by_id.values())
+
+    async def _stream_url(self, ids: List[int]) -> str:
+        # REST call that opens a streaming session and returns the port to connect to
+        # the port belongs to the login that asked for it, so it is requested on the primary login the websocket authenticates with
+        data = await self.api._request(QUOTES_PATH, {
+            'ids': ",".join(map(str, ids)),
+            'stream': 'true',
+            'mode': 'WebSocket',
+        }, primary = True)
+        port = data['streamPort']
+        parts = urlsplit(await self.api._api_base_url())
+        scheme = 'wss' if parts.scheme == 'https' else 'ws'
+        return f"{scheme}://{parts.hostname}:{port}/"
+
+    async def resubscribe(self) -> None:
+        # closes the current connection; listen() reconnects with the current set of tracked stocks
+        if self._ws is not None:
+            await self._ws.close()
+
+    async def watch_subscription(self) -> None:
+        while self._running:
+            await asyncio.sleep(self.resubscribe_interval)
+            if self._ws is None:
+                # (re)connecting already subscribes to the current set
+                continue
+            try:
+                if await self.subscription_changed():
+                    logger.info("Tracked stocks changed; resubscribing quote stream")
+                    await self.resubscribe()
+            except Exception:
+                logger.exception("Checking the quote stream subscription failed.")
+
+    # -----------------------------
+    # ingestion
+    # -----------------------------
+    async def _ingest(self, message: str | bytes) -> None:
+        data: Dict[str, Any] = json.loads(message)
+        if 'code' in data:
+            # Questrade error payload: drop the connection and reconnect
+            raise RuntimeError(f"Stream error {data.get('code')}: {data.get('message')}")
+
+        quotes = data.get('quotes')
+        if not quotes:
+            # authentication acknowledgement / heartbeat
+            return
+
+        async with self._change_lock:
+            for quote in quotes:
+                sym_id = quote.get('symbolId')
+                ticker = quote.get('symbol') or self._tickers_by_id.get(sym_id)
+                price = self.api._quote_price(quote)
+                if ticker is None or price is None:
+                    continue
+                # coalesce: only the most recent tick per ticker is kept
+                self._latest_changes[ticker] = price
+                if sym_id is not None:
+                    self._latest_ids[ticker] = int(sym_id)
+
+    async def _connect_and_listen(self) -> None:
+        ids = await self._subscribed_ids()
+        if not ids:
+            logger.info("No tracked stocks to stream; retrying later")
+            await asyncio.sleep(self.max_backoff)
+            return
+
+        url = await self._stream_url(ids)
+        access_token = await call_db(self.api.token.get_access_token)
+        async with connect(url) as ws:
+            self._ws = ws
+            try:
+                # first message authenticates the stream
+                await ws.send(access_token)
+                logger.info(f"Streaming quotes for {len(ids)} symbols")
+                async for message in ws:
+                    await self._ingest(message)
+                    # healthy connection: reset backoff
+                    self._backoff = self.initial_backoff
+            finally:
+                self._ws = None
+
+    async def listen(self) -> None:
+        self._backoff = self.initial_backoff
+        while self._running:
+            try:
+                await self._connect_and_listen()
+            except asyncio.CancelledError:
+                raise
+            except (ConnectionClosed, InvalidHandshake, InvalidURI, OSError, RuntimeError, ValueError) as e:
+                logger.warning(f"Quote stream disconnected: {e!r}")
+
+            if not self._running:
+                break
+            logger.info(f"Reconnecting quote stream in {self._backoff:.1f}s")
+            await asyncio.sleep(self._backoff)
+            self._backoff = min(self._backoff * 2, self.max_backoff)
+
+    # -----------------------------
+    # flushing to the stop-loss engine
+    # -----------------------------
+    async def flush(self) -> List[str]:
+        # process changes and save in shallow copy to free resource
+        async with self._change_lock:
+            latest_changes = self._latest_changes
+            latest_ids = self._latest_ids
+            self._latest_changes = {}
+            self._latest_ids = {}
+
+        if not latest_changes:
+            return []
+        return await call_db(self.api.stocks.check_stocks, latest_changes, latest_ids)
+
+    async def update_stock_data(self) -> None:
+        while self._running:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception("Flushing streamed quotes failed.")
+
+    async def run(self) -> None:
+        self._running = True
+        # sleeps much longer than a flush: cancelled rather than waited for on stop
+        watcher = asyncio.create_task(self.watch_subscription())
+        try:
+            await asyncio.gather(self.listen(), self.update_stock_data())
+        finally:
+            self._running = False
+            watcher.cancel()
+            # do not lose the last coalesced ticks
+            await self.flush()
+
+    async def stop(self) -> None:
+        self._running = False
+        await self.resubscribe()
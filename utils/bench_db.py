@@ -0,0 +1,61 @@
+# Purpose: compare per-cycle commit latency of the default and tuned SQLite engine profiles
+# usage: python -m utils.bench_db [--stocks 200] [--cycles 200]
+# each cycle writes a fresh price for every tracked stock in one transaction (same shape as a quote flush)
+
+import argparse
+import random
+import statistics
+import tempfile
+import time
+
+from pathlib import Path
+from sqlalchemy import update
+from sqlalchemy.orm import sessionmaker
+from database.db import EngineProfile, create_db_engine, session_manager
+from database.models import Base, Stock
+
+
+def run(profile: EngineProfile, stocks: int, cycles: int) -> list[float]:
+    engine = create_db_engine(profile)
+    Base.metadata.create_all(engine)
+    SessionLocal = sessionmaker(bind = engine, expire_on_commit = False)
+
+    tickers = [f"T{i:04d}" for i in range(stocks)]
+    with session_manager(SessionLocal) as session:
+        session.add_all(
+            Stock(ticker = t, current_value = 100, peak_value = 100, stop_loss_value = 90, currency = 'USD')
+            for t in tickers
+        )
+
+    latencies = []
+    for _ in range(cycles):
+        rows = [{'ticker': t, 'current_value': random.uniform(90, 110)} for t in tickers]
+        start = time.perf_counter()
+        with session_manager(SessionLocal) as session:
+            session.execute(update(Stock), rows)
+        latencies.append(time.perf_counter() - start)
+
+    engine.dispose()
+    return latencies
+
+
+def report(name: str, latencies: list[float]) -> None:
+    ms = sorted(x * 1000 for x in latencies)
+    p95 = ms[int(len(ms) * 0.95) - 1]
+    print(f"{name:<8} mean {statistics.mean(ms):7.2f} ms   median {statistics.median(ms):7.2f} ms   p95 {p95:7.2f} ms")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description = 'SQLite commit latency: default vs tuned engine profile')
+    parser.add_argument('--stocks', type = int, default = 200)
+    parser.add_argument('--cycles', type = int, default = 200)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, tuned in (('default', False), ('tuned', True)):
+            url = f"sqlite:///{Path(tmp) / f'{name}.db'}"
+            report(name, run(EngineProfile(url = url, tuned = tuned), args.stocks, args.cycles))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,5 +1,6 @@
 import os
-from dataclasses import dataclass
+from dataclasses import dataclass, field
+from typing import Dict
 from functools import lru_cache
 
 from dotenv import find_dotenv, load_dotenv
@@ -35,6 +36,145 @@ def _parse_stop_loss(value: str | None) -> float:
     return ratio
 
 
+def _parse_refresh_margin(value: str | None) -> int:
+    # seconds before expiry at which the access token is renewed in the background
+    if value is None:
+        return 120
+
+    try:
+        margin = int(value)
+    except ValueError as exc:
+        raise RuntimeError("TOKEN_REFRESH_MARGIN must be a whole number of seconds.") from exc
+
+    # Questrade access tokens last 30 minutes
+    if not 0 <= margin <= 1200:
+        raise RuntimeError("TOKEN_REFRESH_MARGIN must be between 0 and 1200 seconds.")
+
+    return margin
+
+
+def _parse_logins(value: str | None) -> Dict[str, str]:
+    # login:refresh_token pairs separated by commas; seeds the extra tokens pooled for market data
+    logins: Dict[str, str] = {}
+    if value is None:
+        return logins
+
+    for entry in value.split(","):
+        login, sep, token = entry.partition(":")
+        login, token = login.strip(), token.strip()
+        if not sep or not login or not token:
+            raise RuntimeError("QUESTRADE_LOGINS must be a comma separated list of login:refresh_token pairs.")
+        logins[login] = token
+
+    return logins
+
+
+QUOTE_MODES = ("stream", "poll", "market")
+
+
+def _parse_quote_mode(value: str | None) -> str:
+    # poll (default): REST polling every few minutes; stream: live WebSocket quotes (opt in)
+    # market: REST polling paced by exchange sessions (fast while open, asleep while closed)
+    if value is None:
+        return "poll"
+
+    mode = value.lower()
+    if mode not in QUOTE_MODES:
+        raise RuntimeError(f"QUOTE_MODE must be one of: {', '.join(QUOTE_MODES)}.")
+
+    return mode
+
+
+ALERT_MODES = ("immediate", "digest", "daily")
+
+
+def _parse_alert_mode(value: str | None) -> str:
+    # immediate: breaches are sent within seconds; digest: breaches within ALERT_DIGEST_WINDOW are sent together
+    # daily: accumulated breaches are sent once a day
+    if value is None:
+        return "immediate"
+
+    mode = value.lower()
+    if mode not in ALERT_MODES:
+        raise RuntimeError(f"ALERT_MODE must be one of: {', '.join(ALERT_MODES)}.")
+
+    return mode
+
+
+def _parse_positive_float(name: str, value: str | None, default: float) -> float:
+    if value is None:
+        return default
+
+    try:
+        number = float(value)
+    except ValueError as exc:
+        raise RuntimeError(f"{name} must be a number.") from exc
+
+    if number <= 0:
+        raise RuntimeError(f"{name} must be greater than 0.")
+
+    return number
+
+
+def _parse_non_negative_float(name: str, value: str | None, default: float) -> float:
+    if value is None:
+        return default
+
+    try:
+        number = float(value)
+    except ValueError as exc:
+        raise RuntimeError(f"{name} must be a number.") from exc
+
+    if number < 0:
+        raise RuntimeError(f"{name} must be 0 or greater.")
+
+    return number
+
+
+def _parse_non_negative_int(name: str, value: str | None, default: int) -> int:
+    if value is None:
+        return default
+
+    try:
+        number = int(value)
+    except ValueError as exc:
+        raise RuntimeError(f"{name} must be a whole number.") from exc
+
+    if number < 0:
+        raise RuntimeError(f"{name} must be 0 or greater.")
+
+    return number
+
+
+DB_PROFILES = ("tuned", "default")
+
+
+def _parse_db_profile(value: str | None) -> str:
+    # tuned: WAL journal, synchronous=NORMAL, mmap/cache/busy_timeout pragmas
+    # default: SQLite's stock rollback journal with no pragmas
+    if value is None:
+        return "tuned"
+
+    profile = value.lower()
+    if profile not in DB_PROFILES:
+        raise RuntimeError(f"DB_PROFILE must be one of: {', '.join(DB_PROFILES)}.")
+
+    return profile
+
+
+def _parse_bool(name: str, value: str | None, default: bool) -> bool:
+    if value is None:
+        return default
+
+    lowered = value.lower()
+    if lowered in ("1", "true", "yes", "on"):
+        return True
+    if lowered in ("0", "false", "no", "off"):
+        return False
+
+    raise RuntimeError(f"{name} must be true or false.")
+
+
 @dataclass(frozen=True)
 class Settings:
     refresh_token: str | None
@@ -48,6 +188,33 @@ class Settings:
     user_email: str | None
     ntfy_channel: str | None
     discord_webhook_url: str | None
+    token_refresh_margin: int = 120
+    quote_mode: str = "poll"
+    stream_flush_interval: float = 2.0
+    market_calendar_path: str | None = None
+    extended_hours: bool = True
+    poll_interval_active: float = 60.0
+    poll_interval_closed: float = 1800.0
+    database_url: str = "sqlite:///bot.db"
+    db_profile: str = "tuned"
+    sql_echo: bool = False
+    db_pool_size: int = 5
+    db_busy_timeout: int = 5000
+    db_mmap_size: int = 268435456
+    db_cache_size: int = 20000
+    price_history: bool = True
+    price_history_dir: str = "price_history"
+    outbox_interval: float = 30.0
+    outbox_backoff_base: float = 30.0
+    outbox_backoff_max: float = 3600.0
+    outbox_max_attempts: int = 10
+    alert_mode: str = "immediate"
+    alert_digest_window: float = 60.0
+    ntfy_base_url: str = "https://ntfy.sh"
+    questrade_logins: Dict[str, str] = field(default_factory = dict)
+    token_revoked_retry: float = 900.0
+    quote_cache_ttl: float = 5.0
+    quote_cache_max_bytes: int = 4194304
 
     @property
     def email_to_notify(self) -> str | None:
@@ -97,6 +264,33 @@ def get_settings() -> Settings:
         user_email=_get("USER_EMAIL"),
         ntfy_channel=_get("NTFY_CHANNEL"),
         discord_webhook_url=_get("WEB_HOOK_URL"),
+        token_refresh_margin=_parse_refresh_margin(_get("TOKEN_REFRESH_MARGIN")),
+        quote_mode=_parse_quote_mode(_get("QUOTE_MODE")),
+        stream_flush_interval=_parse_positive_float("STREAM_FLUSH_INTERVAL", _get("STREAM_FLUSH_INTERVAL"), 2.0),
+        market_calendar_path=_get("MARKET_CALENDAR"),
+        extended_hours=_parse_bool("EXTENDED_HOURS", _get("EXTENDED_HOURS"), True),
+        poll_interval_active=_parse_positive_float("POLL_INTERVAL_ACTIVE", _get("POLL_INTERVAL_ACTIVE"), 60.0),
+        poll_interval_closed=_parse_positive_float("POLL_INTERVAL_CLOSED", _get("POLL_INTERVAL_CLOSED"), 1800.0),
+        database_url=_get("DATABASE_URL") or "sqlite:///bot.db",
+        db_profile=_parse_db_profile(_get("DB_PROFILE")),
+        sql_echo=_parse_bool("SQL_ECHO", _get("SQL_ECHO"), False),
+        db_pool_size=_parse_non_negative_int("DB_POOL_SIZE", _get("DB_POOL_SIZE"), 5),
+        db_busy_timeout=_parse_non_negative_int("DB_BUSY_TIMEOUT", _get("DB_BUSY_TIMEOUT"), 5000),
+        db_mmap_size=_parse_non_negative_int("DB_MMAP_SIZE", _get("DB_MMAP_SIZE"), 268435456),
+        db_cache_size=_parse_non_negative_int("DB_CACHE_SIZE", _get("DB_CACHE_SIZE"), 20000),
+        price_history=_parse_bool("PRICE_HISTORY", _get("PRICE_HISTORY"), True),
+        price_history_dir=_get("PRICE_HISTORY_DIR") or "price_history",
+        outbox_interval=_parse_positive_float("OUTBOX_INTERVAL", _get("OUTBOX_INTERVAL"), 30.0),
+        outbox_backoff_base=_parse_positive_float("OUTBOX_BACKOFF_BASE", _get("OUTBOX_BACKOFF_BASE"), 30.0),
+        outbox_backoff_max=_parse_positive_float("OUTBOX_BACKOFF_MAX", _get("OUTBOX_BACKOFF_MAX"), 3600.0),
+        outbox_max_attempts=_parse_non_negative_int("OUTBOX_MAX_ATTEMPTS", _get("OUTBOX_MAX_ATTEMPTS"), 10),
+        alert_mode=_parse_alert_mode(_get("ALERT_MODE")),
+        alert_digest_window=_parse_positive_float("ALERT_DIGEST_WINDOW", _get("ALERT_DIGEST_WINDOW"), 60.0),
+        ntfy_base_url=_get("NTFY_BASE_URL") or "https://ntfy.sh",
+        questrade_logins=_parse_logins(_get("QUESTRADE_LOGINS")),
+        token_revoked_retry=_parse_positive_float("TOKEN_REVOKED_RETRY", _get("TOKEN_REVOKED_RETRY"), 900.0),
+        quote_cache_ttl=_parse_non_negative_float("QUOTE_CACHE_TTL", _get("QUOTE_CACHE_TTL"), 5.0),
+        quote_cache_max_bytes=_parse_non_negative_int("QUOTE_CACHE_MAX_BYTES", _get("QUOTE_CACHE_MAX_BYTES"), 4194304),
     )
 
 